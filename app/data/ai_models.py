@@ -1,6 +1,6 @@
 from typing import Optional, List
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, RootModel
 
 
 class AnalysisRequest(BaseModel):
@@ -18,4 +18,13 @@ class StateResponse(BaseModel):
     message: str
 
 class AIMessageResponse(BaseModel):
-    message : str
\ No newline at end of file
+    message : str
+
+
+class CategorizedTransaction(BaseModel):
+    row: int
+    category_id: int
+
+
+class CategorizedTransactions(RootModel[List[CategorizedTransaction]]):
+    pass
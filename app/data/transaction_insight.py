@@ -45,6 +45,14 @@ class TransactionBeneficiary(BaseModel):
     name : str
     is_self : bool
 
+class NumberedTransactionBeneficiary(BaseModel):
+    row: int
+    name: str
+    is_self: bool
+
+class TransactionBeneficiaries(RootModel[List[NumberedTransactionBeneficiary]]):
+    pass
+
 class TransactionBeneficial(BaseModel):
     name: str
     amount: float
\ No newline at end of file
@@ -1,6 +1,7 @@
 from enum import Enum
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Column, String, Integer, Boolean, Float,DateTime, func,Enum as SqlEnum, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, Float,DateTime, func,Enum as SqlEnum, ForeignKey, \
+    UniqueConstraint
 from app.database.index import Base
 from app.models.user import User
 
@@ -66,6 +67,37 @@ class Category(Base):
     def __repr__(self):
         return f"<Category(id={self.id}, name='{self.name}')>"  
 
+class CategoryRule(Base):
+    __tablename__ = "category_rules"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    pattern = Column(String(255), nullable=False)  # A keyword or phrase, or a regular expression
+    match_type = Column(String(20), nullable=False, default="keyword")  # 'keyword' or 'regex'
+    transaction_type = Column(String(20), nullable=True)  # 'debit', 'credit' or None for both
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    priority = Column(Integer, nullable=False, default=0)  # The highest priority wins when several rules match
+    active = Column(Boolean, nullable=False, default=True)
+    hits = Column(Integer, nullable=False, default=0)  # Transactions categorized by this rule
+    category = relationship("Category", foreign_keys=[category_id])
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<CategoryRule(id={self.id}, pattern='{self.pattern}', category_id={self.category_id})>"
+
+class CategoryEmbedding(Base):
+    __tablename__ = "category_embeddings"
+    __table_args__ = (UniqueConstraint("narration", "transaction_type", "category_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    narration = Column(String(255), nullable=False)  # Normalized narration, see normalize_category_narration
+    transaction_type = Column(String(20), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    votes = Column(Integer, nullable=False, default=1)  # Labelled transactions behind this narration and category
+    embedding = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
 #help me with a transaction model with a relationship to the account model
 class Transaction(Base):
     __tablename__ = "transactions"
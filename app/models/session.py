@@ -1,6 +1,7 @@
 from enum import Enum
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Column, String, Integer, Boolean, Float, DateTime, func, Enum as SqlEnum, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, Float, DateTime, Date, func, Enum as SqlEnum, ForeignKey, \
+    JSON, Index, UniqueConstraint
 from app.database.index import Base
 from app.models.account import FetchMethod
 
@@ -52,6 +53,8 @@ class SessionAccount(Base):
 
 class SessionTransaction(Base):
     __tablename__ = 'session_transactions'
+    # Session reads filter by account, the largest transfers come straight off the amount order
+    __table_args__ = (Index("ix_session_transactions_account_id_amount", "account_id", "amount"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     account_id = Column(Integer, ForeignKey("session_accounts.id"), nullable=False)
@@ -163,3 +166,57 @@ class SessionBeneficiary(Base):
 
 Session.session_beneficiaries = relationship("SessionBeneficiary", back_populates="session")
 SessionBeneficiary.session = relationship("Session", back_populates="session_beneficiaries")
+
+
+class SessionRollup(Base):
+    """
+    Transaction totals of a processed session per day, week (starting Monday) or month, category and direction.
+    """
+    __tablename__ = 'session_rollups'
+    __table_args__ = (UniqueConstraint("session_id", "period", "period_start", "category_id", "direction"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False, index=True)
+    period = Column(String(10), nullable=False)  # 'day', 'week' or 'month'
+    period_start = Column(Date, nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    direction = Column(String(10), nullable=False)  # 'credit' or 'debit'
+    total_amount = Column(Float, nullable=False)
+    transaction_count = Column(Integer, nullable=False)
+    category = relationship("Category", foreign_keys=[category_id])
+
+
+class SessionSummary(Base):
+    """
+    Financial position metrics of a processed session, computed once at the end of ingestion.
+    """
+    __tablename__ = 'session_summaries'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False, unique=True)
+    transaction_count = Column(Integer, nullable=False)
+    inflow = Column(Float, nullable=False)
+    outflow = Column(Float, nullable=False)
+    savings = Column(Float, nullable=False)
+    closing_balance = Column(Float, nullable=False)
+    spending_ratio = Column(Float, nullable=False)
+    savings_ratio = Column(Float, nullable=False)
+    budget_conscious = Column(Float, nullable=False)
+    liquidity_risk = Column(Float, nullable=False)
+    concentration_risk = Column(Float, nullable=False)
+    expense_risk = Column(Float, nullable=False)
+    volatility_risk = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+
+class StatementLayout(Base):
+    __tablename__ = 'statement_layouts'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fingerprint = Column(String(64), nullable=False, unique=True, index=True)
+    bank_id = Column(Integer, ForeignKey("banks.id"), nullable=True)
+    columns = Column(JSON, nullable=True)  # Column name to table index, e.g. {"date": 0, "narration": 2}
+    source = Column(String(20), nullable=False, default='learned')  # 'learned' from an LLM extraction or 'manual'
+    hits = Column(Integer, nullable=False, default=0)
+    bank = relationship("Bank", foreign_keys=[bank_id])
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
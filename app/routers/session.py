@@ -21,6 +21,7 @@ from app.workers.session_tasks import analyze_transactions, analyze_payments
 from app.services.session_service import SessionService
 from app.services.session_transaction_service import SessionTransactionService
 from app.services.transaction_service import TransactionService  # Adjust import paths as needed
+from app.util.response_cache import cached_session_response
 
 router = APIRouter(
     prefix="/api/session",
@@ -102,8 +103,8 @@ async def session(session_id: str, db: Session = Depends(get_db), response_model
 async def insights(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionService(db=db)
-        insights = service.get_insights(session_id)
-        return insights
+        return await cached_session_response(session_id, "insights", lambda: service.get_insights(session_id),
+                                             list[SessionInsightOut])
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -115,7 +116,8 @@ async def insights(session_id: str, db: Session = Depends(get_db)):
 async def swot(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionService(db=db)
-        return service.get_swot(session_id)
+        return await cached_session_response(session_id, "swot", lambda: service.get_swot(session_id),
+                                             list[SessionSwotOut])
 
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -128,7 +130,9 @@ async def swot(session_id: str, db: Session = Depends(get_db)):
 async def spending_profile(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionTransactionService(db=db)
-        return service.calculate_financial_position(session_id)
+        return await cached_session_response(session_id, "financial-position",
+                                             lambda: service.calculate_financial_position(session_id),
+                                             FinancialProfileDataIn)
 
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -142,7 +146,9 @@ async def spending_profile(session_id: str, db: Session = Depends(get_db)):
 async def savings_potential(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionService(db=db)
-        return service.get_savings_potentials(session_id)
+        return await cached_session_response(session_id, "savings-potential",
+                                             lambda: service.get_savings_potentials(session_id),
+                                             List[SessionSavingsPotentialOut])
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -167,7 +173,8 @@ async def regenerate(session_id: str, db: Session = Depends(get_db)):
 async def weekly_income_report(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionTransactionService(db=db)
-        return service.calculate_weekly_trend(session_id)
+        return await cached_session_response(session_id, "weekly-trend",
+                                             lambda: service.calculate_weekly_trend(session_id), WeeklyTrend)
     except ValueError as e:
         traceback.print_exc()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -181,7 +188,9 @@ async def weekly_income_report(session_id: str, db: Session = Depends(get_db)):
 async def beneficiaries(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionTransactionService(db=db)
-        return service.get_beneficiaries(session_id)
+        return await cached_session_response(session_id, "beneficiaries",
+                                             lambda: service.get_beneficiaries(session_id),
+                                             list[SessionBeneficiaryOut])
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -193,7 +202,8 @@ async def beneficiaries(session_id: str, db: Session = Depends(get_db)):
 async def transfers(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionTransactionService(db=db)
-        return service.get_transfers(session_id)
+        return await cached_session_response(session_id, "transfers", lambda: service.get_transfers(session_id),
+                                             list[SessionTransactionOut])
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -205,7 +215,8 @@ async def transfers(session_id: str, db: Session = Depends(get_db)):
 async def recurring_expenses(session_id: str, db: Session = Depends(get_db)):
     try:
         service = SessionAdviceService(db_session=db)
-        return service.get_recurring_expenses(session_id)
+        return await cached_session_response(session_id, "recurring-expenses",
+                                             lambda: service.get_recurring_expenses(session_id))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
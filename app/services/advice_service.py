@@ -1,17 +1,13 @@
 from datetime import timedelta, datetime
 from typing import Optional, List
 
-from chromadb.utils import embedding_functions
-from langchain_openai import OpenAIEmbeddings
 from langchain.chains.llm import LLMChain
 from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain_community.vectorstores import Chroma
 from requests import Session
-from langchain_openai import ChatOpenAI
 import re
 from langchain.memory import ConversationBufferMemory
 from langchain_postgres import PGVector
-from langchain_openai import OpenAIEmbeddings
 from langchain.prompts.prompt import PromptTemplate
 from sqlalchemy import text
 from langchain.agents import initialize_agent, Tool
@@ -26,6 +22,7 @@ from dotenv import load_dotenv
 
 from app.services.transaction_service import TransactionService
 from app.util.chroma_db import get_chroma_db
+from app.util.llm_gateway import chat_model, embedding_function, embeddings, PRIORITY_INTERACTIVE
 
 load_dotenv(override=True)
 
@@ -41,7 +38,7 @@ class AdviceService:
         self.user = None
         self.transaction_service = TransactionService(db_session=db_session)
         self.N = 10
-        self.llm = ChatOpenAI(api_key=self.ai_key, temperature=0, model="gpt-4o-mini")
+        self.llm = chat_model(model="gpt-4o-mini", temperature=0, priority=PRIORITY_INTERACTIVE)
 
     def process(self, user: UserOut, question: str) -> str:
 
@@ -76,10 +73,7 @@ class AdviceService:
             return "Something went wrong"
 
     def get_collection(self):
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.ai_key,
-            model_name="text-embedding-3-small"
-        )
+        openai_ef = embedding_function(model="text-embedding-3-small", priority=PRIORITY_INTERACTIVE)
         collection = self.chroma_client.get_or_create_collection(name="chat_engine", embedding_function=openai_ef)
         return collection
 
@@ -131,10 +125,7 @@ class AdviceService:
                                                                           end_date=end_date, limit=10000)
             self.index_documents(user_transactions, self.user)
 
-        openai_ef = OpenAIEmbeddings(
-            api_key=self.ai_key,
-            model="text-embedding-3-small"
-        )
+        openai_ef = embeddings(model="text-embedding-3-small", priority=PRIORITY_INTERACTIVE)
         vectorstore = Chroma(
             client=self.chroma_client,
             collection_name="chat_engine",
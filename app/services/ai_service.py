@@ -1,19 +1,22 @@
+import asyncio
 import json
 from random import random
 import string
+from typing import Optional
 
 from langchain.memory import ConversationBufferMemory
 from langchain_community.chat_message_histories import RedisChatMessageHistory
-from langchain_openai import ChatOpenAI
 from sqlalchemy.orm import Session
 
-from app.data.ai_models import AIMessageResponse, StateResponse
+from app.data.ai_models import AIMessageResponse, StateResponse, CategorizedTransactions
 from app.data.user import UserCreate
 from app.models.account import Category, Transaction
 from langchain.prompts import PromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser  # Add this import
 from langchain.chains import LLMChain
-from openai import OpenAI
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import ValidationError
 import os
 from dotenv import load_dotenv
 
@@ -21,6 +24,9 @@ from app.models.session import SessionTransaction
 from app.models.user import User
 from app.services.auth_service import AuthService
 from app.services.cache_service import get_cache, set_cache
+from app.util.category_cache import CategoryCache, normalize_category_narration
+from app.util.llm_gateway import chat_model, openai_client, PRIORITY_INTERACTIVE, \
+    PRIORITY_BACKGROUND, call_with_retry, estimate_tokens
 
 load_dotenv(override=True)
 
@@ -30,11 +36,17 @@ class AIService:
         self.open_ai_api_key = os.getenv('CHAT_GPT_KEY')  # Replace with your actual OpenAI API key
         self.db_session = db_session
         self.redis = os.getenv('REDIS_URL')
-        self.openai_client = OpenAI(api_key=os.getenv('CHAT_GPT_KEY'))
+        self.openai_client = openai_client()
         # self.advice_service = AdviceService(
         #     db_session=db_session)  # Assuming you have an AdviceService to handle advice-related operations
         self.auth_service = AuthService(
             db_session=db_session)  # Assuming you have an AuthService to handle user-related operations
+        self.category_batch_size = int(os.getenv("CATEGORY_BATCH_SIZE", "100"))
+        self.category_batch_retries = int(os.getenv("CATEGORY_BATCH_RETRIES", "2"))
+        self.category_cache_ttl = int(os.getenv("CATEGORY_CACHE_TTL", str(60 * 60 * 24 * 30)))
+        self.category_concurrency = int(os.getenv("CATEGORY_LLM_CONCURRENCY", "8"))
+        self.category_max_retries = int(os.getenv("CATEGORY_LLM_MAX_RETRIES", "3"))
+        self.category_retry_delay = float(os.getenv("CATEGORY_LLM_RETRY_DELAY", "1"))
 
     async def process(self, ownerid: str, body: str) -> AIMessageResponse:
         state = await self.initialize_state(ownerid, message=body)
@@ -61,10 +73,11 @@ class AIService:
         :param text: The text to generate an embedding for.
         :return: The embedding as a list.
         """
-        res = self.openai_client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
+        res = call_with_retry("text-embedding-ada-002", estimate_tokens(text), PRIORITY_BACKGROUND,
+                              lambda: self.openai_client.embeddings.create(
+                                  input=text,
+                                  model="text-embedding-ada-002"
+                              ))
         return res.data[0].embedding
 
     def generate_unique_id(self, prefix, length=6):
@@ -258,7 +271,7 @@ class AIService:
             return only JSON in this exact format
             {format_instructions}
         """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, openai_api_key=self.open_ai_api_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000, priority=PRIORITY_INTERACTIVE)
         chain = LLMChain(llm=llm, prompt=prompt_template)
         response = chain.run({"user_input": message})
         response_data = output_parser.parse(response)
@@ -296,7 +309,7 @@ class AIService:
                      
                     Now rewrite the message idea into the final user-facing message:
         """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, openai_api_key=self.open_ai_api_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000, priority=PRIORITY_INTERACTIVE)
         chain = LLMChain(llm=llm, prompt=prompt_template)
         response = chain.run({
             "context": context,
@@ -323,7 +336,7 @@ class AIService:
         Given the narration: "{narration}" and the Transaction Type {txn_type}, return ONLY the category ID (a number) that best matches it.
         Do not explain. Just return the ID.
         """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, openai_api_key=self.open_ai_api_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template)
         narration = transaction.description
         response = chain.run({
@@ -364,7 +377,7 @@ class AIService:
                 Do not explain. Just return the ID.
                 
         """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, openai_api_key=self.open_ai_api_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template)
         narration = transaction.description
         response = chain.run({
@@ -376,6 +389,143 @@ class AIService:
         category_id = int(response.strip())
         return category_id
 
+    async def categorize_transactions_batch(self, transactions: list[SessionTransaction | Transaction],
+                                            categories: list[Category]) -> dict[int, int]:
+        """
+        Categorize transactions from the shared narration cache first and ask the LLM only about the
+        narrations nobody has seen under the current category table, once per distinct narration.
+        :return: Category ID by transaction ID.
+        """
+        category_ids = {cat.id for cat in categories}
+        cache = CategoryCache(categories, ttl_seconds=self.category_cache_ttl)
+        keys = {transaction.id: cache.key(normalize_category_narration(transaction.description),
+                                          transaction.transaction_type) for transaction in transactions}
+        cached = cache.get_many(list({key for key in keys.values() if key}))
+
+        categorized: dict[int, int] = {}
+        representatives: dict[str, SessionTransaction | Transaction] = {}
+        pending = []
+        for transaction in transactions:
+            key = keys[transaction.id]
+            if cached.get(key) in category_ids:
+                categorized[transaction.id] = cached[key]
+            elif key is None:
+                pending.append(transaction)
+            elif key not in representatives:
+                representatives[key] = transaction
+                pending.append(transaction)
+
+        from_cache = len(categorized)
+        answered = await self.request_transaction_categories(pending, categories) if pending else {}
+        for transaction in transactions:
+            if transaction.id in categorized:
+                continue
+            key = keys[transaction.id]
+            representative = representatives.get(key, transaction) if key else transaction
+            if representative.id in answered:
+                categorized[transaction.id] = answered[representative.id]
+        cache.set_many({key: answered[transaction.id] for key, transaction in representatives.items()
+                        if transaction.id in answered})
+
+        print(f"Category cache: {from_cache} of {len(transactions)} transactions from the cache, "
+              f"{len(pending)} distinct narrations sent to the LLM. Overall {cache.stats()}")
+        return categorized
+
+    async def request_transaction_categories(self, transactions: list[SessionTransaction | Transaction],
+                                             categories: list[Category]) -> dict[int, int]:
+        """
+        Categorize transactions with one prompt per batch of numbered narrations instead of one per transaction,
+        so the category list is sent once per batch. Batches are sent concurrently, at most
+        CATEGORY_LLM_CONCURRENCY at a time. Rows answered with a missing or unknown category ID are retried in
+        smaller batches; the ones still unresolved after that are left out of the result.
+        :return: Category ID by transaction ID.
+        """
+        category_ids = {cat.id for cat in categories}
+        category_context = "\n".join([
+            f"[{cat.id}] {cat.name}: {cat.description}" for cat in categories])
+
+        parser = PydanticOutputParser(pydantic_object=CategorizedTransactions)
+        prompt_template = PromptTemplate(
+            input_variables=["category_context", "transactions"],
+            partial_variables={"format_instructions": parser.get_format_instructions()},
+            template="""
+                You are a financial assistant classifying Nigerian bank transactions.
+                Below are possible categories with their ID and descriptions:
+                {category_context}
+
+                Rules:
+
+                Always prioritize the transaction purpose or narration keywords (e.g., "inverter", "school fees", "POS withdrawal", "donation", "fuel") over names of businesses, churches, or NGOs.
+
+                Do not classify religious, educational, NGO, or business names (e.g., “Bethel”, “Redeemed”, “Catholic”, “Foundation”, “Business Concern”, “Enterprise”, “Ltd”, “Tech”) as betting.
+
+                Only classify as Betting/Gambling if the narration explicitly matches known gambling/betting platforms (e.g., “Bet9ja”, “SportyBet”, “Nairabet”, “MSport”, “1xBet”, “Lotto”).
+
+                If narration includes both a business/merchant name and a purchase item (e.g., “inverter”), classify according to the purchase item, not the name.
+
+                If uncertain, fall back to the most general valid category (e.g., “Transfer”, “Other Expenses”).
+
+                Each line below is a numbered transaction in the form "<row>. <narration> | <transaction type>":
+                {transactions}
+
+                Return one object per row with the row number and the category ID that best matches it.
+                Do not explain.
+                {format_instructions}
+        """)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=4000)
+        chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
+        semaphore = asyncio.Semaphore(max(1, self.category_concurrency))
+
+        categorized: dict[int, int] = {}
+        pending = list(transactions)
+        batch_size = max(1, self.category_batch_size)
+        for attempt in range(self.category_batch_retries + 1):
+            failed = []
+            batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+            results = await asyncio.gather(*(self.request_category_batch(chain, category_context, batch, semaphore)
+                                             for batch in batches))
+            for batch, answers in zip(batches, results):
+                if answers is None:
+                    # The request itself failed after the gateway's retries, asking again will not help
+                    continue
+                for row, transaction in enumerate(batch, start=1):
+                    category_id = answers.get(row)
+                    if category_id in category_ids:
+                        categorized[transaction.id] = category_id
+                    else:
+                        failed.append(transaction)
+            if not failed:
+                break
+            print(f"Re-queueing {len(failed)} transactions without a valid category, attempt {attempt + 1}")
+            pending = failed
+            batch_size = max(1, batch_size // 2)
+        return categorized
+
+    async def request_category_batch(self, chain: LLMChain, category_context: str,
+                                     batch: list[SessionTransaction | Transaction],
+                                     semaphore: asyncio.Semaphore) -> Optional[dict[int, int]]:
+        """
+        Send one batch of numbered narrations, retrying with exponential backoff when the answer cannot be parsed.
+        Rate limits and transient API errors are already retried by the LLM gateway.
+        :return: Category ID by row number, empty when no answer could be parsed, None when the request failed.
+        """
+        rows = "\n".join(
+            f"{row}. {' '.join((transaction.description or '').split())} | {transaction.transaction_type}"
+            for row, transaction in enumerate(batch, start=1))
+        async with semaphore:
+            for attempt in range(self.category_max_retries + 1):
+                try:
+                    response = await chain.ainvoke({"category_context": category_context, "transactions": rows})
+                    return {item.row: item.category_id for item in response["text"].root}
+                except (OutputParserException, ValidationError) as e:
+                    print(f"Unparsable categories for a batch of {len(batch)} transactions, attempt {attempt + 1}: {e}")
+                    if attempt < self.category_max_retries:
+                        await asyncio.sleep(self.category_retry_delay * 2 ** attempt)
+                except Exception as e:
+                    print(f"Error categorizing a batch of {len(batch)} transactions: {e}")
+                    return None
+        return {}
+
     def classify_intent(self, intent: str, user: User) -> dict:
         # Placeholder for actual intent classification logic
         # This would typically involve calling an AI model to classify the intent
@@ -434,7 +584,7 @@ class AIService:
                     Return only JSON in exactly this format: {format_instructions}
 "
         """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, openai_api_key=self.open_ai_api_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000, priority=PRIORITY_INTERACTIVE)
         chain = LLMChain(llm=llm, prompt=prompt_template, memory=memory)
         response = chain.run({"intent": intent})
         response_data = output_parser.parse(response)
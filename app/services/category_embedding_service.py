@@ -0,0 +1,143 @@
+from collections import Counter, defaultdict
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import os
+
+from app.models.account import Category, CategoryEmbedding, Transaction
+from app.models.session import SessionTransaction
+from app.util.category_cache import normalize_category_narration
+from app.util.llm_gateway import embeddings
+
+load_dotenv(override=True)
+
+
+class CategoryEmbeddingService:
+    """
+    Nearest neighbour categorization over embeddings of narrations that already have a category.
+    A new narration is embedded once; its closest labelled narrations vote for a category weighted by
+    similarity and by how many transactions back each of them, and the vote is only used when it is decisive.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.model = os.getenv("CATEGORY_EMBEDDING_MODEL", "text-embedding-3-small")
+        self.neighbours = int(os.getenv("CATEGORY_KNN_NEIGHBOURS", "10"))
+        self.max_distance = float(os.getenv("CATEGORY_KNN_MAX_DISTANCE", "0.25"))
+        self.min_share = float(os.getenv("CATEGORY_KNN_MIN_SHARE", "0.8"))
+        self.index_batch_size = int(os.getenv("CATEGORY_EMBEDDING_BATCH", "2000"))
+
+    def embed(self, narrations: list[str]) -> list[list[float]]:
+        return embeddings(model=self.model).embed_documents(narrations) if narrations else []
+
+    def nearest_category(self, embedding: list[float], transaction_type: str,
+                         category_ids: set[int]) -> Optional[int]:
+        distance = CategoryEmbedding.embedding.cosine_distance(embedding)
+        neighbours = (self.db.query(CategoryEmbedding.category_id, CategoryEmbedding.votes, distance.label("distance"))
+                      .filter(CategoryEmbedding.transaction_type == transaction_type)
+                      .order_by(distance)
+                      .limit(self.neighbours)
+                      .all())
+        weights: dict[int, float] = defaultdict(float)
+        for category_id, votes, neighbour_distance in neighbours:
+            if neighbour_distance <= self.max_distance and category_id in category_ids:
+                weights[category_id] += (1 - neighbour_distance) * (1 + votes) ** 0.5
+        if not weights:
+            return None
+        category_id, weight = max(weights.items(), key=lambda item: item[1])
+        return category_id if weight / sum(weights.values()) >= self.min_share else None
+
+    def categorize(self, transactions: list, categories: list[Category]) \
+            -> tuple[dict[int, int], dict[tuple[str, str], list[float]]]:
+        """
+        :return: Category ID by transaction ID for the transactions with a decisive neighbour vote, and the
+        embedding of every distinct (narration, transaction type) looked up so the caller can remember the
+        category the LLM gives the undecided ones.
+        """
+        keys = {transaction.id: (normalize_category_narration(transaction.description),
+                                 (transaction.transaction_type or "").lower()) for transaction in transactions}
+        distinct = sorted({key for key in keys.values() if key[0]})
+        if not distinct:
+            return {}, {}
+        try:
+            vectors = dict(zip(distinct, self.embed([narration for narration, _ in distinct])))
+        except Exception as e:
+            print(f"Unable to embed narrations for the category neighbours: {e}")
+            return {}, {}
+
+        category_ids = {category.id for category in categories}
+        decided = {key: self.nearest_category(vectors[key], key[1], category_ids) for key in distinct}
+        categorized = {transaction_id: decided[key] for transaction_id, key in keys.items()
+                       if decided.get(key) is not None}
+        print(f"Category neighbours: {len(categorized)} of {len(transactions)} transactions decided, "
+              f"{sum(1 for v in decided.values() if v is None)} of {len(distinct)} narrations undecided")
+        return categorized, vectors
+
+    def remember_categorized(self, transactions: list, category_ids: dict[int, int],
+                             vectors: dict[tuple[str, str], list[float]]):
+        """
+        Store the categories given to transactions whose narrations were embedded by categorize, so the next
+        transaction with a similar narration is settled here instead of by the LLM.
+        """
+        counts: Counter = Counter()
+        for transaction in transactions:
+            key = (normalize_category_narration(transaction.description),
+                   (transaction.transaction_type or "").lower())
+            if key in vectors and category_ids.get(transaction.id):
+                counts[(key, category_ids[transaction.id])] += 1
+        labelled = {}
+        for (key, category_id), votes in counts.most_common():
+            labelled.setdefault(key, (category_id, votes))
+        self.remember(labelled, vectors)
+
+    def remember(self, labelled: dict[tuple[str, str], tuple[int, int]],
+                 vectors: dict[tuple[str, str], list[float]]):
+        """
+        Store labelled narrations as neighbours for later lookups, adding to the votes of the ones already known.
+        :param labelled: (category ID, transactions) by (narration, transaction type).
+        :param vectors: Embeddings already computed for those narrations, the rest are embedded here.
+        """
+        missing = [key for key in labelled if key not in vectors]
+        if missing:
+            vectors = {**vectors, **dict(zip(missing, self.embed([narration for narration, _ in missing])))}
+        rows = [{"narration": narration[:255], "transaction_type": transaction_type, "category_id": category_id,
+                 "votes": votes, "embedding": vectors[(narration, transaction_type)]}
+                for (narration, transaction_type), (category_id, votes) in labelled.items()]
+        if not rows:
+            return
+        statement = insert(CategoryEmbedding).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=["narration", "transaction_type", "category_id"],
+            set_={"votes": CategoryEmbedding.votes + statement.excluded.votes})
+        self.db.execute(statement)
+
+    def index_labelled_transactions(self) -> int:
+        """
+        Embed the categorized narrations of session and account transactions that are not neighbours yet,
+        at most CATEGORY_EMBEDDING_BATCH per run.
+        :return: The number of narrations added.
+        """
+        known = {(narration, transaction_type, category_id) for narration, transaction_type, category_id in
+                 self.db.query(CategoryEmbedding.narration, CategoryEmbedding.transaction_type,
+                               CategoryEmbedding.category_id)}
+        counts: Counter = Counter()
+        for model in (SessionTransaction, Transaction):
+            for description, transaction_type, category_id in (
+                    self.db.query(model.description, model.transaction_type, model.category_id)
+                    .filter(model.category_id.isnot(None), model.description.isnot(None))
+                    .yield_per(5000)):
+                narration = normalize_category_narration(description)
+                key = (narration, (transaction_type or "").lower(), category_id)
+                if narration and key not in known:
+                    counts[key] += 1
+
+        # A narration labelled with two categories keeps the one most of its transactions got
+        labelled = {}
+        for (narration, transaction_type, category_id), votes in counts.most_common(self.index_batch_size):
+            labelled.setdefault((narration, transaction_type), (category_id, votes))
+        self.remember(labelled, {})
+        self.db.commit()
+        print(f"Indexed {len(labelled)} categorized narrations as neighbours")
+        return len(labelled)
@@ -3,22 +3,19 @@ from datetime import timedelta, datetime
 from typing import Optional, List
 
 import pandas as pd
-from chromadb.utils import embedding_functions
 from langchain.chains.llm import LLMChain
 from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain_community.vectorstores import Chroma
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from pandas import DataFrame
 from sklearn.cluster import KMeans
 import numpy as np
-from langchain_openai import OpenAIEmbeddings
 from requests import session
 
 from app.data.session import SessionTransactionOut, SessionInsightOut, SessionSwotOut
 from app.data.transaction_insight import OverallAssessment, ClusteredTransactionNames, TransactionBeneficiary, \
-    TransactionBeneficial
+    TransactionBeneficial, TransactionBeneficiaries
 from app.models.session import Session as SessionModel, SessionTransaction, SessionAccount, SessionBeneficiary, \
     SessionInsight, SessionSwot
 from langchain.prompts.prompt import PromptTemplate
@@ -32,7 +29,11 @@ import os
 from dotenv import load_dotenv
 
 from app.services.transaction_service import TransactionService
+from app.util.category_cache import normalize_category_narration
 from app.util.chroma_db import get_chroma_db
+from app.util.counterparty import parse_counterparty
+from app.util.self_transfer import SelfTransferCache
+from app.util.llm_gateway import chat_model, embedding_function
 
 load_dotenv(override=True)
 
@@ -48,7 +49,10 @@ class SessionAdviceService:
         self.user = None
         self.p2p_category_id = os.getenv('PEER_TO_PEER_CATEGORY_ID')
         self.N = 10
-        self.llm = ChatOpenAI(api_key=self.ai_key, temperature=0, model="gpt-4o-mini")
+        self.llm = chat_model(model="gpt-4o-mini", temperature=0)
+        self.beneficiary_batch_size = int(os.getenv("BENEFICIARY_BATCH_SIZE", "50"))
+        self.beneficiary_concurrency = int(os.getenv("BENEFICIARY_LLM_CONCURRENCY", "4"))
+        self.self_transfer_min_score = float(os.getenv("SELF_TRANSFER_MIN_SCORE", "90"))
 
     def save_top_beneficiaries(self, session_record: SessionModel,
                                transaction_benefices: List[TransactionBeneficial]) -> bool:
@@ -239,17 +243,6 @@ class SessionAdviceService:
         return True
 
     async def process_top_beneficiaries(self, session_id: str):
-        async def handle_transaction(transaction: SessionTransaction):
-            try:
-                response = self.detect_beneficiary(session_record.name, transaction)
-                print(response)
-                if response.is_self:
-                    return None
-                return TransactionBeneficial(name=response.name, amount=transaction.amount)
-            except:
-                return None
-
-        records = []
         session_record: SessionModel = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
         accounts = self.db.query(SessionAccount).filter(SessionAccount.session_id == session_record.id).all()
         account_ids = [account.id for account in accounts]
@@ -258,42 +251,111 @@ class SessionAdviceService:
                 account_ids), SessionTransaction.category_id == self.p2p_category_id,
                               SessionTransaction.transaction_type == 'debit').all()
 
-        results = await asyncio.gather(
-            *(handle_transaction(tx) for tx in transactions),
-            return_exceptions=False
-        )
-        transaction_beneficials: List[TransactionBeneficial] = [r for r in results if r]
+        # The same recipient shows up many times with only dates, amounts and references changing, ask once
+        # per distinct narration and fan the answer back out to its transactions
+        groups: dict[str, List[SessionTransaction]] = {}
+        for transaction in transactions:
+            key = normalize_category_narration(transaction.description)
+            if key:
+                groups.setdefault(key, []).append(transaction)
+        # Transfers to the owner's own accounts are dropped up front, bank narration templates settle most of
+        # the rest and the model only gets the ones no template matched
+        self_transfers = self.get_self_transfers(session_record, accounts, transactions)
+        groups = {key: group for key, group in groups.items() if group[0].description not in self_transfers}
+        beneficiaries: dict[str, TransactionBeneficiary] = {}
+        for key, group in groups.items():
+            parsed = parse_counterparty(group[0].description, group[0].transaction_type)
+            if parsed is not None:
+                beneficiaries[key] = TransactionBeneficiary(name=parsed[0], is_self=False)
+        parsed_count = len(beneficiaries)
+        beneficiaries.update(await self.detect_beneficiaries(
+            session_record.name, {key: group[0].description for key, group in groups.items()
+                                  if key not in beneficiaries}))
+
+        transaction_beneficials: List[TransactionBeneficial] = []
+        for key, group in groups.items():
+            beneficiary = beneficiaries.get(key)
+            if beneficiary is None or beneficiary.is_self:
+                continue
+            transaction_beneficials.extend(
+                TransactionBeneficial(name=beneficiary.name, amount=transaction.amount) for transaction in group)
+        print(f"Beneficiaries: {len(transactions)} transfers, {len(self_transfers)} self-transfer narrations, "
+              f"{len(groups)} distinct narrations, {parsed_count} parsed, {len(beneficiaries) - parsed_count} from the model")
         self.save_top_beneficiaries(session_record, transaction_beneficials)
 
-    def get_to_exclude_similarity(self, session_id, name_to_exclude) -> set:
-        ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.ai_key,
-            model_name="text-embedding-3-small"
-        )
+    async def detect_beneficiaries(self, name: str, narrations: dict[str, str]) -> dict[str, TransactionBeneficiary]:
+        """
+        Identify the recipient of many transfer narrations with one prompt per batch of BENEFICIARY_BATCH_SIZE
+        numbered narrations, at most BENEFICIARY_LLM_CONCURRENCY batches at a time.
+        :param name: The account owner's name, recipients matching it are flagged is_self.
+        :param narrations: Narration by key.
+        :return: Beneficiary by key, keys of failed batches or unanswered rows are left out.
+        """
+        if not narrations:
+            return {}
+        parser = PydanticOutputParser(pydantic_object=TransactionBeneficiaries)
+        prompt_template = PromptTemplate(
+            input_variables=["name", "narrations"],
+            partial_variables={"format_instructions": parser.get_format_instructions()},
+            template="""
+                        You are a financial assistant that analyzes transaction data.
+                        Your goal is to identify who the money was sent to in each transfer.
 
-        # Step 1: Get embedding of the name you want to exclude
-        target_embedding = ef([name_to_exclude])[0]
-        collection = self.get_collection(self.session_transaction_key.format(session_id))
-        results_to_fetch = 2500
-        if collection.count() < results_to_fetch:
-            results_to_fetch = collection.count()
-        similar_results = self.get_collection(self.session_transaction_key.format(session_id)).query(
-            query_embeddings=[target_embedding],
-            n_results=results_to_fetch,  # fetch top 10 similar
-            include=["metadatas", "documents", 'embeddings', "distances"]
-        )
-        to_exclude = set()
-        for meta, dist in zip(similar_results["metadatas"][0], similar_results["distances"][0]):
-            if dist < 1:  # adjust threshold (0.0 = identical, 1.0 = very different)
-                to_exclude.add(meta["description"])
+                        Here is the account owner’s name:
+                        {name}
+
+                        Each line below is a numbered transaction narration in the form "<row>. <narration>":
+                        {narrations}
+
+                        For every row, identify the beneficiary (the recipient of the funds) from the narration.
+                        If the beneficiary is the same person as the account owner (or a close variation of their name), set "is_self" to true, otherwise false.
+
+                        Return one object per row with the row number, the beneficiary "name" and "is_self".
+                        Do not explain.
+                        {format_instructions}
+                     """)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=4000)
+        chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
+        semaphore = asyncio.Semaphore(max(1, self.beneficiary_concurrency))
+
+        async def detect_batch(batch: List[tuple[str, str]]) -> dict[str, TransactionBeneficiary]:
+            rows = "\n".join(f"{row}. {' '.join((narration or '').split())}"
+                             for row, (_, narration) in enumerate(batch, start=1))
+            async with semaphore:
+                try:
+                    response = await chain.ainvoke({"name": name, "narrations": rows})
+                except Exception as e:
+                    print(f"Error detecting the beneficiaries of {len(batch)} narrations: {e}")
+                    return {}
+            return {batch[item.row - 1][0]: TransactionBeneficiary(name=item.name, is_self=item.is_self)
+                    for item in response["text"].root if 1 <= item.row <= len(batch)}
+
+        items = list(narrations.items())
+        size = max(1, self.beneficiary_batch_size)
+        results = await asyncio.gather(*(detect_batch(items[i:i + size]) for i in range(0, len(items), size)))
+        return {key: beneficiary for result in results for key, beneficiary in result.items()}
+
+    def get_to_exclude_similarity(self, session_id, name_to_exclude) -> set:
+        session_record: SessionModel = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
+        accounts = self.db.query(SessionAccount).filter(SessionAccount.session_id == session_record.id).all()
+        transactions: List[SessionTransaction] = self.db.query(SessionTransaction).filter(
+            SessionTransaction.account_id.in_([account.id for account in accounts]),
+            SessionTransaction.category_id == self.p2p_category_id).all()
+        return self.get_self_transfers(session_record, accounts, transactions, [name_to_exclude])
 
-        return to_exclude
+    def get_self_transfers(self, session_record: SessionModel, accounts: List[SessionAccount],
+                           transactions: List[SessionTransaction], names: Optional[List[str]] = None) -> set:
+        """
+        Narrations of the transactions that move money between the owner's own accounts, matched by fuzzy name
+        against the session name and the account names and cached per session.
+        """
+        owner_names = [name for name in [session_record.name, *(account.account_name for account in accounts),
+                                         *(names or [])] if name]
+        cache = SelfTransferCache(session_record.identifier, owner_names, self.self_transfer_min_score)
+        return cache.self_transfers([(t.description, t.transaction_type) for t in transactions])
 
     def get_collection(self, db_name):
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.ai_key,
-            model_name="text-embedding-3-small"
-        )
+        openai_ef = embedding_function(model="text-embedding-3-small")
         collection = self.chroma_client.get_or_create_collection(name=db_name, embedding_function=openai_ef)
         print("Collection {} created".format(collection.name))
         return collection
@@ -371,7 +433,7 @@ class SessionAdviceService:
                     - Do not include any other fields.
 
                      """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, api_key=self.ai_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({"names": names})
         data = response["text"]
@@ -412,7 +474,7 @@ class SessionAdviceService:
                           "is_self": boolean
 
                      """)
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, api_key=self.ai_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({"description": transaction.description, "name": name})
         data: TransactionBeneficiary = response["text"]
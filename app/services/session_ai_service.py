@@ -1,8 +1,9 @@
 import asyncio
+import hashlib
 import json
 import re
-import tempfile
-from typing import Optional
+from datetime import date, timedelta
+from typing import Iterator, Optional
 
 import fitz
 import pdfplumber
@@ -11,31 +12,48 @@ from langchain.chains.llm import LLMChain
 import marker
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_openai import ChatOpenAI
-from openai import OpenAI, AsyncOpenAI
 from pdfminer.pdfdocument import PDFPasswordIncorrect, PDFException
 from pdfplumber.utils.exceptions import PdfminerException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-import pikepdf
 from app.data.session import CurrencyCodeData, CurrencyOut, Statement, BankData, FinancialProfileDataIn, SessionTransactionOut
 from app.data.transaction_insight import Insights, Insight, TransactionSWOTInsight, SavingsPotentials, SavingsPotential, \
     OverallAssessment
 from app.models.session import Session as SessionModel, SessionInsight, SessionSwot, SessionSavingsPotential, \
-    SessionFile
+    SessionFile, SessionAccount, StatementLayout
 from app.models.account import Bank, Currency
+from app.models.user import User
 import os
 
 from app.models.session import SessionTransaction
+from app.services.cache_service import get_cache, set_cache
+from app.util.extraction_scheduler import PageExtractionScheduler, PageBatcher
+from app.util.layout_fingerprint import layout_fingerprint
+from app.util.llm_gateway import chat_model, async_openai_client
+from app.util.pdf_unlocker import read_encryption, find_password
+from app.util.statement_parser import StatementTableParser
 
 load_dotenv(override=True)
 
+# Bump when the page post-processing changes so stale extractions are not served from the cache
+PAGE_CACHE_VERSION = "1"
+
 
 class SessionAIService:
 
     def __init__(self, session: Session):
         self.db = session
         self.ai_key = os.environ.get("CHAT_GPT_KEY")
-        self.client = AsyncOpenAI(api_key=self.ai_key)
+        self.client = async_openai_client()
+        self.parser_min_confidence = float(os.getenv("STATEMENT_PARSER_MIN_CONFIDENCE", "0.9"))
+        self.page_scheduler = PageExtractionScheduler(
+            max_concurrency=int(os.getenv("STATEMENT_LLM_CONCURRENCY", "8")),
+            max_retries=int(os.getenv("STATEMENT_LLM_MAX_RETRIES", "4")))
+        self.page_batcher = PageBatcher(target_tokens=int(os.getenv("STATEMENT_BATCH_TARGET_TOKENS", "3000")),
+                                        max_tokens=int(os.getenv("STATEMENT_BATCH_MAX_TOKENS", "6000")))
+        self.page_cache_ttl = int(os.getenv("STATEMENT_PAGE_CACHE_TTL", str(60 * 60 * 24 * 30)))
+        self.unlock_time_budget = float(os.getenv("PDF_UNLOCK_TIME_BUDGET", "60"))
+        self.unlock_workers = int(os.getenv("PDF_UNLOCK_WORKERS", "0")) or None
 
     def is_encrypted(self):
         return self.ai_key is not None
@@ -45,11 +63,69 @@ class SessionAIService:
             statement_text=text,
             format_instructions=parser.get_format_instructions()
         )
+        cache_key = SessionAIService.get_page_cache_key(llm.model_name, formatted_prompt)
+        cached_page = await get_cache(cache_key)
+        if cached_page:
+            print("Using cached extraction for page {}".format(i))
+            return Statement.model_validate_json(cached_page)
+
         print("Processing page {} with LLM {}".format(i, text))
         result = await llm.ainvoke(formatted_prompt)
         clean_output = re.sub(r'(\d+),(\d+)', r'\1\2', result.content)
         parsed_page: Statement = parser.parse(clean_output)
-        return i, parsed_page
+        try:
+            await set_cache(cache_key, parsed_page.model_dump_json(), self.page_cache_ttl)
+        except Exception as e:
+            print("Unable to cache page {}: {}".format(i, e))
+        return parsed_page
+
+    @staticmethod
+    def get_page_cache_key(model_name: str, messages) -> str:
+        # The formatted messages already hold the system prompt, the cleaned page text and the format instructions
+        digest = hashlib.sha256()
+        digest.update(f"{PAGE_CACHE_VERSION}:{model_name}".encode("utf-8"))
+        for message in messages:
+            digest.update(f"\n{message.type}:{message.content}".encode("utf-8"))
+        return "statement_page:{}".format(digest.hexdigest())
+
+    def get_page_job(self, i, text, parser, prompt, llm):
+        return i, lambda: self.process_page(i, text, parser, prompt, llm)
+
+    def get_page_jobs(self, pages: list[tuple[int, str]], parser, prompt, llm):
+        # Small consecutive pages share one request and oversized pages are split, keyed by (page, part)
+        return self.get_batch_jobs(self.page_batcher.batch(pages), parser, prompt, llm)
+
+    def get_batch_jobs(self, batches: list[tuple[tuple[int, int], str]], parser, prompt, llm):
+        return [self.get_page_job(key, SessionAIService.clean_page_text(text), parser, prompt, llm)
+                for key, text in batches]
+
+    @staticmethod
+    def clean_page_text(text: str) -> str:
+        clean_text = re.sub(r'([A-Za-z])\1', r'\1', text)
+        return re.sub(r'\s+', ' ', clean_text).strip()
+
+    @staticmethod
+    def merge_pages(results: list[tuple[tuple[int, int], Optional[Statement]]]) -> Statement:
+        final_statement = Statement(transactions=[])
+        for key, parsed_page in sorted(results, key=lambda x: x[0]):
+            if parsed_page is None:
+                print("Skipping page {}, it could not be extracted".format(key[0]))
+                continue
+            if key == (1, 0):
+                final_statement.accountName = parsed_page.accountName
+                final_statement.accountNumber = parsed_page.accountNumber
+                final_statement.accountCurrency = parsed_page.accountCurrency
+                final_statement.accountBalance = parsed_page.accountBalance
+                final_statement.bank = parsed_page.bank
+            final_statement.transactions.extend(parsed_page.transactions)
+
+            if parsed_page.bank and final_statement.bank is None:
+                final_statement.bank = parsed_page.bank
+
+            if parsed_page.accountBalance and final_statement.accountBalance is None:
+                final_statement.accountBalance = parsed_page.accountBalance
+        print("Done processing {} pages".format(len(results)))
+        return final_statement
 
     def unlock_pdf(self, file: SessionFile, password: str) -> bool:
         try:
@@ -69,16 +145,87 @@ class SessionAIService:
             print(e)
             raise e
 
+    def get_password_candidates(self, file: SessionFile) -> Iterator[str]:
+        """
+        Passwords to try on a locked statement, most likely first: passwords that already unlocked a statement
+        for the same email, account and phone number digits, dates of birth, then short numeric pins.
+        """
+        seen = set()
+
+        def unique(values):
+            for value in values:
+                if value and value not in seen:
+                    seen.add(value)
+                    yield value
+
+        email = self.db.query(SessionModel.email).filter(SessionModel.id == file.session_id).scalar()
+        if email:
+            known_passwords = self.db.query(SessionFile.password).join(
+                SessionModel, SessionModel.id == SessionFile.session_id
+            ).filter(SessionModel.email == email, SessionFile.password.isnot(None)).distinct().all()
+            yield from unique(password for password, in known_passwords)
+
+            account_numbers = self.db.query(SessionAccount.account_number).join(
+                SessionModel, SessionModel.id == SessionAccount.session_id
+            ).filter(SessionModel.email == email).distinct().all()
+            for account_number, in account_numbers:
+                digits = re.sub(r'\D', '', account_number or "")
+                yield from unique([digits, digits[-4:], digits[-6:]])
+
+            mobile = self.db.query(User.mobile).filter(User.email == email).scalar()
+            digits = re.sub(r'\D', '', mobile or "")
+            if digits:
+                local = digits[3:] if digits.startswith("234") else digits.lstrip("0")
+                yield from unique([digits, "0" + local, local, "234" + local, local[-4:], local[-6:], local[-8:]])
+
+        # Dates of birth, youngest account holders first
+        day = date(date.today().year - 16, 12, 31)
+        while day.year >= 1950:
+            yield from unique([day.strftime("%d%m%Y"), day.strftime("%d%m%y"), day.strftime("%Y%m%d"),
+                               day.strftime("%m%d%Y")])
+            day -= timedelta(days=1)
+
+        for length in range(1, 7):
+            yield from unique(str(i).zfill(length) for i in range(10 ** length))
+
+    def recover_pdf_password(self, file: SessionFile) -> bool:
+        try:
+            info = read_encryption(file.file_path)
+        except Exception as e:
+            print("Unable to read the encryption of {}: {}".format(file.file_path, e))
+            return False
+        if info is None:
+            print("Unsupported PDF encryption on {}".format(file.file_path))
+            return False
+
+        password = find_password(info, self.get_password_candidates(file), time_budget=self.unlock_time_budget,
+                                 workers=self.unlock_workers)
+        if password is None:
+            return False
+        file.password = password
+        self.db.commit()
+        self.db.refresh(file)
+        print("Unlocked {}".format(file.id))
+        return True
+
+    @staticmethod
+    def get_page_rows(page) -> list[list[Optional[str]]]:
+        rows = []
+        try:
+            for table in page.find_tables().tables:
+                rows.extend(table.extract())
+        except Exception as e:
+            print("Unable to find tables on page {}: {}".format(page.number + 1, e))
+        return rows
+
     @staticmethod
     def is_pdf_locked(file: SessionFile):
         try:
-            # Try opening with given password (empty string if none)
-            with pdfplumber.open(file.file_path, password="") as pdf:
-                # If no exception, it's unlocked
-                return False
-        except PDFPasswordIncorrect:
-            return True
-        except PdfminerException as e:
+            # Only the trailer is read, the pages are not parsed
+            with fitz.open(file.file_path) as doc:
+                return bool(doc.needs_pass)
+        except Exception as e:
+            print("Unable to open {}: {}".format(file.file_path, e))
             return True
 
     async def read_pdf_statement(self, file: SessionFile) -> Statement | None:
@@ -93,46 +240,34 @@ class SessionAIService:
              "- Only return valid JSON as described in the format instructions."),
             ("user", "Here is some text from a bank statement:\n\n{statement_text}\n\n{format_instructions}")
         ])
-        final_statement = Statement(transactions=[])
-        tasks = []
-        if SessionAIService.is_pdf_locked(file):
+        if SessionAIService.is_pdf_locked(file) and file.password is None:
             print("PDF is locked, Trying to Unlock PDF")
-            for i in range(1, 10000000):
-                # replace this with whatever work you need to do per number
-                result = self.unlock_pdf(file, str(i))
-                if result:
-                    break
+            await asyncio.to_thread(self.recover_pdf_password, file)
 
-        if SessionAIService.is_pdf_locked(file):
+        if SessionAIService.is_pdf_locked(file) and file.password is None:
             return None
 
-        with pdfplumber.open(file.file_path) as pdf:
-            last_page_statement = None
-            llm = ChatOpenAI(model='gpt-4.1-mini', temperature=0, api_key=self.ai_key)
+        with pdfplumber.open(file.file_path, password=(file.password or "")) as pdf:
+            llm = chat_model(model='gpt-4.1-mini', temperature=0)
+            table_parser = StatementTableParser(self.parser_min_confidence)
+            results = []
+            pages = []
             for i, page in enumerate(pdf.pages, 1):
                 print("Processing page {}".format(i))
                 text = page.extract_text()
 
-                clean_text = re.sub(r'([A-Za-z])\1', r'\1', text)
-                clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-                tasks.append(self.process_page(i, clean_text, parser, prompt, llm))
+                rows = [row for table in page.extract_tables() for row in table]
+                parsed_page = table_parser.parse_page(rows, text, i == 1)
+                if parsed_page is not None:
+                    print("Parsed page {} from its transaction table".format(i))
+                    results.append(((i, 0), parsed_page))
+                    continue
+                pages.append((i, text or ""))
 
-            results = await asyncio.gather(*tasks)
+            jobs = self.get_page_jobs(pages, parser, prompt, llm)
+            results.extend(await self.page_scheduler.run(jobs))
 
-            for i, parsed_page in sorted(results, key=lambda x: x[0]):
-                if i == 1:
-                    final_statement.accountName = parsed_page.accountName
-                    final_statement.accountNumber = parsed_page.accountNumber
-                    final_statement.accountCurrency = parsed_page.accountCurrency
-                    final_statement.accountBalance = parsed_page.accountBalance
-                final_statement.transactions.extend(parsed_page.transactions)
-                last_page_statement = parsed_page
-
-                if last_page_statement and last_page_statement.accountBalance and final_statement.accountBalance is None:
-                    final_statement.accountBalance = last_page_statement.accountBalance
-            print("Done processing page {}".format(i))
-
-        return final_statement
+        return SessionAIService.merge_pages(results)
 
     def get_currency_data(self, currency_name: str) -> Optional[CurrencyCodeData]:
         currencies = self.db.query(Currency).all()
@@ -157,7 +292,7 @@ class SessionAIService:
             currency_name=currency_name, currency_list=currency_list,
             format_instructions=parser.get_format_instructions()
         )
-        llm = ChatOpenAI(model='gpt-4o-mini', temperature=0, api_key=self.ai_key)
+        llm = chat_model(model='gpt-4o-mini', temperature=0)
         result = llm.invoke(final_prompt)
         data: CurrencyCodeData = parser.parse(result.content)
 
@@ -165,29 +300,85 @@ class SessionAIService:
         return data
     
     
+    async def open_statement_document(self, file: SessionFile) -> Optional[fitz.Document]:
+        """
+        Open the statement once and decrypt it in memory, recovering the password when none is stored.
+        Returns None when the document stays locked.
+        """
+        doc = fitz.open(file.file_path)
+        if not doc.needs_pass or (file.password is not None and doc.authenticate(file.password)):
+            return doc
+
+        # 🔐 Try recovering the password if locked
+        print("PDF is locked. Attempting to unlock...")
+        # The search runs for up to its time budget, keep the loop free for the other files of the session
+        if await asyncio.to_thread(self.recover_pdf_password, file) and doc.authenticate(file.password):
+            print("Unlocked PDF with a recovered password")
+            return doc
+        doc.close()
+        return None
+
+    @staticmethod
+    def iter_pages(doc: fitz.Document) -> Iterator[tuple[int, str, list[list[Optional[str]]]]]:
+        # Pages are loaded one at a time so only the page being processed is held in memory
+        for number in range(doc.page_count):
+            page = doc.load_page(number)
+            yield number + 1, page.get_text('text'), SessionAIService.get_page_rows(page)
+
+    def get_statement_layout(self, doc: fitz.Document, file: SessionFile) -> tuple[Optional[str], Optional[StatementLayout]]:
+        """
+        Fingerprint the first page and look up a stored template for it. A known layout also gives us
+        the bank of the statement without asking the LLM.
+        """
+        if doc.page_count == 0:
+            return None, None
+        fingerprint = layout_fingerprint(doc.load_page(0))
+        if fingerprint is None:
+            return None, None
+        layout = self.db.query(StatementLayout).filter(StatementLayout.fingerprint == fingerprint).first()
+        if layout is None:
+            print("Unknown statement layout {}".format(fingerprint))
+            return fingerprint, None
+
+        print("Known statement layout {} ({})".format(layout.id, layout.source))
+        layout.hits += 1
+        if file.bank_id is None and layout.bank_id is not None:
+            file.bank_id = layout.bank_id
+        self.db.commit()
+        return fingerprint, layout
+
+    def learn_statement_layout(self, fingerprint: str, layout: Optional[StatementLayout], file: SessionFile,
+                               table_parser: StatementTableParser, rows: list[list[Optional[str]]],
+                               transactions: list, bank_name: Optional[str]):
+        # Derive the columns from what the LLM extracted, they are only kept when parsing the same rows with them
+        # gives back the LLM's transactions. Manual templates are never overwritten
+        columns = table_parser.learn_columns(rows, transactions)
+        bank_id = layout.bank_id if layout is not None else None
+        if bank_id is None and bank_name:
+            bank_id = self.get_bank_id(bank_name) or None
+
+        try:
+            if layout is None:
+                layout = StatementLayout(fingerprint=fingerprint, columns=columns, bank_id=bank_id,
+                                         source='learned', hits=1)
+                self.db.add(layout)
+            else:
+                if layout.source == 'learned' and columns is not None:
+                    layout.columns = columns
+                layout.bank_id = layout.bank_id or bank_id
+            if file.bank_id is None:
+                file.bank_id = bank_id
+            self.db.commit()
+            print("Saved statement layout {} with columns {}".format(fingerprint, columns))
+        except IntegrityError:
+            # Another file of the same layout was learned at the same time
+            self.db.rollback()
+
     async def read_pdf_directly(self, file) -> Optional[Statement]:
-        # 🔐 Try brute-forcing the password if locked
-        if self.is_pdf_locked(file) and file.password is None:
-            print("PDF is locked. Attempting to unlock...")
-            should_break = False
-            for length in range(1, 10):  # from 1-digit up to 9-digits
-                for i in range(10 ** length):
-                    s = str(i).zfill(length)
-
-                    if self.unlock_pdf(file, str(s)):
-                        print(f"Unlocked PDF with password {i}")
-                        should_break = True
-                        break
-
-                if should_break:
-                    break
-
-        # If still locked, abort
-        if self.is_pdf_locked(file) and file.password is None:
+        doc = await self.open_statement_document(file)
+        if doc is None:
             print("Failed to unlock PDF.")
             return None
-        tasks = []
-        final_statement = Statement(transactions=[])
         parser = PydanticOutputParser(pydantic_object=Statement)
         prompt = ChatPromptTemplate.from_messages([
             ("system",
@@ -198,48 +389,54 @@ class SessionAIService:
              "- Only return valid JSON as described in the format instructions."),
             ("user", "Here is some text from a bank statement:\n\n{statement_text}\n\n{format_instructions}")
         ])
-        # Create a decrypted temp copy
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            tmp_path = tmp.name
 
         try:
-            with pikepdf.open(file.file_path, password=(file.password or "")) as pdf:
-                pdf.save(tmp_path)
-
-            llm = ChatOpenAI(model='gpt-4.1-mini', temperature=0, api_key=self.ai_key)
-            doc = fitz.open(tmp_path)
-
-            print("Number of pages:", len(doc))
-
-            for page in doc:
-                print("Processing page {}".format(page.number + 1))
-                text = page.get_text('text')
-                print(text)
-
-                clean_text = re.sub(r'([A-Za-z])\1', r'\1', text)
-                clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-                tasks.append(self.process_page(page.number + 1, clean_text, parser, prompt, llm))
-
-            results = await asyncio.gather(*tasks)
-
-            for i, parsed_page in sorted(results, key=lambda x: x[0]):
-                if i == 1:
-                    final_statement.accountName = parsed_page.accountName
-                    final_statement.accountNumber = parsed_page.accountNumber
-                    final_statement.accountCurrency = parsed_page.accountCurrency
-                    final_statement.accountBalance = parsed_page.accountBalance
-                final_statement.transactions.extend(parsed_page.transactions)
-                last_page_statement = parsed_page
-
-                if last_page_statement and last_page_statement.accountBalance and final_statement.accountBalance is None:
-                    final_statement.accountBalance = last_page_statement.accountBalance
-            print("Done processing page {}".format(i))
-            doc.close()
-            return final_statement
+            llm = chat_model(model='gpt-4.1-mini', temperature=0)
+            table_parser = StatementTableParser(self.parser_min_confidence)
+            fingerprint, layout = self.get_statement_layout(doc, file)
+            if layout is not None and layout.columns:
+                table_parser.columns = layout.columns
+            results = []
+            llm_pages = []
+            llm_rows = []
+
+            print("Number of pages:", doc.page_count)
+
+            async def page_jobs():
+                # Batches go to the scheduler as soon as they are complete. Pages are read in a worker thread
+                # so the requests already sent make progress while the rest of the document is extracted.
+                batches = self.page_batcher.stream()
+                pages = SessionAIService.iter_pages(doc)
+                while (page := await asyncio.to_thread(next, pages, None)) is not None:
+                    i, text, rows = page
+                    print("Processing page {}".format(i))
+                    print(text)
+
+                    parsed_page = table_parser.parse_page(rows, text, i == 1)
+                    if parsed_page is not None:
+                        print("Parsed page {} from its transaction table".format(i))
+                        results.append(((i, 0), parsed_page))
+                        continue
+                    llm_pages.append(i)
+                    llm_rows.extend(rows)
+                    for job in self.get_batch_jobs(batches.add(i, text), parser, prompt, llm):
+                        yield job
+                for job in self.get_batch_jobs(batches.flush(), parser, prompt, llm):
+                    yield job
+
+            llm_results = await self.page_scheduler.run(page_jobs())
+            print("Parsed {} pages without the LLM, sent {} pages to the LLM in {} requests".format(
+                len(results), len(llm_pages), len(llm_results)))
+            statement = SessionAIService.merge_pages(results + llm_results)
+
+            if fingerprint is not None and llm_rows and (layout is None or layout.source == 'learned'):
+                llm_transactions = [t for _, page in llm_results if page is not None for t in page.transactions]
+                await asyncio.to_thread(self.learn_statement_layout, fingerprint, layout, file, table_parser,
+                                        llm_rows, llm_transactions, statement.bank)
+            return statement
 
         finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            doc.close()
 
     def get_bank_id(self, bank_name: str) -> int:
         banks = self.db.query(Bank).filter(Bank.active == True).all()
@@ -263,7 +460,7 @@ class SessionAIService:
             bank_name=bank_name, bank_list=banks,
             format_instructions=parser.get_format_instructions()
         )
-        llm = ChatOpenAI(model='gpt-4o-mini', temperature=0, api_key=self.ai_key)
+        llm = chat_model(model='gpt-4o-mini', temperature=0)
         result = llm.invoke(final_prompt)
         data: BankData = parser.parse(result.content)
 
@@ -340,7 +537,7 @@ class SessionAIService:
 
                    """)
 
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, api_key=self.ai_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({
             "inflow": data_in.income_flow.inflow, "outflow": data_in.income_flow.outflow,
@@ -439,7 +636,7 @@ class SessionAIService:
                     - Keep each point short, clear, and actionable. 
                    """)
 
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, api_key=self.ai_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({"inflow": data_in.income_flow.inflow, "outflow": data_in.income_flow.outflow,
                                  "closing_balance": data_in.income_flow.closing_balance,
@@ -542,7 +739,7 @@ class SessionAIService:
                                   - "amount" (float)
                       """)
 
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, api_key=self.ai_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({"inflow": data_in.income_flow.inflow, "outflow": data_in.income_flow.outflow,
                                  "closing_balance": data_in.income_flow.closing_balance,
@@ -639,7 +836,7 @@ class SessionAIService:
 
                      """)
 
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, api_key=self.ai_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({"insights": insights, "swot": swot_insight,
                                  "session_currency": session.currency_code,
@@ -2,7 +2,6 @@ import traceback
 from datetime import datetime, timedelta
 from typing import List, Optional
 
-from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
 from langchain.agents import initialize_agent
 from langchain.chains.llm import LLMChain
@@ -18,7 +17,6 @@ from sqlalchemy import text
 from app.data.account import TransactionCategoryOut
 from app.data.session import SessionAccountOut, SessionTransactionOut
 from app.models.session import Session as SessionModel, SessionTransaction, SessionAccount
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 from app.routers import transaction
 from app.services.session_advice_service import SessionAdviceService
@@ -26,6 +24,7 @@ from app.services.session_service import SessionService
 from app.services.session_transaction_service import SessionTransactionService
 from app.services.transaction_service import TransactionService
 from app.util.chroma_db import get_chroma_db
+from app.util.llm_gateway import chat_model, embedding_function, embeddings, PRIORITY_INTERACTIVE
 
 import os
 import re
@@ -46,7 +45,7 @@ class SessionChatService:
         self.transaction_service = SessionTransactionService(db=db_session)
         self.session_advice_service = SessionAdviceService(db_session=db_session)
         self.N = 10
-        self.llm = ChatOpenAI(api_key=self.ai_key, temperature=0, model="gpt-4o-mini")
+        self.llm = chat_model(model="gpt-4o-mini", temperature=0, priority=PRIORITY_INTERACTIVE)
 
     def process(self, session_id: str, question: str) -> str:
 
@@ -229,10 +228,7 @@ class SessionChatService:
         return tools
 
     def get_collection(self, db_name):
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.ai_key,
-            model_name="text-embedding-3-large"
-        )
+        openai_ef = embedding_function(model="text-embedding-3-large", priority=PRIORITY_INTERACTIVE)
         collection = self.chroma_client.get_or_create_collection(name=db_name, embedding_function=openai_ef)
         print("Collection {} created".format(collection.name))
         return collection
@@ -290,10 +286,7 @@ class SessionChatService:
         return True
 
     def semantic_search_metadata(self, query: str):
-        openai_ef = OpenAIEmbeddings(
-            api_key=self.ai_key,
-            model="text-embedding-3-large"  # higher quality
-        )
+        openai_ef = embeddings(model="text-embedding-3-large", priority=PRIORITY_INTERACTIVE)  # higher quality
 
         vectorstore = Chroma(
             client=self.chroma_client,
@@ -8,13 +8,14 @@ from sqlalchemy.orm import Session
 from app.data.account import AccountExchangeCreate, TransactionOut
 from app.models.account import Bank, Transaction
 from app.models.session import Session as SessionModel, SessionAccount, SessionTransaction, SessionFile, SessionInsight, \
-    SessionSwot, SessionSavingsPotential, SessionBeneficiary
+    SessionSwot, SessionSavingsPotential, SessionBeneficiary, SessionRollup, SessionSummary
 
 from app.data.session import SessionCreate, SessionOut, AccountExchangeSessionCreate, SessionAccountOut, \
     SessionInsightOut, SessionSwotOut, SessionSavingsPotentialOut
 from app.services.file_upload_service import FileUploadService
 from app.services.mono_service import MonoService
 from app.services.session_ai_service import SessionAIService
+from app.util.response_cache import bump_session_version
 from app.workers.session_tasks import process_statements
 from app.workers.transaction_tasks import fetch_session_transactions
 
@@ -84,6 +85,7 @@ class SessionService:
                 session_files.append(session_file.id)
 
             process_statements.delay(session_id, session_files)
+            bump_session_version(session_id)
             return True
         except Exception as e:
             raise ValueError(f"Error processing statements: {str(e)}")
@@ -96,7 +98,8 @@ class SessionService:
             account_ids = [a.id for a in accounts]
             file_ids = [sf.id for sf in session_files]
             bank_ids = [sf.bank_id for sf in session_files]
-            # delete sessionsavings, sessionaccounts, sessiontransactions, sessioninsights, sessionswots, sessiobeneficiaries
+            # delete sessionsavings, sessionaccounts, sessiontransactions, sessioninsights, sessionswots, sessiobeneficiaries,
+            # and the rollups and summary built from them
             print("Deleting previous session data for retry...")
             self.db.query(SessionSavingsPotential).filter(
                 SessionSavingsPotential.session_id == session_record.id).delete()
@@ -106,8 +109,11 @@ class SessionService:
                 SessionTransaction.account_id.in_(account_ids)).delete()
             self.db.query(SessionAccount).filter(SessionAccount.session_id == session_record.id).delete()
             self.db.query(SessionBeneficiary).filter(SessionBeneficiary.session_id == session_record.id).delete()
+            self.db.query(SessionRollup).filter(SessionRollup.session_id == session_record.id).delete()
+            self.db.query(SessionSummary).filter(SessionSummary.session_id == session_record.id).delete()
             self.db.commit()
             print("Deleted previous session data for retry.")
+            bump_session_version(session_id)
             process_statements.delay(session_id, file_ids)
             return True
         except Exception as e:
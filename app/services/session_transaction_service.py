@@ -1,29 +1,32 @@
 import asyncio
-from typing import List
+from typing import List, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
 import json
-import time
 from dateutil.relativedelta import relativedelta
 from collections import defaultdict
 
 from dotenv import load_dotenv
-from sqlalchemy import text, select, func, cast
+from sqlalchemy import text, select, func, cast, insert, exists
 import numpy as np
-import statistics as stats
 
 from app.data.account import TransactionCategoryOut, TransactionWeekCategoryOut, WeeklyTrend
 from app.data.session import Statement, IncomeFlowOut, IncomeCategoryOut, RiskOut, TransactionDataOut, \
     FinancialProfileDataIn, SpendingProfileOut, SessionTransactionOut, SessionAccountOut, SessionBeneficiaryOut
-from app.models.account import Category, Account, CurrencyExchangeRate, Currency
-from app.models.session import SessionAccount, SessionTransaction, Session as SessionModel, SessionBeneficiary
+from app.models.account import Category, Account, CurrencyExchangeRate, Currency, Transaction, CategoryRule
+from app.models.session import SessionAccount, SessionTransaction, Session as SessionModel, SessionBeneficiary, \
+    SessionRollup, SessionSummary
 
 from app.services.ai_service import AIService
 from app.services.mono_service import MonoService
 import os
 
+from app.services.category_embedding_service import CategoryEmbeddingService
 from app.services.session_ai_service import SessionAIService
+from app.util.category_classifier import CategoryClassifier, classifier_text
+from app.util.category_rules import get_rule_engine
+from app.util.session_snapshot import SessionSnapshot
 
 load_dotenv(override=True)
 
@@ -35,6 +38,12 @@ class SessionTransactionService:
         self.savings_category_id = int(os.getenv('SAVINGS_CATEGORY_ID'))
         self.session_ai_service = SessionAIService(self.db)
         self.ai_service = AIService(self.db)
+        self.category_embedding_service = CategoryEmbeddingService(self.db)
+        self.category_model_dir = os.getenv("CATEGORY_MODEL_DIR", "./category_models")
+        self.category_min_confidence = float(os.getenv("CATEGORY_MODEL_MIN_CONFIDENCE", "0.85"))
+        self.category_model_max_samples = int(os.getenv("CATEGORY_MODEL_MAX_SAMPLES", "200000"))
+        # The financial position lists only the latest transactions of the session, not all of them
+        self.financial_position_transactions = int(os.getenv("FINANCIAL_POSITION_TRANSACTIONS", "200"))
 
     def index_transactions(self, account_id: int, start_from: datetime = None) -> bool:
         # Fetch the account from the database
@@ -111,17 +120,21 @@ class SessionTransactionService:
                 print("No transactions to categorize.")
                 return True
 
+            category_ids = self.categorize_with_rules(transactions)
+            category_ids.update(self.categorize_with_classifier(
+                [t for t in transactions if t.id not in category_ids], categories))
+            neighbour_ids, vectors = self.categorize_with_neighbours(
+                [t for t in transactions if t.id not in category_ids], categories)
+            category_ids.update(neighbour_ids)
+            remaining = [t for t in transactions if t.id not in category_ids]
+            if remaining:
+                category_ids.update(asyncio.run(self.ai_service.categorize_transactions_batch(remaining, categories)))
+                self.remember_neighbours(remaining, category_ids, vectors)
             for transaction in transactions:
-                # Here you would implement your logic to categorize the transaction
-                # For example, you could use a machine learning model or a set of rules
-                # For now, we'll just print the transaction
-                print(f"Categorizing transaction: {transaction.id} - {transaction.description}")
-                # Example categorization logic (to be replaced with actual logic)
-                category_id = self.ai_service.categorize_session_transaction(transaction, categories)
-                transaction.category_id = category_id
-                self.db.commit()
-                self.db.refresh(transaction)
-                time.sleep(5)
+                if transaction.id in category_ids:
+                    transaction.category_id = category_ids[transaction.id]
+            self.db.commit()
+            print(f"Categorized {len(category_ids)} of {len(transactions)} transactions.")
 
             return True
         except Exception as e:
@@ -151,27 +164,26 @@ class SessionTransactionService:
 
             categories = self.db.query(Category).all()
 
-            # Step 2: Define async categorization tasks
-            async def categorize_one(transaction):
-                try:
-                    print(f"Categorizing transaction: {transaction.id} - {transaction.description}")
-                    cat_id = self.ai_service.categorize_session_transaction(transaction, categories)
-                    return transaction.id, cat_id
-                except Exception as e:
-                    print(f"Error categorizing transaction {transaction.id}: {e}")
-                    return transaction.id, None
-
-            # Step 3: Run all categorization concurrently
-            results = await asyncio.gather(*(categorize_one(t) for t in transactions))
-
-            # Step 4: Bulk update in one DB transaction
+            # Step 2: Categorize with the rules, the local classifier and the nearest labelled narrations, then
+            # in batches, one LLM call per batch of narrations none of them could settle
+            category_ids = self.categorize_with_rules(transactions)
+            category_ids.update(self.categorize_with_classifier(
+                [t for t in transactions if t.id not in category_ids], categories))
+            neighbour_ids, vectors = self.categorize_with_neighbours(
+                [t for t in transactions if t.id not in category_ids], categories)
+            category_ids.update(neighbour_ids)
+            remaining = [t for t in transactions if t.id not in category_ids]
+            if remaining:
+                category_ids.update(await self.ai_service.categorize_transactions_batch(remaining, categories))
+                self.remember_neighbours(remaining, category_ids, vectors)
+
+            # Step 3: Bulk update in one DB transaction
             updated_count = 0
-            for txn_id, category_id in results:
+            for transaction in transactions:
+                category_id = category_ids.get(transaction.id)
                 if category_id:
-                    transaction = next((t for t in transactions if t.id == txn_id), None)
-                    if transaction:
-                        transaction.category_id = category_id
-                        updated_count += 1
+                    transaction.category_id = category_id
+                    updated_count += 1
 
             if updated_count > 0:
                 self.db.commit()
@@ -184,6 +196,95 @@ class SessionTransactionService:
             self.db.rollback()
             return False
 
+    def categorize_with_rules(self, transactions: list[SessionTransaction]) -> dict[int, int]:
+        """
+        Categorize transactions with the keyword and regex rules in category_rules. The rules are reloaded
+        whenever the table changes and the number of transactions each rule matched is added to its hits.
+        :return: Category ID by transaction ID for the transactions a rule matched.
+        """
+        if not transactions:
+            return {}
+        version = tuple(self.db.query(func.count(CategoryRule.id), func.max(CategoryRule.updated_at)).one())
+        engine = get_rule_engine(version, lambda: self.db.query(
+            CategoryRule.id, CategoryRule.pattern, CategoryRule.match_type, CategoryRule.transaction_type,
+            CategoryRule.category_id, CategoryRule.priority).filter(CategoryRule.active.is_(True)).all())
+        categorized, fired = engine.categorize(transactions)
+        for rule_id, count in fired.items():
+            # Leave updated_at alone, it versions the rules and counting hits must not trigger a reload
+            self.db.query(CategoryRule).filter(CategoryRule.id == rule_id).update(
+                {CategoryRule.hits: CategoryRule.hits + count, CategoryRule.updated_at: CategoryRule.updated_at},
+                synchronize_session=False)
+        print(f"Category rules: {len(categorized)} of {len(transactions)} transactions matched, "
+              f"rules fired {dict(fired.most_common())}")
+        return categorized
+
+    def categorize_with_classifier(self, transactions: list[SessionTransaction],
+                                   categories: list[Category]) -> dict[int, int]:
+        """
+        Categorize transactions with the latest locally trained classifier, keeping only the predictions at or
+        above CATEGORY_MODEL_MIN_CONFIDENCE that name a category that still exists.
+        :return: Category ID by transaction ID, empty when no classifier has been trained yet.
+        """
+        classifier = CategoryClassifier.load_latest(self.category_model_dir)
+        if classifier is None or not transactions:
+            return {}
+        category_ids = {category.id for category in categories}
+        predictions = classifier.predict([classifier_text(t.description, t.transaction_type) for t in transactions])
+        categorized = {transaction.id: category_id
+                       for transaction, (category_id, confidence) in zip(transactions, predictions)
+                       if confidence >= self.category_min_confidence and category_id in category_ids}
+        print(f"Category classifier {classifier.version}: {len(categorized)} of {len(transactions)} transactions "
+              f"at or above {self.category_min_confidence} confidence")
+        return categorized
+
+    def categorize_with_neighbours(self, transactions: list[SessionTransaction],
+                                   categories: list[Category]) -> tuple[dict[int, int], dict]:
+        """
+        Categorize transactions by a vote of the nearest labelled narration embeddings, keeping only decisive votes.
+        :return: Category ID by transaction ID, and the narration embeddings for remember_neighbours.
+        """
+        if not transactions:
+            return {}, {}
+        try:
+            # In a savepoint so a failed lookup does not roll back the rule hits counted before it
+            with self.db.begin_nested():
+                return self.category_embedding_service.categorize(transactions, categories)
+        except Exception as e:
+            # Without the neighbours the LLM still categorizes everything, only slower
+            print(f"Error categorizing with the category neighbours: {e}")
+            return {}, {}
+
+    def remember_neighbours(self, transactions: list[SessionTransaction], category_ids: dict[int, int],
+                            vectors: dict):
+        if not vectors:
+            return
+        try:
+            with self.db.begin_nested():
+                self.category_embedding_service.remember_categorized(transactions, category_ids, vectors)
+        except Exception as e:
+            print(f"Error storing the category neighbours: {e}")
+
+    def train_category_classifier(self) -> Optional[str]:
+        """
+        Train a new category classifier from the most recent categorized session and account transactions
+        and make it the one used for categorization.
+        :return: The version of the new classifier, None when there was not enough data.
+        """
+        rows = []
+        for model in (SessionTransaction, Transaction):
+            rows.extend(self.db.query(model.description, model.transaction_type, model.category_id)
+                        .filter(model.category_id.isnot(None), model.description.isnot(None))
+                        .order_by(model.id.desc())
+                        .limit(self.category_model_max_samples)
+                        .all())
+        print(f"Training the category classifier on {len(rows)} transactions")
+        classifier = CategoryClassifier.train([classifier_text(d, t) for d, t, _ in rows], [c for _, _, c in rows])
+        if classifier is None:
+            return None
+        filename = classifier.save(self.category_model_dir)
+        print(f"Saved category classifier {filename} trained on {classifier.samples} transactions")
+        return classifier.version
+
     def process_transaction_statements(self, account_id: int, statement: Statement) -> bool:
         print(
             f"Processing transaction statements for account: {account_id}, With statements {len(statement.transactions)} ")
@@ -246,56 +347,71 @@ class SessionTransactionService:
         print(f"Converted amount: {converted_amount}")
         return converted_amount
 
-    def get_income_flow(self, session_id: str) -> IncomeFlowOut:
-
-        session = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
+    def get_cash_flow(self, session_id: str):
+        """
+        Inflow, outflow, savings and closing balance of a session from one aggregate query, without loading
+        any transaction.
+        """
+        session = self.db.query(SessionModel.id).filter(SessionModel.identifier == session_id).first()
 
         if not session:
             raise ValueError(f"Session with ID {session_id} not found.")
-        session_accounts = self.db.query(SessionAccount).filter(SessionAccount.session_id == session.id).all()
-        account_ids = [a.id for a in session_accounts]
-        closing_balance = sum(a.current_balance for a in session_accounts)
-        transactions = self.db.query(SessionTransaction).filter(SessionTransaction.account_id.in_(account_ids)).all()
-        print(f"Found {len(transactions)} transactions to get income flow.")
-        inflows = sum(t.amount for t in transactions if t.transaction_type.strip().lower() == 'credit')
 
-        outflows = sum(t.amount for t in transactions if t.transaction_type.strip().lower() == 'debit')
+        direction = func.lower(func.trim(SessionTransaction.transaction_type))
+        closing_balance = (
+            select(func.coalesce(func.sum(SessionAccount.current_balance), 0))
+            .where(SessionAccount.session_id == session.id)
+            .scalar_subquery()
+        )
+        stmt = (
+            select(
+                func.coalesce(func.sum(SessionTransaction.amount).filter(direction == 'credit'), 0).label("inflow"),
+                func.coalesce(func.sum(SessionTransaction.amount).filter(direction == 'debit'), 0).label("outflow"),
+                func.coalesce(func.sum(SessionTransaction.amount).filter(
+                    SessionTransaction.category_id == self.savings_category_id), 0).label("savings"),
+                closing_balance.label("closing_balance")
+            )
+            .join(SessionAccount, SessionTransaction.account_id == SessionAccount.id)
+            .where(SessionAccount.session_id == session.id)
+        )
+        return self.db.execute(stmt).one()
 
-        net_income = inflows - outflows
+    def get_income_flow(self, session_id: str) -> IncomeFlowOut:
+        cash_flow = self.get_session_summary(session_id) or self.get_cash_flow(session_id)
+        inflows = float(cash_flow.inflow)
+        outflows = float(cash_flow.outflow)
 
         return IncomeFlowOut(
-            net_income=net_income,
-            closing_balance=closing_balance,
+            net_income=inflows - outflows,
+            closing_balance=float(cash_flow.closing_balance),
             outflow=outflows,
             inflow=inflows
         )
 
     def get_spending_ratio(self, session_id: str) -> float:
-        transaction_data = self.get_transactions_from_sessions(session_id)
-        transactions = transaction_data.transactions
-        expenses = sum(t.amount for t in transactions if t.transaction_type.strip().lower() == 'debit')
-        income = sum(t.amount for t in transactions if t.transaction_type.strip().lower() == 'credit')
+        cash_flow = self.get_session_summary(session_id) or self.get_cash_flow(session_id)
+        income = float(cash_flow.inflow)
         if income <= 0:
             income = 1
-        ratio = (expenses / income) * 100
+        ratio = (float(cash_flow.outflow) / income) * 100
         return min(ratio, 200.0)
 
     def get_savings_ratio(self, session_id: str) -> float:
-        transaction_data = self.get_transactions_from_sessions(session_id)
-        transactions = transaction_data.transactions
-        savings = sum(t.amount for t in transactions if t.category_id == self.savings_category_id)
-        income = sum(t.amount for t in transactions if t.transaction_type.strip().lower() == 'credit')
+        cash_flow = self.get_session_summary(session_id) or self.get_cash_flow(session_id)
+        income = float(cash_flow.inflow)
         if income <= 0:
             income = 1
-        ratio = (savings / income) * 100
+        ratio = (float(cash_flow.savings) / income) * 100
         return min(ratio, 100.0)
 
     def budget_conscious_ration(self, session_id: str) -> float:
-        transaction_data = self.get_transactions_from_sessions(session_id)
-        volatility = self.get_volatility_risk(transaction_data.transactions)
-        return max(0, min(100, (1 - volatility) * 100))
+        return self.load_session_snapshot(session_id).budget_conscious()
 
-    def get_transactions_from_sessions(self, session_id: str) -> TransactionDataOut:
+    def load_session_snapshot(self, session_id: str) -> SessionSnapshot:
+        """
+        Load the accounts and transactions of a session, oldest transaction first, in one query each.
+        The categories come with the transactions so serializing them does not query once per row.
+        """
         session = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
 
         if not session:
@@ -306,11 +422,32 @@ class SessionTransactionService:
 
         account_ids: list[int] = [a.id for a in session_accounts]
 
-        transactions = self.db.query(SessionTransaction).filter(
-            SessionTransaction.account_id.in_(account_ids)).order_by(SessionTransaction.date.asc()).all()
+        transactions = self.db.query(SessionTransaction).options(joinedload(SessionTransaction.category)).filter(
+            SessionTransaction.account_id.in_(account_ids)).order_by(SessionTransaction.date.asc(),
+                                                                     SessionTransaction.id.asc()).all()
+        print(f"Loaded {len(transactions)} transactions of {len(session_accounts)} accounts for {session_id}.")
+        return SessionSnapshot(session_accounts, transactions)
 
-        accounts_data: list[SessionAccountOut] = [SessionAccountOut.model_validate(account) for account in
-                                                  session_accounts]
+    def get_transactions_from_sessions(self, session_id: str, snapshot: Optional[SessionSnapshot] = None,
+                                       limit: Optional[int] = None) -> TransactionDataOut:
+        """
+        :param limit: Only list the latest transactions, still oldest first. Without a snapshot only those are
+        read from the database.
+        """
+        if snapshot is None and limit is not None:
+            accounts = (self.db.query(SessionAccount).join(SessionModel, SessionAccount.session_id == SessionModel.id)
+                        .filter(SessionModel.identifier == session_id).all())
+            latest = (self.db.query(SessionTransaction).options(joinedload(SessionTransaction.category))
+                      .filter(SessionTransaction.account_id.in_([account.id for account in accounts]))
+                      .order_by(SessionTransaction.date.desc(), SessionTransaction.id.desc())
+                      .limit(limit).all())
+            transactions = latest[::-1]
+        else:
+            snapshot = snapshot or self.load_session_snapshot(session_id)
+            accounts = snapshot.accounts
+            transactions = snapshot.transactions if limit is None else snapshot.transactions[-limit:]
+
+        accounts_data: list[SessionAccountOut] = [SessionAccountOut.model_validate(account) for account in accounts]
 
         transaction_data: list[SessionTransactionOut] = [SessionTransactionOut.model_validate(transaction) for
                                                          transaction in transactions]
@@ -321,38 +458,21 @@ class SessionTransactionService:
         )
         return data
 
-    def get_risk_data(self, session_id: str) -> RiskOut:
+    def get_risk_data(self, session_id: str, snapshot: Optional[SessionSnapshot] = None) -> RiskOut:
         try:
             print(f"Getting risk data for: {session_id}")
-            transaction_data = self.get_transactions_from_sessions(session_id)
-            print(f"Found {len(transaction_data.transactions)} transactions to get risk data.")
-            print(f"Found {len(transaction_data.accounts)} accounts to get risk data.")
-            session_accounts = transaction_data.accounts
-            transactions = transaction_data.transactions
-            if len(transactions) <= 0:
+            snapshot = snapshot or self.load_session_snapshot(session_id)
+            if len(snapshot.transactions) <= 0:
                 return RiskOut(volatility_risk=0, concentration_risk=0, expense_risk=0, liquidity_risk=0)
 
-            account_ids: list[int] = [a.id for a in session_accounts]
-
-            closing_balance = sum(a.current_balance for a in session_accounts)
-
-            start_date = transactions[0].date
-            end_date = transactions[-1].date
-
-            difference = end_date - start_date
-
-            average_daily_outflow = self.get_income_flow(
-                session_id).outflow / difference.days if difference.days > 0 else 1
-            income_by_category = self.get_income_by_category(account_ids)
-
-            liquidy_risk = float(closing_balance / average_daily_outflow)
+            liquidy_risk = snapshot.liquidity_risk()
             print(f"Liquidity Risk data for {session_id} is: {liquidy_risk}")
 
-            concentration_risk = float(income_by_category[0].amount / sum(i.amount for i in income_by_category))
+            concentration_risk = snapshot.concentration_risk()
 
-            expense_risk = self.calculate_expense_risk(transactions)
+            expense_risk = snapshot.expense_risk()
 
-            volatility_risk = self.get_volatility_risk(transactions)
+            volatility_risk = snapshot.volatility_risk()
 
             return RiskOut(
                 volatility_risk=volatility_risk,
@@ -375,6 +495,7 @@ class SessionTransactionService:
                 func.lower(func.trim(SessionTransaction.transaction_type)) == 'credit',
                 SessionTransaction.account_id.in_(account_ids))
             .group_by(Category.id, Category.name, Category.icon)
+            .order_by(func.sum(SessionTransaction.amount).desc())
         )
         results = self.db.execute(stmt).all()
         data: list[TransactionCategoryOut] = []
@@ -512,6 +633,7 @@ class SessionTransactionService:
                 func.lower(func.trim(SessionTransaction.transaction_type)) == 'debit',
                 SessionTransaction.account_id.in_(account_ids))
             .group_by(Category.id, Category.name, Category.icon)
+            .order_by(func.sum(SessionTransaction.amount).desc())
         )
         results = self.db.execute(stmt).all()
         data: list[TransactionCategoryOut] = []
@@ -528,6 +650,8 @@ class SessionTransactionService:
         return data
 
     def calculate_weekly_trend(self, session_id: str) -> WeeklyTrend:
+        if self.get_session_summary(session_id) is not None:
+            return self.get_weekly_trend_from_rollups(session_id)
 
         session_record = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
         accounts = self.db.query(SessionAccount).filter(SessionAccount.session_id == session_record.id).all()
@@ -539,103 +663,157 @@ class SessionTransactionService:
         return WeeklyTrend(income_trend=income_trend, expense_trend=expense_trend)
 
     def calculate_expense_risk(self, transactions: list[SessionTransactionOut]) -> float:
-
-        start_date = transactions[0].date
-        end_date = transactions[-1].date
-
-        delta = end_date - start_date
-        weeks = delta.days // 7
-        print("There are {} Weeks to calculate expense risk.".format(weeks))
-        if weeks <= 0:
-            return 0
-
-        week_expenses = []
-        for i in range(1, weeks + 1):
-
-            weights = 10 * (i - 1)
-            begin_at = start_date
-            if i > 1:
-                # pick the first date of the next week expense as the last date + 1
-                begin_at = week_expenses[-1][1] + timedelta(days=1)
-
-            end_date = begin_at + timedelta(days=7)
-
-            total_amount_this_week = sum(i.amount for i in transactions if
-                                         begin_at.date() <= i.date.date() <= end_date.date() and i.transaction_type.strip().lower() == 'debit')
-
-            week_expenses.append((begin_at, end_date, total_amount_this_week, weights))
-        risk_score_sum = 0
-
-        weights = [expense[3] for expense in week_expenses]
-        total_weight = sum(weights)
-        if total_weight == 0:
-            total_weight = 1
-
-        normalized_weights = [w / total_weight for w in weights]
-        for index, expense in enumerate(week_expenses):
-
-            if index <= 0:
-                continue
-
-            previous_week_expense = week_expenses[index - 1][2]
-            current_week_expense = week_expenses[index][2]
-            if previous_week_expense == 0:
-                if current_week_expense == 0:
-                    expense_growth = 0
-                else:
-                    expense_growth = 100
-            elif current_week_expense == 0:
-                expense_growth = 0
-            else:
-                expense_growth = ((current_week_expense - previous_week_expense) / previous_week_expense) * 100
-
-            risk_score_sum += round(expense_growth, 2) * normalized_weights[index]
-
-        expense_risk_score = risk_score_sum / weeks
-        print("Expense Risk is: {}".format(expense_risk_score))
-        return expense_risk_score
-
-    def get_volatility_risk(self, transactions: list[SessionTransactionOut]) -> float:
-
-        transaction_amounts = [transaction.amount for transaction in transactions if
-                               transaction.transaction_type.strip().lower() == 'debit']
-        if len(transaction_amounts) == 0:
-            return 0.0
-        sd_spending = float(np.std(transaction_amounts))
-        average_spending: float = stats.mean(transaction_amounts)
-        if average_spending == 0:
-            return 0.0
-
-        volatility_risk = sd_spending / average_spending
-        print("Volatility Risk is: {}".format(volatility_risk))
-        scaled_risk = np.log1p(volatility_risk) / np.log1p(10)  # normalize roughly to 0–1 range
-        scaled_risk = min(scaled_risk, 1)
-        return scaled_risk
+        return SessionSnapshot([], transactions).expense_risk()
 
     def calculate_financial_position(self, session_id: str) -> FinancialProfileDataIn:
-        income_flow = self.get_income_flow(session_id)
+        summary = self.get_session_summary(session_id)
+        if summary is not None:
+            return self.get_financial_position_from_rollups(session_id, summary)
+        # Every figure comes from the same snapshot, the session is read once
+        snapshot = self.load_session_snapshot(session_id)
+        income_flow = snapshot.income_flow()
         print("Income Flow is: {}".format(income_flow))
         spending_profile = SpendingProfileOut(
-            spending_ratio=self.get_spending_ratio(session_id),
-            savings_ratio=self.get_savings_ratio(session_id),
-            budget_conscious=self.budget_conscious_ration(session_id)
+            spending_ratio=snapshot.spending_ratio(),
+            savings_ratio=snapshot.savings_ratio(self.savings_category_id),
+            budget_conscious=snapshot.budget_conscious()
         )
         print("Spending Profile is: {}".format(spending_profile))
-        transactions = self.get_transactions_from_sessions(session_id)
+        transactions = self.get_transactions_from_sessions(session_id, snapshot,
+                                                           limit=self.financial_position_transactions)
         print("Done with transactions to get transactions from sessions.")
-        account_ids = [account.id for account in transactions.accounts]
-        risk_data = self.get_risk_data(session_id)
+        risk_data = self.get_risk_data(session_id, snapshot)
         print("Risk data for session {}: {}".format(session_id, risk_data))
         return FinancialProfileDataIn(
             session_id=session_id,
             income_flow=income_flow,
             risk=risk_data,
             spending_profile=spending_profile,
-            income_categories=self.get_income_by_category(account_ids),
-            expense_categories=self.get_expenses_by_category(account_ids),
+            income_categories=snapshot.income_by_category(),
+            expense_categories=snapshot.expenses_by_category(),
             transactions=transactions
         )
 
+    def build_session_rollups(self, session_id: str) -> bool:
+        """
+        Write the daily, weekly and monthly totals per category and direction and the financial position
+        metrics of a session into session_rollups and session_summaries, replacing earlier ones. Once the session
+        is done the dashboard reads come from these instead of its transactions.
+        """
+        try:
+            session_record = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
+            snapshot = self.load_session_snapshot(session_id)
+            risk = self.get_risk_data(session_id, snapshot)
+            if risk is None:
+                raise ValueError(f"Unable to compute the risk data of session {session_id}")
+
+            self.db.query(SessionRollup).filter(SessionRollup.session_id == session_record.id).delete()
+            self.db.query(SessionSummary).filter(SessionSummary.session_id == session_record.id).delete()
+            rollups = [dict(row, session_id=session_record.id) for row in snapshot.rollups()]
+            if rollups:
+                self.db.execute(insert(SessionRollup), rollups)
+            self.db.add(SessionSummary(
+                session_id=session_record.id,
+                transaction_count=len(snapshot.transactions),
+                inflow=snapshot.inflow,
+                outflow=snapshot.outflow,
+                savings=snapshot.savings(self.savings_category_id),
+                closing_balance=snapshot.closing_balance,
+                spending_ratio=snapshot.spending_ratio(),
+                savings_ratio=snapshot.savings_ratio(self.savings_category_id),
+                budget_conscious=snapshot.budget_conscious(),
+                liquidity_risk=risk.liquidity_risk,
+                concentration_risk=risk.concentration_risk,
+                expense_risk=risk.expense_risk,
+                volatility_risk=risk.volatility_risk
+            ))
+            self.db.commit()
+            print(f"Built {len(rollups)} rollups for session {session_id}.")
+            return True
+        except Exception as e:
+            print(f"Error building the rollups of session {session_id}: {e}")
+            self.db.rollback()
+            return False
+
+    def get_session_summary(self, session_id: str) -> Optional[SessionSummary]:
+        """
+        :return: The summary built at the end of the session's last ingest, None when no rollups were built
+        for it or when its accounts were ingested after them, in which case reads are computed from its
+        transactions. Analyzing the session does not change its transactions, the summary still holds.
+        """
+        newer_account = exists().where(SessionAccount.session_id == SessionSummary.session_id,
+                                       SessionAccount.created_at > SessionSummary.created_at)
+        return (
+            self.db.query(SessionSummary)
+            .join(SessionModel, SessionSummary.session_id == SessionModel.id)
+            .filter(SessionModel.identifier == session_id, ~newer_account)
+            .first()
+        )
+
+    def get_weekly_trend_from_rollups(self, session_id: str) -> WeeklyTrend:
+        rows = (
+            self.db.query(SessionRollup.period_start, SessionRollup.direction, SessionRollup.total_amount,
+                          Category.id.label("category_id"), Category.name.label("category_name"))
+            .join(Category, SessionRollup.category_id == Category.id)
+            .join(SessionModel, SessionRollup.session_id == SessionModel.id)
+            .filter(SessionModel.identifier == session_id, SessionRollup.period == "week")
+            .order_by(SessionRollup.period_start)
+            .all()
+        )
+        trends = {"credit": defaultdict(list), "debit": defaultdict(list)}
+        for row in rows:
+            trends[row.direction][row.period_start].append(TransactionCategoryOut(
+                category_id=row.category_id,
+                category_name=row.category_name,
+                amount=float(row.total_amount)
+            ))
+
+        def weeks(weekly_data) -> list[TransactionWeekCategoryOut]:
+            return [TransactionWeekCategoryOut(week_starting=week_start.strftime("%Y-%m-%d"),
+                                               week_ending=(week_start + timedelta(days=6)).strftime("%Y-%m-%d"),
+                                               categories=categories)
+                    for week_start, categories in weekly_data.items()]
+
+        return WeeklyTrend(income_trend=weeks(trends["credit"]), expense_trend=weeks(trends["debit"]))
+
+    def get_category_totals_from_rollups(self, session_id: str, direction: str) -> list[TransactionCategoryOut]:
+        total_amount = func.sum(SessionRollup.total_amount)
+        rows = (
+            self.db.query(Category.id.label("category_id"), Category.name.label("category_name"),
+                          Category.icon.label("category_icon"), total_amount.label("total_amount"))
+            .join(Category, SessionRollup.category_id == Category.id)
+            .join(SessionModel, SessionRollup.session_id == SessionModel.id)
+            .filter(SessionModel.identifier == session_id, SessionRollup.period == "month",
+                    SessionRollup.direction == direction)
+            .group_by(Category.id, Category.name, Category.icon)
+            .order_by(total_amount.desc())
+            .all()
+        )
+        return [TransactionCategoryOut(category_id=row.category_id, category_name=row.category_name,
+                                       category_icon=row.category_icon, amount=float(row.total_amount))
+                for row in rows]
+
+    def get_financial_position_from_rollups(self, session_id: str,
+                                            summary: SessionSummary) -> FinancialProfileDataIn:
+        return FinancialProfileDataIn(
+            session_id=session_id,
+            income_flow=IncomeFlowOut(net_income=summary.inflow - summary.outflow,
+                                      closing_balance=summary.closing_balance,
+                                      outflow=summary.outflow,
+                                      inflow=summary.inflow),
+            risk=RiskOut(volatility_risk=summary.volatility_risk,
+                         concentration_risk=summary.concentration_risk,
+                         expense_risk=summary.expense_risk,
+                         liquidity_risk=summary.liquidity_risk),
+            spending_profile=SpendingProfileOut(spending_ratio=summary.spending_ratio,
+                                                savings_ratio=summary.savings_ratio,
+                                                budget_conscious=summary.budget_conscious),
+            income_categories=self.get_category_totals_from_rollups(session_id, "credit"),
+            expense_categories=self.get_category_totals_from_rollups(session_id, "debit"),
+            # Only the latest transactions are listed, read straight off the session's transactions
+            transactions=self.get_transactions_from_sessions(session_id, limit=self.financial_position_transactions)
+        )
+
     def get_balance(self, account_id: int) -> str | None:
         print("Getting balance for account {}".format(account_id))
         account = self.db.query(SessionAccount).filter(SessionAccount.id == account_id).first()
@@ -706,17 +884,21 @@ class SessionTransactionService:
         return [SessionBeneficiaryOut.model_validate(b) for b in beneficiaries]
 
     def get_transfers(self, session_id: str, limit: int = 10) -> list[SessionTransactionOut]:
-        session_record = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
-        accounts = self.db.query(SessionAccount).filter(SessionAccount.session_id == session_record.id).all()
-        account_ids = [account.id for account in accounts]
-
-        transactions = self.db.query(SessionTransaction).filter(
-            SessionTransaction.account_id.in_(account_ids),
-            func.lower(func.trim(SessionTransaction.transaction_type)) == 'debit'
-        ).all()
+        transactions = (
+            self.db.query(SessionTransaction)
+            .join(SessionAccount, SessionTransaction.account_id == SessionAccount.id)
+            .join(SessionModel, SessionAccount.session_id == SessionModel.id)
+            .options(joinedload(SessionTransaction.session_account), joinedload(SessionTransaction.category))
+            .filter(
+                SessionModel.identifier == session_id,
+                func.lower(func.trim(SessionTransaction.transaction_type)) == 'debit'
+            )
+            .order_by(SessionTransaction.amount.desc())
+            .limit(limit)
+            .all()
+        )
 
-        return [SessionTransactionOut.model_validate(t) for t in
-                sorted(transactions, key=lambda x: x.amount, reverse=True)[:limit]]
+        return [SessionTransactionOut.model_validate(t) for t in transactions]
 
     def get_recurring_payments(self, session_id: str, limit: int = 10) -> list[SessionTransactionOut]:
         session_record = self.db.query(SessionModel).filter(SessionModel.identifier == session_id).first()
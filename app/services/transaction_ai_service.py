@@ -1,16 +1,13 @@
 from typing import List
 
 import chromadb
-from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
 from langchain.chains.llm import LLMChain
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from openai import OpenAI
 
 from app.data.account import TransactionOut
 from app.data.transaction_insight import Insights, Insight
@@ -18,6 +15,7 @@ from app.data.user import UserOut
 from app.models.account import TransactionInsight
 from app.services.transaction_service import TransactionService
 from app.util.chroma_db import get_chroma_db
+from app.util.llm_gateway import chat_model, embedding_function, openai_client
 import os
 
 load_dotenv(override=True)
@@ -30,13 +28,10 @@ class TransactionAIService:
         self.client = get_chroma_db()
         self.api_key = os.getenv('CHAT_GPT_KEY')
         self.insight_days = os.getenv('INSIGHT_DAYS',300)
-        self.openai_client = OpenAI(api_key=os.getenv('CHAT_GPT_KEY'))
+        self.openai_client = openai_client()
 
     def get_collection(self):
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.api_key,
-            model_name="text-embedding-3-small"
-        )
+        openai_ef = embedding_function(model="text-embedding-3-small")
         collection = self.client.get_collection(name="transactions_insights", embedded=openai_ef)
         return collection
 
@@ -140,7 +135,7 @@ class TransactionAIService:
                             - "action" (string or null)
                 """)
 
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=1000, openai_api_key=self.api_key)
+        llm = chat_model(model="gpt-4o-mini", temperature=0, max_tokens=1000)
         chain = LLMChain(llm=llm, prompt=prompt_template, output_parser=parser)
         response = chain.invoke({"transaction_documents": documents})
         print(response['text'].root)
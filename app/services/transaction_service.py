@@ -1,6 +1,6 @@
+import asyncio
 from datetime import datetime
 import json
-import time
 from dateutil.relativedelta import relativedelta
 
 from dotenv import load_dotenv
@@ -304,17 +304,12 @@ class TransactionService:
                 print("No transactions to categorize.")
                 return True
 
+            category_ids = asyncio.run(self.ai_service.categorize_transactions_batch(transactions, categories))
             for transaction in transactions:
-                # Here you would implement your logic to categorize the transaction
-                # For example, you could use a machine learning model or a set of rules
-                # For now, we'll just print the transaction
-                print(f"Categorizing transaction: {transaction.id} - {transaction.description}")
-                # Example categorization logic (to be replaced with actual logic)
-                category_id = self.ai_service.categorize_transaction(transaction, categories)
-                transaction.category_id = category_id
-                self.db.commit()
-                self.db.refresh(transaction)
-                time.sleep(5)
+                if transaction.id in category_ids:
+                    transaction.category_id = category_ids[transaction.id]
+            self.db.commit()
+            print(f"Categorized {len(category_ids)} of {len(transactions)} transactions.")
 
             return True
         except Exception as e:
@@ -0,0 +1,101 @@
+import hashlib
+import re
+from typing import Optional
+
+from app.util.redis import get_redis
+
+# Bump when the categorization prompt changes so answers to the old prompt are not served from the cache
+CATEGORY_CACHE_VERSION = "2"
+
+MONTHS = r'(?:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)[A-Z]*'
+DATE_PATTERN = re.compile(r'\b\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}\b|\b\d{1,2}[- ]?' + MONTHS + r'[- ,]*\d{2,4}\b|'
+                          r'\b' + MONTHS + r' \d{1,2},? \d{4}\b')
+AMOUNT_PATTERN = re.compile(r'(?:NGN|USD|₦|\$)\s*[\d,]+(?:\.\d+)?|\b\d[\d,]*\.\d{2}\b')
+# Reference numbers, session ids, card and phone numbers: tokens that are all digits, carry a run of four or more
+# digits, or are eight characters or longer with a digit in them. Short words with a digit are usually names,
+# BET9JA, 1XBET or 9MOBILE, and stay
+REFERENCE_PATTERN = re.compile(r'\b(?:\d+|[A-Z0-9]*\d{4,}[A-Z0-9]*|(?=[A-Z]*\d)[A-Z0-9]{8,})\b')
+
+
+def normalize_category_narration(description: Optional[str]) -> str:
+    """
+    Reduce a narration to the part that decides its category, so "POS PURCHASE SHOPRITE 12/03/24 REF 0012"
+    and "POS PURCHASE SHOPRITE 15/04/24 REF 0913" share one cache entry.
+    """
+    narration = (description or "").upper()
+    narration = DATE_PATTERN.sub(" ", narration)
+    narration = AMOUNT_PATTERN.sub(" ", narration)
+    narration = re.sub(r'[^A-Z0-9 ]', ' ', narration)
+    narration = REFERENCE_PATTERN.sub(" ", narration)
+    return re.sub(r'\s+', ' ', narration).strip()
+
+
+def category_table_version(categories) -> str:
+    # Any change to the category table gives new keys, so answers naming a removed category are never reused
+    digest = hashlib.sha1(CATEGORY_CACHE_VERSION.encode("utf-8"))
+    for category in sorted(categories, key=lambda c: c.id):
+        digest.update(f"|{category.id}:{category.name}:{category.description}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class CategoryCache:
+    """
+    Redis memo of narration to category ID shared by every session. Keys are the normalized narration and
+    transaction type under the current category table version, hits and misses are counted per version in
+    a Redis hash so the hit rate can be followed over time.
+    """
+
+    def __init__(self, categories, ttl_seconds: int = 60 * 60 * 24 * 30):
+        self.redis = get_redis()
+        self.version = category_table_version(categories)
+        self.ttl_seconds = ttl_seconds
+        self.stats_key = f"category_cache:stats:{self.version}"
+
+    def key(self, narration: str, transaction_type: Optional[str]) -> Optional[str]:
+        if not narration:
+            return None
+        digest = hashlib.sha1(f"{(transaction_type or '').lower()}|{narration}".encode("utf-8")).hexdigest()
+        return f"category_cache:{self.version}:{digest}"
+
+    def get_many(self, keys: list[str]) -> dict[str, int]:
+        if not keys:
+            return {}
+        try:
+            values = self.redis.mget(keys)
+        except Exception as e:
+            print(f"Error reading the category cache: {e}")
+            return {}
+        found = {key: int(value) for key, value in zip(keys, values) if value is not None}
+        self.record(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, categories: dict[str, int]):
+        if not categories:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key, category_id in categories.items():
+                pipeline.set(key, category_id, ex=self.ttl_seconds)
+            pipeline.execute()
+        except Exception as e:
+            print(f"Error writing the category cache: {e}")
+
+    def record(self, hits: int, misses: int):
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.hincrby(self.stats_key, "hits", hits)
+            pipeline.hincrby(self.stats_key, "misses", misses)
+            pipeline.expire(self.stats_key, self.ttl_seconds)
+            pipeline.execute()
+        except Exception as e:
+            print(f"Error recording category cache stats: {e}")
+
+    def stats(self) -> dict:
+        try:
+            values = self.redis.hgetall(self.stats_key)
+        except Exception as e:
+            print(f"Error reading category cache stats: {e}")
+            values = {}
+        hits, misses = int(values.get("hits", 0)), int(values.get("misses", 0))
+        return {"version": self.version, "hits": hits, "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None}
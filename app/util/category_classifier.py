@@ -0,0 +1,92 @@
+import os
+import time
+from collections import Counter
+from typing import Optional
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from app.util.category_cache import normalize_category_narration
+
+LATEST_FILE = "LATEST"
+
+# Loaded classifiers by path, a worker only reads a model from disk again after a new one is trained
+_loaded: dict[str, "CategoryClassifier"] = {}
+
+
+def classifier_text(description: Optional[str], transaction_type: Optional[str]) -> str:
+    return f"{(transaction_type or '').lower()} {normalize_category_narration(description)}"
+
+
+class CategoryClassifier:
+    """
+    Character n-gram TF-IDF and logistic regression over narrations the LLM already categorized.
+    Predictions come with the model's probability so callers can send the uncertain ones to the LLM.
+    """
+
+    def __init__(self, pipeline: Pipeline, version: str, samples: int):
+        self.pipeline = pipeline
+        self.version = version
+        self.samples = samples
+
+    @classmethod
+    def train(cls, texts: list[str], labels: list[int], min_samples_per_category: int = 3) \
+            -> Optional["CategoryClassifier"]:
+        counts = Counter(labels)
+        rows = [(text, label) for text, label in zip(texts, labels) if counts[label] >= min_samples_per_category]
+        if len({label for _, label in rows}) < 2:
+            print(f"Not enough labelled transactions to train a category classifier: {len(rows)} rows")
+            return None
+
+        pipeline = Pipeline([
+            ("tfidf", TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), min_df=2, sublinear_tf=True,
+                                      dtype=np.float32)),
+            ("model", LogisticRegression(max_iter=1000, C=10)),
+        ])
+        pipeline.fit([text for text, _ in rows], [label for _, label in rows])
+        return cls(pipeline, version=time.strftime("%Y%m%d%H%M%S"), samples=len(rows))
+
+    def predict(self, texts: list[str]) -> list[tuple[int, float]]:
+        if not texts:
+            return []
+        probabilities = self.pipeline.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        classes = self.pipeline.classes_
+        return [(int(classes[index]), float(probabilities[row, index])) for row, index in enumerate(best)]
+
+    def save(self, directory: str, keep_versions: int = 5) -> str:
+        os.makedirs(directory, exist_ok=True)
+        filename = f"category-classifier-{self.version}.joblib"
+        joblib.dump({"pipeline": self.pipeline, "version": self.version, "samples": self.samples},
+                    os.path.join(directory, filename))
+        # Point LATEST at the new model only once it is fully written, readers never see a partial file
+        pointer = os.path.join(directory, f".{LATEST_FILE}.tmp")
+        with open(pointer, "w") as fp:
+            fp.write(filename)
+        os.replace(pointer, os.path.join(directory, LATEST_FILE))
+        # Keep a few previous versions around to roll back to by editing LATEST
+        versions = sorted(name for name in os.listdir(directory)
+                          if name.startswith("category-classifier-") and name.endswith(".joblib"))
+        for name in versions[:-keep_versions]:
+            os.remove(os.path.join(directory, name))
+        return filename
+
+    @classmethod
+    def load_latest(cls, directory: str) -> Optional["CategoryClassifier"]:
+        try:
+            with open(os.path.join(directory, LATEST_FILE)) as fp:
+                path = os.path.join(directory, fp.read().strip())
+        except FileNotFoundError:
+            return None
+        if path not in _loaded:
+            try:
+                data = joblib.load(path)
+            except Exception as e:
+                print(f"Unable to load the category classifier {path}: {e}")
+                return None
+            _loaded.clear()
+            _loaded[path] = cls(data["pipeline"], version=data["version"], samples=data["samples"])
+        return _loaded[path]
@@ -0,0 +1,81 @@
+import re
+from collections import Counter
+from typing import Callable, Optional
+
+# The engine for the current rules, rebuilt only when the rules table changes
+_engine: Optional["CategoryRuleEngine"] = None
+
+
+def normalize_rule_text(value: Optional[str]) -> str:
+    return re.sub(r'\s+', ' ', (value or "").upper()).strip()
+
+
+class CategoryRuleEngine:
+    """
+    Matches narrations against keyword and regular expression rules in bulk. All keywords are compiled into
+    a single alternation, so a narration is scanned once whatever the number of keyword rules; regular
+    expression rules are tried one by one. When several rules match the highest priority wins, then the
+    lowest rule id, so results do not depend on the order rules were loaded in.
+    """
+
+    def __init__(self, rules: list, version: Optional[tuple] = None):
+        self.version = version
+        self.keyword_rules: dict[str, list] = {}
+        self.regex_rules = []
+        for rule in rules:
+            if rule.match_type == "regex":
+                try:
+                    self.regex_rules.append((re.compile(rule.pattern, re.IGNORECASE), rule))
+                except re.error as e:
+                    print(f"Skipping category rule {rule.id}, invalid pattern {rule.pattern!r}: {e}")
+            elif normalize_rule_text(rule.pattern):
+                self.keyword_rules.setdefault(normalize_rule_text(rule.pattern), []).append(rule)
+
+        # Longest keywords first so "SMS ALERT CHARGES" is not shadowed by "SMS ALERT"
+        keywords = sorted(self.keyword_rules, key=len, reverse=True)
+        self.keyword_pattern = re.compile(
+            r'(?<![A-Z0-9])(?:' + "|".join(re.escape(keyword) for keyword in keywords) + r')(?![A-Z0-9])'
+        ) if keywords else None
+
+    def match(self, description: Optional[str], transaction_type: Optional[str]):
+        narration = normalize_rule_text(description)
+        if not narration:
+            return None
+        transaction_type = (transaction_type or "").lower()
+        candidates = []
+        if self.keyword_pattern is not None:
+            for keyword in {m.group(0) for m in self.keyword_pattern.finditer(narration)}:
+                candidates.extend(self.keyword_rules[keyword])
+        candidates.extend(rule for pattern, rule in self.regex_rules if pattern.search(narration))
+        candidates = [rule for rule in candidates
+                      if not rule.transaction_type or rule.transaction_type.lower() == transaction_type]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda rule: (-rule.priority, rule.id))
+
+    def categorize(self, transactions: list) -> tuple[dict[int, int], Counter]:
+        """
+        :return: Category ID by transaction ID for the transactions a rule matched, and how many transactions
+        each rule matched by rule id.
+        """
+        categorized = {}
+        fired = Counter()
+        for transaction in transactions:
+            rule = self.match(transaction.description, transaction.transaction_type)
+            if rule is not None:
+                categorized[transaction.id] = rule.category_id
+                fired[rule.id] += 1
+        return categorized, fired
+
+
+def get_rule_engine(version: tuple, load_rules: Callable[[], list]) -> CategoryRuleEngine:
+    """
+    Return the engine for the given rules table version, loading and compiling the rules again only when the
+    version differs from the one the current engine was built from. Edited rules apply without a restart.
+    """
+    global _engine
+    if _engine is None or _engine.version != version:
+        _engine = CategoryRuleEngine(load_rules(), version)
+        print(f"Loaded {sum(len(r) for r in _engine.keyword_rules.values()) + len(_engine.regex_rules)} "
+              f"category rules")
+    return _engine
@@ -0,0 +1,93 @@
+import re
+from typing import NamedTuple, Optional
+
+# What banks print before a name: the bank or wallet of the account and its number, "ACCESS BANK JANE DOE",
+# "GTB 0123456789 JANE DOE"
+NAME_PREFIX = (r"(?:(?:(?:[A-Z]+\s+){1,2}BANK(?:\s+PLC)?|GTB|GTBANK|UBA|ZIB|FBN|FCMB|ECOBANK|OPAY|PALMPAY|KUDA|"
+               r"MONIEPOINT|PAGA)\s*[/-]?\s*)?(?:\d{6,}\s*[/-]?\s*)?")
+# Where a name stops: separators, references, bank suffixes and purpose phrases banks append after it
+NAME = r"(?P<{}>[A-Z][A-Z .,'&-]*?)"
+NAME_END = (r"(?=\s*(?:$|[/|(:;*]|-(?:\s|REF|\w*\d)|\d|"
+            r"\b(?:REF|SESSION|FOR|BEING|VIA|NARR|RMK|RMKS|ON|FRM|FROM|TO|OPAY|PALMPAY|MONIEPOINT|KUDA|PAGA|MOBILE|"
+            r"APP|USSD)\b))")
+
+# Words that are channels or banks rather than people or businesses
+NOT_A_NAME = {"NIP", "TRF", "TRANSFER", "MOB", "MOBILE", "WEB", "USSD", "POS", "ATM", "OPAY", "PALMPAY", "KUDA",
+              "MONIEPOINT", "PAGA", "GTB", "GTBANK", "UBA", "ZENITH", "ZIB", "ACCESS", "FIRST", "BANK", "FBN", "FCMB",
+              "STERLING", "WEMA", "ALAT", "UNION", "FIDELITY", "STANBIC", "ECOBANK", "POLARIS", "KEYSTONE", "NIBSS",
+              "CR", "DR", "INWARD", "OUTWARD", "ACCOUNT", "ACCT", "SELF", "MY", "WALLET", "CASH", "FUND", "FUNDS"}
+
+
+class NarrationGrammar(NamedTuple):
+    """
+    A bank narration template. The pattern names the sender and/or the recipient, or only the counterparty
+    when the template is the same for both directions and the transaction type says which one it is.
+    """
+    name: str
+    pattern: re.Pattern
+
+
+def grammar(name: str, template: str) -> NarrationGrammar:
+    for group in ("sender", "recipient", "counterparty"):
+        template = template.replace("{" + group + "}", NAME_PREFIX + NAME.format(group) + NAME_END)
+    return NarrationGrammar(name, re.compile(template))
+
+
+# Most specific first, the first grammar that yields a usable name wins
+GRAMMARS = [
+    # TRF FROM JOHN DOE TO JANE SMITH, FRM JOHN DOE TO JANE SMITH
+    grammar("from_to", r"\b(?:TRF\s+|TRANSFER\s+)?FR(?:O)?M\s+{sender}\s+TO\s+{recipient}"),
+    # NIP/ZENITH/JANE SMITH/000123, NIP CR/MOB/JANE SMITH/REF
+    grammar("nip_slashed", r"^(?:[A-Z]{2,6}/)?NIP(?:\s+[CD]R)?/(?:[A-Z ]+/)?{counterparty}/"),
+    # FIP:JOHN DOE/ TRF TO JANE SMITH, FBN MOBILE: JOHN DOE/ TO JANE SMITH
+    grammar("first_bank", r"^(?:FIP|FBN\s+MOBILE|FIRSTMOBILE)\s*:\s*{sender}\s*/\s*(?:TRF\s+)?TO\s+{recipient}"),
+    # MOB TRF 0123 TO JANE SMITH, MOBILE/UNION TRANSFER TO JANE SMITH, NIP TRF TO JANE SMITH,
+    # WEB TRANSFER TO JANE SMITH, USSD TRF TO JANE SMITH
+    grammar("channel_to", r"\b(?:NIP|MOB|MOBILE(?:/[A-Z]+)?|WEB|USSD|INTERNET|APP|IB)\s+(?:TRF|TRANSFER)\b[\w /-]*?"
+                          r"\bTO\s+{recipient}"),
+    # NIP TRF FROM TUNDE BAKARE, MOB TRF FROM JANE SMITH
+    grammar("channel_from", r"\b(?:NIP|MOB|MOBILE(?:/[A-Z]+)?|WEB|USSD|INTERNET|APP|IB)\s+(?:TRF|TRANSFER)\b[\w /-]*?"
+                            r"\bFROM\s+{sender}"),
+    # TRANSFER TO JANE SMITH | OPAY, TRF TO ADAEZE NWOSU FOR RENT
+    grammar("transfer_to", r"\b(?:TRF|TRANSFER|SENT)\s+TO\s+{recipient}"),
+    # TRANSFER FROM JANE SMITH, TRF FRM JANE SMITH, RECEIVED FROM JANE SMITH
+    grammar("transfer_from", r"\b(?:TRF|TRANSFER|RECEIVED)\s+FR(?:O)?M\s+{sender}"),
+    # OPAY/JANE SMITH/..., PALMPAY-JANE SMITH-..., KUDA/JANE SMITH
+    grammar("wallet", r"^(?:OPAY|PALMPAY|KUDA|MONIEPOINT|PAGA)\s*[/-]\s*{counterparty}(?:\s*[/-]|$)"),
+]
+
+
+def normalize_narration(narration: Optional[str]) -> str:
+    return re.sub(r'\s+', ' ', (narration or "").upper()).strip()
+
+
+def clean_name(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    name = re.sub(r"[\s.,'&-]+$", "", re.sub(r'\s+', ' ', name)).strip(" .,-")
+    words = name.split()
+    if not words or all(word in NOT_A_NAME for word in words) or sum(c.isalpha() for c in name) < 3:
+        return None
+    return name
+
+
+def parse_counterparty(narration: Optional[str], transaction_type: str = "debit") -> Optional[tuple[str, str]]:
+    """
+    Extract the other party of a transfer from its narration with the bank templates in GRAMMARS.
+    For a debit that is the recipient, for a credit the sender.
+    :return: The counterparty name and the name of the grammar that matched, None when none of them did.
+    """
+    text = normalize_narration(narration)
+    if not text:
+        return None
+    side = "sender" if (transaction_type or "").lower() == "credit" else "recipient"
+    for narration_grammar in GRAMMARS:
+        match = narration_grammar.pattern.search(text)
+        if match is None:
+            continue
+        groups = match.groupdict()
+        name = clean_name(groups.get(side) or groups.get("counterparty"))
+        if name:
+            return name, narration_grammar.name
+    return None
+
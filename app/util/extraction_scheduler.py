@@ -0,0 +1,152 @@
+import asyncio
+import random
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+
+from langchain_core.exceptions import OutputParserException
+from pydantic import ValidationError
+
+
+class PageExtractionScheduler:
+    """
+    Runs per-page extraction jobs with a concurrency cap shared by every run, so one scheduler can cover all
+    the files of an upload. Rate limits and transient API errors are handled by the LLM gateway, here a page is
+    only tried again, with exponential backoff, when its answer could not be parsed. Results are returned
+    ordered by page index and a page that keeps failing comes back as None instead of failing the whole
+    statement.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_retries: int = 4, base_delay: float = 2.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # Roughly four characters per token for English statement text
+        return max(1, len(text) // 4)
+
+    async def run(self, jobs: Union[Iterable[tuple[int, Callable[[], Awaitable[Any]]]],
+                                    AsyncIterable[tuple[int, Callable[[], Awaitable[Any]]]]]) \
+            -> list[tuple[int, Optional[Any]]]:
+        """
+        :param jobs: (page index, factory returning the coroutine to run) for every page.
+        An async iterable is consumed as it produces, each job starting as soon as it comes out.
+        :return: (page index, result or None if it failed) sorted by page index.
+        """
+
+        async def run_job(index: int, factory: Callable[[], Awaitable[Any]]):
+            async with self.semaphore:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        return index, await factory()
+                    except (OutputParserException, ValidationError) as e:
+                        if attempt == self.max_retries:
+                            print("Giving up on page {} after {} attempts: {}".format(index, attempt + 1, e))
+                            return index, None
+                        delay = self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay)
+                        print("Page {} could not be parsed ({}), retrying in {:.1f}s".format(index, e, delay))
+                        await asyncio.sleep(delay)
+                    except Exception as e:
+                        # The gateway already retried whatever was worth retrying
+                        print("Giving up on page {}: {}".format(index, e))
+                        return index, None
+
+        tasks = []
+        try:
+            if isinstance(jobs, AsyncIterable):
+                async for index, factory in jobs:
+                    tasks.append(asyncio.create_task(run_job(index, factory)))
+            else:
+                tasks = [asyncio.create_task(run_job(index, factory)) for index, factory in jobs]
+        except BaseException:
+            # The producer failed, do not leave its pages running behind the caller's back
+            for task in tasks:
+                task.cancel()
+            raise
+        results = await asyncio.gather(*tasks)
+        return sorted(results, key=lambda x: x[0])
+
+
+class PageBatcher:
+    """
+    Packs consecutive small pages into a single extraction request and splits oversized pages at line
+    boundaries, so every request stays close to the target token budget. Batches are keyed by
+    (first page index, part) which keeps them sortable back into page order.
+    """
+
+    def __init__(self, target_tokens: int = 3000, max_tokens: int = 6000):
+        self.target_tokens = target_tokens
+        self.max_tokens = max(max_tokens, target_tokens)
+
+    def split_page(self, text: str) -> list[str]:
+        if PageExtractionScheduler.estimate_tokens(text) <= self.max_tokens:
+            return [text]
+        parts, lines, tokens = [], [], 0
+        for line in text.splitlines():
+            line_tokens = PageExtractionScheduler.estimate_tokens(line)
+            if lines and tokens + line_tokens > self.target_tokens:
+                parts.append("\n".join(lines))
+                lines, tokens = [], 0
+            lines.append(line)
+            tokens += line_tokens
+        if lines:
+            parts.append("\n".join(lines))
+        return parts
+
+    def stream(self) -> "PageBatchStream":
+        return PageBatchStream(self)
+
+    def batch(self, pages: list[tuple[int, str]]) -> list[tuple[tuple[int, int], str]]:
+        """
+        :param pages: (page index, raw page text) of the pages left for the LLM, in page order.
+        :return: ((first page index, part), text) for every request to make.
+        """
+        stream = self.stream()
+        batches = [batch for index, text in pages for batch in stream.add(index, text)]
+        return batches + stream.flush()
+
+
+class PageBatchStream:
+    """
+    PageBatcher fed one page at a time, so requests can go out while later pages are still being read.
+    """
+
+    def __init__(self, batcher: PageBatcher):
+        self.batcher = batcher
+        self.current: list[str] = []
+        self.current_key: Optional[tuple[int, int]] = None
+        self.current_tokens = 0
+        self.previous_index: Optional[int] = None
+
+    def add(self, index: int, text: str) -> list[tuple[tuple[int, int], str]]:
+        """
+        :return: The batches completed by this page.
+        """
+        batches: list[tuple[tuple[int, int], str]] = []
+        # Pages parsed from their tables leave gaps, only pack pages that follow each other
+        if self.previous_index is not None and index != self.previous_index + 1:
+            batches.extend(self.flush())
+        self.previous_index = index
+
+        parts = self.batcher.split_page(text)
+        if len(parts) > 1:
+            batches.extend(self.flush())
+            batches.extend(((index, part), part_text) for part, part_text in enumerate(parts))
+            return batches
+
+        tokens = PageExtractionScheduler.estimate_tokens(text)
+        if self.current and self.current_tokens + tokens > self.batcher.target_tokens:
+            batches.extend(self.flush())
+        if self.current_key is None:
+            self.current_key = (index, 0)
+        self.current.append(text)
+        self.current_tokens += tokens
+        return batches
+
+    def flush(self) -> list[tuple[tuple[int, int], str]]:
+        if not self.current:
+            return []
+        batch = (self.current_key, "\n\n".join(self.current))
+        self.current, self.current_key, self.current_tokens = [], None, 0
+        return [batch]
@@ -0,0 +1,47 @@
+import hashlib
+import re
+from typing import Optional
+
+# Column positions are compared as a share of the page width, bucketed so small rendering shifts still match
+COLUMN_POSITION_BUCKET = 0.02
+
+
+def normalize_header(cell: Optional[str]) -> str:
+    # Drop digits so printed dates, page numbers and account numbers do not end up in the fingerprint
+    return re.sub(r'[^a-z ]', '', re.sub(r'\s+', ' ', (cell or "").lower())).strip()
+
+
+def layout_features(page) -> Optional[dict]:
+    """
+    Collect the parts of a statement page that stay the same across customers of one bank and format:
+    the header cells and column positions of the transaction table and the fonts used on the page.
+    Returns None when the page has no table to anchor on.
+    """
+    try:
+        tables = page.find_tables().tables
+    except Exception as e:
+        print("Unable to find tables for the layout of page {}: {}".format(page.number + 1, e))
+        return None
+    if not tables:
+        return None
+
+    table = max(tables, key=lambda t: t.row_count * t.col_count)
+    width = page.rect.width or 1
+    header_cells = [cell for cell in table.header.cells if cell is not None]
+    fonts = sorted({font[3].split("+")[-1] for font in page.get_fonts() if font[3]})
+    return {
+        "headers": [normalize_header(name) for name in table.header.names],
+        "columns": [round(cell[0] / width / COLUMN_POSITION_BUCKET) for cell in header_cells],
+        "fonts": fonts,
+    }
+
+
+def layout_fingerprint(page) -> Optional[str]:
+    features = layout_features(page)
+    if features is None:
+        return None
+    digest = hashlib.sha256()
+    digest.update("|".join(features["headers"]).encode("utf-8"))
+    digest.update(("#" + ",".join(str(x) for x in features["columns"])).encode("utf-8"))
+    digest.update(("#" + ",".join(features["fonts"])).encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,265 @@
+"""
+One way out to OpenAI for every API process and Celery worker.
+
+Every chat model, embedding model and OpenAI client is built here. They share pooled HTTP connections, wait
+on a Redis token bucket per model (requests and tokens per minute, shared by all processes) and retry rate
+limits, timeouts and server errors with the same exponential backoff. Interactive traffic (chat with the user)
+may use the whole bucket while background work (statement extraction, categorization, analysis) leaves a
+reserve for it, so a busy ingestion queue never starves a user waiting on a reply.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import weakref
+from typing import Optional
+
+import httpx
+import openai
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from openai import AsyncOpenAI, OpenAI
+
+from app.util.redis import get_redis
+
+load_dotenv(override=True)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+# Per model overrides, e.g. {"gpt-4o-mini": {"rpm": 5000, "tpm": 2000000}}
+MODEL_LIMITS: dict = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# Share of every bucket background work cannot use
+INTERACTIVE_RESERVE = float(os.getenv("LLM_INTERACTIVE_RESERVE", "0.2"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+# Completion tokens counted against the budget when a call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS", "1000"))
+HTTP_LIMITS = httpx.Limits(max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "50")),
+                           max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")))
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT", "120")), connect=10)
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError)
+
+# Takes from the request and token buckets of a model together or not at all. Buckets refill continuously
+# at their per minute rate; background callers may not take them below the interactive reserve.
+# Returns 0 when the call may go ahead, otherwise the milliseconds to wait before trying again.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local reserve = tonumber(ARGV[2])
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+    local capacity = tonumber(ARGV[2 + i * 2 - 1])
+    local cost = math.min(tonumber(ARGV[2 + i * 2]), capacity * (1 - reserve))
+    local state = redis.call('HMGET', KEYS[i], 'level', 'updated')
+    local level = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    level = math.min(capacity, level + (now - updated) * capacity / 60000)
+    levels[i] = {level, cost}
+    local floor = capacity * reserve
+    if level - cost < floor then
+        wait = math.max(wait, math.ceil((cost + floor - level) * 60000 / capacity))
+    end
+end
+for i = 1, 2 do
+    local level = levels[i][1]
+    if wait == 0 then
+        level = level - levels[i][2]
+    end
+    redis.call('HSET', KEYS[i], 'level', level, 'updated', now)
+    redis.call('PEXPIRE', KEYS[i], 120000)
+end
+return wait
+"""
+
+_token_bucket = None
+_http_client: Optional[httpx.Client] = None
+# One async client per event loop, Celery tasks start a new loop with every asyncio.run
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+    weakref.WeakKeyDictionary()
+
+
+def api_key() -> Optional[str]:
+    return os.getenv('CHAT_GPT_KEY')
+
+
+def model_limits(model: str) -> tuple[int, int]:
+    limits = MODEL_LIMITS.get(model, {})
+    return int(limits.get("rpm", DEFAULT_REQUESTS_PER_MINUTE)), int(limits.get("tpm", DEFAULT_TOKENS_PER_MINUTE))
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+def reserve_for(priority: str) -> float:
+    return 0.0 if priority == PRIORITY_INTERACTIVE else INTERACTIVE_RESERVE
+
+
+def try_acquire(model: str, tokens: int, priority: str) -> float:
+    """
+    :return: Seconds to wait before asking again, 0 when the request may be sent now.
+    """
+    global _token_bucket
+    requests_per_minute, tokens_per_minute = model_limits(model)
+    try:
+        if _token_bucket is None:
+            _token_bucket = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+        wait_ms = _token_bucket(keys=[f"llm_gateway:{model}:requests", f"llm_gateway:{model}:tokens"],
+                                args=[int(time.time() * 1000), reserve_for(priority),
+                                      requests_per_minute, 1, tokens_per_minute, tokens])
+    except Exception as e:
+        # Without Redis there is nothing to coordinate on, let the call through rather than stall every worker
+        print(f"LLM rate limiter unavailable, sending without it: {e}")
+        return 0
+    return int(wait_ms) / 1000
+
+
+def acquire(model: str, tokens: int, priority: str = PRIORITY_BACKGROUND):
+    while (wait := try_acquire(model, tokens, priority)) > 0:
+        time.sleep(wait)
+
+
+async def aacquire(model: str, tokens: int, priority: str = PRIORITY_BACKGROUND):
+    while (wait := await asyncio.to_thread(try_acquire, model, tokens, priority)) > 0:
+        await asyncio.sleep(wait)
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0, RETRY_BASE_DELAY)
+
+
+def call_with_retry(model: str, tokens: int, priority: str, call):
+    for attempt in range(MAX_RETRIES + 1):
+        acquire(model, tokens, priority)
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            print(f"OpenAI call to {model} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def acall_with_retry(model: str, tokens: int, priority: str, call):
+    for attempt in range(MAX_RETRIES + 1):
+        await aacquire(model, tokens, priority)
+        try:
+            return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            print(f"OpenAI call to {model} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    return _http_client
+
+
+def http_async_client() -> Optional[httpx.AsyncClient]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Built outside a loop, the OpenAI client creates its own when it is first awaited
+        return None
+    if loop not in _async_http_clients:
+        _async_http_clients[loop] = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    return _async_http_clients[loop]
+
+
+class GatewayChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that waits for the shared rate limit before every call and retries transient failures.
+    """
+
+    priority: str = PRIORITY_BACKGROUND
+
+    def estimate_call_tokens(self, messages) -> int:
+        prompt = "".join(str(message.content) for message in messages)
+        return estimate_tokens(prompt) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return call_with_retry(self.model_name, self.estimate_call_tokens(messages), self.priority,
+                               lambda: super(GatewayChatOpenAI, self)._generate(messages, stop, run_manager,
+                                                                                **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await acall_with_retry(self.model_name, self.estimate_call_tokens(messages), self.priority,
+                                      lambda: super(GatewayChatOpenAI, self)._agenerate(messages, stop, run_manager,
+                                                                                        **kwargs))
+
+
+class GatewayOpenAIEmbeddings(OpenAIEmbeddings):
+    priority: str = PRIORITY_BACKGROUND
+
+    def embed_documents(self, texts: list[str], chunk_size: Optional[int] = None, **kwargs) -> list[list[float]]:
+        return call_with_retry(self.model, sum(estimate_tokens(t) for t in texts), self.priority,
+                               lambda: super(GatewayOpenAIEmbeddings, self).embed_documents(texts, chunk_size,
+                                                                                            **kwargs))
+
+    async def aembed_documents(self, texts: list[str], chunk_size: Optional[int] = None,
+                               **kwargs) -> list[list[float]]:
+        return await acall_with_retry(self.model, sum(estimate_tokens(t) for t in texts), self.priority,
+                                      lambda: super(GatewayOpenAIEmbeddings, self).aembed_documents(
+                                          texts, chunk_size, **kwargs))
+
+
+class GatewayEmbeddingFunction(OpenAIEmbeddingFunction):
+    """
+    Chroma embedding function going through the shared rate limit and retries.
+    """
+
+    def __init__(self, *args, priority: str = PRIORITY_BACKGROUND, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.priority = priority
+
+    def __call__(self, input):
+        return call_with_retry(self.model_name, sum(estimate_tokens(str(t)) for t in input), self.priority,
+                               lambda: super(GatewayEmbeddingFunction, self).__call__(input))
+
+
+def chat_model(model: str = "gpt-4o-mini", temperature: float = 0, max_tokens: Optional[int] = None,
+               priority: str = PRIORITY_BACKGROUND, **kwargs) -> GatewayChatOpenAI:
+    # Retries are the gateway's, the OpenAI client must not retry on its own as well
+    return GatewayChatOpenAI(model=model, temperature=temperature, max_tokens=max_tokens, priority=priority,
+                             api_key=api_key(), max_retries=0, http_client=http_client(),
+                             http_async_client=http_async_client(), **kwargs)
+
+
+def embeddings(model: str = "text-embedding-3-small",
+               priority: str = PRIORITY_BACKGROUND) -> GatewayOpenAIEmbeddings:
+    return GatewayOpenAIEmbeddings(model=model, priority=priority, api_key=api_key(), max_retries=0,
+                                   http_client=http_client(), http_async_client=http_async_client())
+
+
+def embedding_function(model: str = "text-embedding-3-small",
+                       priority: str = PRIORITY_BACKGROUND) -> GatewayEmbeddingFunction:
+    return GatewayEmbeddingFunction(api_key=api_key(), model_name=model, priority=priority)
+
+
+def openai_client() -> OpenAI:
+    return OpenAI(api_key=api_key(), max_retries=0, http_client=http_client())
+
+
+def async_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=api_key(), max_retries=0, http_client=http_async_client())
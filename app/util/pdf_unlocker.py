@@ -0,0 +1,164 @@
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import md5, sha256, sha384, sha512
+from itertools import chain, islice
+from typing import Iterable, Optional
+
+from cryptography.hazmat.decrepit.ciphers.algorithms import ARC4
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import int_value, resolve1, str_value, uint_value
+from pdfminer.psparser import literal_name
+
+PASSWORD_PADDING = (b"(\xbfN^Nu\x8aAd\x00NV\xff\xfa\x01\x08"
+                    b"..\x00\xb6\xd0h>\x80/\x0c\xa9\xfedSiz")
+
+
+class _EncryptionReader(PDFDocument):
+    # Only the /Encrypt dictionary is needed, skip the password check pdfminer does while loading the trailer
+    def _initialize_password(self, password: str = "") -> None:
+        pass
+
+
+def read_encryption(file_path: str) -> Optional[dict]:
+    """
+    Read the standard security handler parameters of a PDF once, as plain values that can be sent to
+    worker processes. Returns None when the file is not encrypted or uses an unsupported handler.
+    """
+    with open(file_path, "rb") as fp:
+        document = _EncryptionReader(PDFParser(fp))
+        if document.encryption is None:
+            return None
+        docid, param = document.encryption
+        param = {key: resolve1(value) for key, value in param.items()}
+
+    if literal_name(param.get("Filter")) != "Standard":
+        return None
+    info = {
+        "v": int_value(param.get("V", 0)),
+        "r": int_value(param["R"]),
+        "p": uint_value(param["P"], 32),
+        "o": str_value(param["O"]),
+        "u": str_value(param["U"]),
+        "docid": bytes(docid[0]) if docid else b"",
+        "encrypt_metadata": bool(param.get("EncryptMetadata", True)),
+    }
+    if info["r"] >= 5:
+        return info
+    info["length"] = 128 if info["v"] == 4 else int_value(param.get("Length", 40))
+    return info
+
+
+def _rc4(key: bytes, data: bytes) -> bytes:
+    return Cipher(ARC4(key), mode=None).encryptor().update(data)
+
+
+def _hash_r6(password: bytes, salt: bytes) -> bytes:
+    # Algorithm 2.B of ISO 32000-2, the user password check does not mix in the U entry
+    k = sha256(password + salt).digest()
+    round_number = 0
+    while True:
+        k1 = (password + k) * 64
+        encryptor = Cipher(algorithms.AES(k[:16]), modes.CBC(k[16:32])).encryptor()
+        e = encryptor.update(k1) + encryptor.finalize()
+        k = (sha256, sha384, sha512)[int.from_bytes(e[:16], "big") % 3](e).digest()
+        round_number += 1
+        if round_number >= 64 and e[-1] <= round_number - 32:
+            return k[:32]
+
+
+def check_password(info: dict, password: str) -> bool:
+    """
+    Check a candidate user password against the /Encrypt parameters with a single key derivation,
+    without opening or parsing the document.
+    """
+    r = info["r"]
+    if r >= 5:
+        password_bytes = password.encode("utf-8")[:127]
+        validation_salt = info["u"][32:40]
+        if r == 5:
+            return sha256(password_bytes + validation_salt).digest() == info["u"][:32]
+        return _hash_r6(password_bytes, validation_salt) == info["u"][:32]
+
+    # Algorithm 2 (encryption key), then algorithm 4 / 5 (U entry)
+    hash = md5((password.encode("latin1", "ignore") + PASSWORD_PADDING)[:32])
+    hash.update(info["o"])
+    hash.update(struct.pack("<L", info["p"]))
+    hash.update(info["docid"])
+    if r >= 4 and not info["encrypt_metadata"]:
+        hash.update(b"\xff\xff\xff\xff")
+    key = hash.digest()
+    n = 5
+    if r >= 3:
+        n = info["length"] // 8
+        for _ in range(50):
+            key = md5(key[:n]).digest()
+    key = key[:n]
+
+    if r == 2:
+        return _rc4(key, PASSWORD_PADDING) == info["u"]
+    result = _rc4(key, md5(PASSWORD_PADDING + info["docid"]).digest())
+    for i in range(1, 20):
+        result = _rc4(bytes(c ^ i for c in key), result)
+    return result == info["u"][:16]
+
+
+def _check_chunk(info: dict, candidates: list[str], deadline: float) -> Optional[str]:
+    for index, candidate in enumerate(candidates):
+        if index % 500 == 0 and time.time() > deadline:
+            return None
+        if check_password(info, candidate):
+            return candidate
+    return None
+
+
+def _search_in_process(info: dict, candidates: Iterable[str], deadline: float, chunk_size: int) -> Optional[str]:
+    while time.time() < deadline:
+        chunk = list(islice(candidates, chunk_size))
+        if not chunk:
+            return None
+        password = _check_chunk(info, chunk, deadline)
+        if password is not None:
+            return password
+    return None
+
+
+def find_password(info: dict, candidates: Iterable[str], time_budget: float = 60,
+                  workers: Optional[int] = None, chunk_size: int = 5000) -> Optional[str]:
+    """
+    Try the candidates in order across a process pool and stop at the first match or when the time budget
+    runs out. Candidates are sent in chunks so the most likely passwords are checked first.
+    """
+    deadline = time.time() + time_budget
+    workers = workers or os.cpu_count() or 1
+    candidates = iter(candidates)
+    pending: dict = {}
+    unsubmitted: list[str] = []
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while time.time() < deadline:
+            while len(pending) < workers * 2:
+                unsubmitted = list(islice(candidates, chunk_size))
+                if not unsubmitted:
+                    break
+                pending[executor.submit(_check_chunk, info, unsubmitted, deadline)] = unsubmitted
+                unsubmitted = []
+            if not pending:
+                return None
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                if future.result() is not None:
+                    return future.result()
+        print("Password search ran out of its {}s budget".format(time_budget))
+        return None
+    except (AssertionError, OSError, BrokenProcessPool) as e:
+        # Celery prefork children are daemonic and cannot start a pool of their own
+        print("Password worker pool unavailable, checking in process: {}".format(e))
+        return _search_in_process(info, chain(unsubmitted, *pending.values(), candidates), deadline, chunk_size)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+"""
+Redis cache of the session dashboard responses.
+
+Every session has a data version counter, bumped whenever its statements are (re)processed or analyzed.
+Responses are stored as serialized JSON under the session and its current version, so a bump makes every cached
+response of the session unreachable at once and they simply expire. Concurrent identical requests compute once:
+the first takes a Redis lock for the response key, the others poll for the value it stores and only compute
+themselves when it never shows up. Redis being down only means every request computes.
+"""
+import asyncio
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.util.redis import get_redis
+
+load_dotenv(override=True)
+
+RESPONSE_TTL = int(os.getenv("SESSION_RESPONSE_CACHE_TTL", "600"))
+# How long one request may hold the right to compute a response, and how long the others wait for it
+LOCK_SECONDS = float(os.getenv("SESSION_RESPONSE_LOCK_SECONDS", "30"))
+WAIT_SECONDS = float(os.getenv("SESSION_RESPONSE_WAIT_SECONDS", "10"))
+POLL_SECONDS = 0.05
+VERSION_TTL = 60 * 60 * 24 * 30
+
+VERSION_KEY = "session_version:{}"
+RESPONSE_KEY = "session_response:{}:{}:{}"
+
+
+def session_data_version(session_id: str) -> int:
+    return int(get_redis().get(VERSION_KEY.format(session_id)) or 0)
+
+
+def bump_session_version(session_id: str) -> Optional[int]:
+    """
+    Invalidate every cached response of a session. Call after its data changed.
+    """
+    try:
+        pipeline = get_redis().pipeline(transaction=True)
+        pipeline.incr(VERSION_KEY.format(session_id))
+        pipeline.expire(VERSION_KEY.format(session_id), VERSION_TTL)
+        version, _ = pipeline.execute()
+        return version
+    except Exception as e:
+        print(f"Error bumping the data version of session {session_id}: {e}")
+        return None
+
+
+@lru_cache(maxsize=None)
+def response_adapter(response_model: Any) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+def serialize_response(result: Any, response_model: Any = None) -> bytes:
+    # The same JSON FastAPI would have sent for the endpoint's response model
+    if response_model is None:
+        return json.dumps(jsonable_encoder(result), ensure_ascii=False, allow_nan=False, indent=None,
+                          separators=(",", ":")).encode("utf-8")
+    adapter = response_adapter(response_model)
+    return adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+
+
+def json_response(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json")
+
+
+async def cached_session_response(session_id: str, endpoint: str, compute: Callable[[], Any],
+                                  response_model: Any = None, ttl_seconds: int = RESPONSE_TTL) -> Response:
+    """
+    :param session_id: Session identifier the response belongs to.
+    :param endpoint: Name of the response within the session, e.g. "insights".
+    :param compute: Builds the response when it is not cached; its errors propagate to the caller.
+    :param response_model: The endpoint's response model, used to serialize what compute returns.
+    :return: The serialized response, from the cache when the session data has not changed since it was stored.
+    """
+    redis = get_redis()
+    try:
+        key = RESPONSE_KEY.format(session_id, session_data_version(session_id), endpoint)
+        cached = redis.get(key)
+    except Exception as e:
+        print(f"Error reading the {endpoint} response cache of session {session_id}: {e}")
+        return json_response(serialize_response(compute(), response_model))
+    if cached is not None:
+        return json_response(cached.encode("utf-8"))
+
+    lock = redis.lock(f"{key}:lock", timeout=LOCK_SECONDS)
+    try:
+        acquired = lock.acquire(blocking=False)
+    except Exception as e:
+        print(f"Error locking the {endpoint} response of session {session_id}: {e}")
+        acquired = None
+
+    if acquired is False:
+        # Another request is computing it
+        deadline = time.monotonic() + WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            try:
+                cached = redis.get(key)
+                if cached is not None:
+                    return json_response(cached.encode("utf-8"))
+                if not lock.locked():
+                    break
+            except Exception as e:
+                print(f"Error waiting for the {endpoint} response of session {session_id}: {e}")
+                break
+        print(f"Computing the {endpoint} response of session {session_id} without waiting any longer")
+
+    try:
+        content = serialize_response(compute(), response_model)
+        try:
+            redis.set(key, content.decode("utf-8"), ex=ttl_seconds)
+        except Exception as e:
+            print(f"Error caching the {endpoint} response of session {session_id}: {e}")
+        return json_response(content)
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except Exception as e:
+                print(f"Error unlocking the {endpoint} response of session {session_id}: {e}")
@@ -0,0 +1,135 @@
+import hashlib
+import re
+from typing import Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from app.util.category_cache import normalize_category_narration
+from app.util.counterparty import parse_counterparty
+from app.util.redis import get_redis
+
+# Titles and suffixes that say nothing about who a name belongs to
+NAME_NOISE = {"MR", "MRS", "MS", "MISS", "DR", "ENGR", "CHIEF", "PASTOR", "ALHAJI", "ALHAJA", "PROF", "SIR", "JNR",
+              "SNR", "JR", "SR"}
+
+
+# Bump when detection changes so flags cached by the old detector are not reused
+SELF_TRANSFER_CACHE_VERSION = "2"
+
+# Words that make a narration a transfer even when none of the bank templates reads its counterparty
+TRANSFER_PATTERN = re.compile(r"\b(?:TRF|TRANSFER|TRANSFERS|NIP|FIP|MOB|USSD|FT|INWARD|OUTWARD|SENT|RECEIVED|SELF|OWN)\b")
+
+
+def name_tokens(name: Optional[str]) -> list[str]:
+    return [token for token in re.findall(r"[A-Z]+", (name or "").upper()) if token not in NAME_NOISE]
+
+
+def matches_initials(tokens: list[str], owner_tokens: list[str]) -> bool:
+    """
+    "J. A. SMITH", "SMITH J" or "JA SMITH" for "JANE ADAEZE SMITH": every full word is one of the owner's, at
+    least one is, and the single letters (or a short run of them) are initials of the owner's other words.
+    """
+    full = [token for token in tokens if len(token) > 2]
+    initials = "".join(token for token in tokens if len(token) <= 2)
+    if not full or not initials or any(token not in owner_tokens for token in full):
+        return False
+    remaining = [token[0] for token in owner_tokens if token not in full]
+    return all(initials.count(letter) <= remaining.count(letter) for letter in set(initials))
+
+
+class SelfTransferDetector:
+    """
+    Tells transfers between the owner's own accounts from payments to other people by fuzzy matching the
+    counterparty of each narration against the owner's names (the session name and the account names).
+    Reordered names and typos are caught by the token sort ratio, extra middle names and narration noise by the
+    token set ratio when at least two words are shared, abbreviated names by their initials. Scores for every
+    distinct counterparty against every owner name are computed at once with rapidfuzz's cdist.
+    """
+
+    def __init__(self, owner_names: list[str], min_score: float = 90):
+        self.owner_tokens = sorted({tuple(name_tokens(name)) for name in owner_names} - {()})
+        self.owners = [" ".join(tokens) for tokens in self.owner_tokens]
+        self.min_score = min_score
+
+    @staticmethod
+    def counterparty(narration: Optional[str], transaction_type: Optional[str]) -> str:
+        # The parsed name when a bank template matches, otherwise the whole narration for the token set ratio,
+        # but only for transfers: "POS PURCHASE JANE SMITH STORES" holds the owner's name and is not one
+        parsed = parse_counterparty(narration, transaction_type or "debit")
+        if parsed:
+            return " ".join(name_tokens(parsed[0]))
+        normalized = normalize_category_narration(narration)
+        if not TRANSFER_PATTERN.search(normalized):
+            return ""
+        return " ".join(name_tokens(normalized))
+
+    def detect(self, narrations: list[tuple[Optional[str], Optional[str]]]) -> list[bool]:
+        """
+        :param narrations: (narration, transaction type) pairs.
+        :return: Whether each narration is a transfer to or from the owner.
+        """
+        if not narrations or not self.owners:
+            return [False] * len(narrations)
+        counterparties = [self.counterparty(narration, transaction_type) for narration, transaction_type in narrations]
+        names = sorted({name for name in counterparties if name})
+        if not names:
+            return [False] * len(narrations)
+
+        sort_scores = process.cdist(names, self.owners, scorer=fuzz.token_sort_ratio, workers=-1)
+        set_scores = process.cdist(names, self.owners, scorer=fuzz.token_set_ratio, workers=-1)
+        shared = np.array([[len(set(name.split()) & set(owner)) for owner in self.owner_tokens] for name in names])
+        required = np.array([min(2, len(owner)) for owner in self.owner_tokens])
+        is_self = ((sort_scores >= self.min_score) |
+                   ((set_scores >= self.min_score) & (shared >= required))).any(axis=1)
+
+        found = {name for name, matched in zip(names, is_self) if matched}
+        found.update(name for name in names if name not in found and
+                     any(matches_initials(name.split(), list(owner)) for owner in self.owner_tokens))
+        return [name in found for name in counterparties]
+
+
+class SelfTransferCache:
+    """
+    Per session Redis hash of narration to self-transfer flag, so the payment analysis steps of a session share
+    one detection pass. Keys include the owner names, renaming the session or an account starts a new hash.
+    """
+
+    def __init__(self, session_id: str, owner_names: list[str], min_score: float = 90,
+                 ttl_seconds: int = 60 * 60 * 24):
+        self.redis = get_redis()
+        digest = hashlib.sha1(f"{SELF_TRANSFER_CACHE_VERSION}|{min_score}|{'|'.join(sorted(set(owner_names)))}"
+                              .encode("utf-8")).hexdigest()[:12]
+        self.key = f"self_transfers:{session_id}:{digest}"
+        self.ttl_seconds = ttl_seconds
+        self.detector = SelfTransferDetector(owner_names, min_score)
+
+    def self_transfers(self, narrations: list[tuple[str, Optional[str]]]) -> set[str]:
+        """
+        :param narrations: (narration, transaction type) pairs.
+        :return: The narrations that are self-transfers.
+        """
+        narrations = sorted({(narration, transaction_type) for narration, transaction_type in narrations
+                             if narration})
+        fields = [f"{(transaction_type or '').lower()}|{narration}" for narration, transaction_type in narrations]
+        if not fields:
+            return set()
+        try:
+            cached = self.redis.hmget(self.key, fields)
+        except Exception as e:
+            print(f"Error reading the self-transfer cache: {e}")
+            cached = [None] * len(fields)
+
+        missing = [i for i, value in enumerate(cached) if value is None]
+        if missing:
+            detected = self.detector.detect([narrations[i] for i in missing])
+            for i, is_self in zip(missing, detected):
+                cached[i] = "1" if is_self else "0"
+            try:
+                pipeline = self.redis.pipeline(transaction=False)
+                pipeline.hset(self.key, mapping={fields[i]: cached[i] for i in missing})
+                pipeline.expire(self.key, self.ttl_seconds)
+                pipeline.execute()
+            except Exception as e:
+                print(f"Error writing the self-transfer cache: {e}")
+        return {narration for (narration, _), value in zip(narrations, cached) if value == "1"}
@@ -0,0 +1,184 @@
+from datetime import date
+from typing import Optional
+
+import numpy as np
+
+from app.data.account import TransactionCategoryOut
+from app.data.session import IncomeFlowOut
+
+ROLLUP_PERIODS = ("day", "week", "month")
+DIRECTIONS = {1: "credit", 2: "debit"}
+
+
+class SessionSnapshot:
+    """
+    The accounts and transactions of a session loaded once, with amounts, dates, directions and category ids
+    held as NumPy arrays so every ratio and risk metric of the financial position is a vectorized reduction
+    over the same data instead of another query and another pass over validated Pydantic rows.
+    Transactions are expected in date order.
+    """
+
+    def __init__(self, accounts: list, transactions: list):
+        self.accounts = accounts
+        self.transactions = transactions
+        self.closing_balance = float(sum(account.current_balance for account in accounts))
+        self.amounts = np.array([t.amount for t in transactions], dtype=np.float64)
+        self.dates = np.array([t.date for t in transactions], dtype="datetime64[s]")
+        types = np.array([(t.transaction_type or "").strip().lower() for t in transactions], dtype=object)
+        self.is_debit = types == "debit"
+        self.is_credit = types == "credit"
+        # -1 for transactions without a category
+        self.category_ids = np.array([t.category_id if t.category_id is not None else -1 for t in transactions],
+                                     dtype=np.int64)
+        self.categories = {t.category.id: t.category for t in transactions if t.category is not None}
+
+    @property
+    def inflow(self) -> float:
+        return float(self.amounts[self.is_credit].sum())
+
+    @property
+    def outflow(self) -> float:
+        return float(self.amounts[self.is_debit].sum())
+
+    @property
+    def days(self) -> int:
+        if len(self.dates) == 0:
+            return 0
+        return int((self.dates[-1] - self.dates[0]) // np.timedelta64(1, "D"))
+
+    def income_flow(self) -> IncomeFlowOut:
+        inflow, outflow = self.inflow, self.outflow
+        return IncomeFlowOut(net_income=inflow - outflow, closing_balance=self.closing_balance, outflow=outflow,
+                             inflow=inflow)
+
+    def spending_ratio(self) -> float:
+        income = self.inflow
+        if income <= 0:
+            income = 1
+        return min(self.outflow / income * 100, 200.0)
+
+    def savings(self, savings_category_id: int) -> float:
+        return float(self.amounts[self.category_ids == savings_category_id].sum())
+
+    def savings_ratio(self, savings_category_id: int) -> float:
+        income = self.inflow
+        if income <= 0:
+            income = 1
+        return min(self.savings(savings_category_id) / income * 100, 100.0)
+
+    def volatility_risk(self) -> float:
+        spending = self.amounts[self.is_debit]
+        if len(spending) == 0:
+            return 0.0
+        average_spending = float(spending.mean())
+        if average_spending == 0:
+            return 0.0
+        volatility_risk = float(spending.std()) / average_spending
+        print("Volatility Risk is: {}".format(volatility_risk))
+        # normalize roughly to 0–1 range
+        return min(float(np.log1p(volatility_risk) / np.log1p(10)), 1)
+
+    def budget_conscious(self) -> float:
+        return max(0, min(100, (1 - self.volatility_risk()) * 100))
+
+    def liquidity_risk(self) -> float:
+        average_daily_outflow = self.outflow / self.days if self.days > 0 else 1
+        if average_daily_outflow == 0:
+            average_daily_outflow = 1
+        return float(self.closing_balance / average_daily_outflow)
+
+    def weekly_expenses(self) -> np.ndarray:
+        """
+        Debit totals per week in one pass: every transaction's calendar day offset from the first one is bucketed
+        with np.bincount. As in the original loop, a week runs from its first day to seven days later inclusive,
+        the next one starting the day after, and there are as many weeks as whole weeks between the first and
+        last transaction.
+        """
+        weeks = self.days // 7
+        if weeks <= 0:
+            return np.zeros(0)
+        offsets = (self.dates.astype("datetime64[D]") - self.dates[0].astype("datetime64[D]")).astype(np.int64)
+        buckets = offsets // 8
+        mask = self.is_debit & (buckets < weeks)
+        return np.bincount(buckets[mask], weights=self.amounts[mask], minlength=weeks)
+
+    def expense_risk(self, week_expenses: Optional[np.ndarray] = None) -> float:
+        """
+        Weighted average of the week on week growth of expenses, later weeks weighing more.
+        """
+        week_expenses = self.weekly_expenses() if week_expenses is None else week_expenses
+        weeks = len(week_expenses)
+        print("There are {} Weeks to calculate expense risk.".format(weeks))
+        if weeks <= 0:
+            return 0
+        weights = 10 * np.arange(weeks, dtype=np.float64)
+        total_weight = weights.sum() or 1
+        previous, current = week_expenses[:-1], week_expenses[1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.where(previous == 0, np.where(current == 0, 0.0, 100.0),
+                              np.where(current == 0, 0.0, (current - previous) / previous * 100))
+        expense_risk_score = float((np.round(growth, 2) * weights[1:] / total_weight).sum() / weeks)
+        print("Expense Risk is: {}".format(expense_risk_score))
+        return expense_risk_score
+
+    def period_starts(self, period: str) -> np.ndarray:
+        days = self.dates.astype("datetime64[D]")
+        if period == "day":
+            return days
+        if period == "week":
+            # Weeks start on Monday like date_trunc('week'), 1970-01-01 was a Thursday
+            return days - (days.astype(np.int64) + 3) % 7
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+
+    def rollups(self) -> list[dict]:
+        """
+        Totals and counts per period, category and direction for every period in ROLLUP_PERIODS, grouped with
+        np.unique over (period start, category id, direction) keys. Uncategorized transactions get a None
+        category, transactions that are neither credits nor debits are left out.
+        """
+        directions = np.where(self.is_credit, 1, np.where(self.is_debit, 2, 0))
+        mask = directions > 0
+        if not mask.any():
+            return []
+        rows = []
+        for period in ROLLUP_PERIODS:
+            keys = np.stack([self.period_starts(period).astype(np.int64), self.category_ids, directions], axis=1)[mask]
+            unique, index = np.unique(keys, axis=0, return_inverse=True)
+            index = index.reshape(-1)
+            totals = np.bincount(index, weights=self.amounts[mask], minlength=len(unique))
+            counts = np.bincount(index, minlength=len(unique))
+            rows.extend({"period": period,
+                         "period_start": np.datetime64(int(start), "D").astype(date),
+                         "category_id": int(category_id) if category_id >= 0 else None,
+                         "direction": DIRECTIONS[int(direction)],
+                         "total_amount": float(total),
+                         "transaction_count": int(count)}
+                        for (start, category_id, direction), total, count in zip(unique, totals, counts))
+        return rows
+
+    def category_totals(self, mask: np.ndarray) -> list[TransactionCategoryOut]:
+        """
+        Amounts by category for the transactions selected by mask, largest first, uncategorized ones left out.
+        """
+        mask = mask & (self.category_ids >= 0)
+        category_ids, index = np.unique(self.category_ids[mask], return_inverse=True)
+        totals = np.bincount(index, weights=self.amounts[mask], minlength=len(category_ids))
+        return [TransactionCategoryOut(category_id=int(category_id),
+                                       category_name=self.categories[category_id].name,
+                                       category_icon=self.categories[category_id].icon,
+                                       amount=float(total))
+                for category_id, total in sorted(zip(category_ids, totals), key=lambda item: -item[1])]
+
+    def income_by_category(self) -> list[TransactionCategoryOut]:
+        return self.category_totals(self.is_credit)
+
+    def expenses_by_category(self) -> list[TransactionCategoryOut]:
+        return self.category_totals(self.is_debit)
+
+    def concentration_risk(self, income_by_category: Optional[list[TransactionCategoryOut]] = None) -> float:
+        # Share of categorized income coming from the largest source
+        income_by_category = self.income_by_category() if income_by_category is None else income_by_category
+        total = sum(category.amount for category in income_by_category)
+        if total == 0:
+            return 0.0
+        return float(income_by_category[0].amount / total)
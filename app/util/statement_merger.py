@@ -0,0 +1,79 @@
+import re
+from collections import Counter
+from typing import Optional
+
+from app.data.session import Statement, Transaction
+
+PLACEHOLDER_ACCOUNT_NUMBERS = {"", "0000000000"}
+
+
+def normalize_account_number(account_number: Optional[str]) -> Optional[str]:
+    digits = re.sub(r'\D', '', account_number or "")
+    if digits in PLACEHOLDER_ACCOUNT_NUMBERS:
+        return None
+    return digits
+
+
+def normalize_narration(description: Optional[str]) -> str:
+    # Extraction differs in spacing, casing and punctuation between pages and statements of the same account
+    return re.sub(r'[^a-z0-9]', '', (description or "").lower())
+
+
+def transaction_fingerprint(account_number: Optional[str], transaction: Transaction) -> tuple:
+    return (account_number,
+            transaction.transactionDate.date() if transaction.transactionDate else None,
+            round(abs(transaction.amount), 2) if transaction.amount is not None else None,
+            (transaction.transactionType or "").lower(),
+            normalize_narration(transaction.description),
+            round(transaction.balance, 2) if transaction.balance is not None else None)
+
+
+def merge_statements(statements: list[Statement]) -> list[Statement]:
+    """
+    Merge statements of the same account number into one and drop the rows repeated by overlapping date ranges.
+    Identical rows inside one statement are kept, a fingerprint seen n times in one statement and m times in
+    another is kept max(n, m) times. Statements without a usable account number are left as they are.
+    """
+    merged: list[Statement] = []
+    accounts: dict[str, tuple[Statement, Counter]] = {}
+    for statement in statements:
+        account_number = normalize_account_number(statement.accountNumber)
+        if account_number is None:
+            merged.append(statement)
+            continue
+
+        counts = Counter(transaction_fingerprint(account_number, t) for t in statement.transactions)
+        if account_number not in accounts:
+            accounts[account_number] = (statement, counts)
+            merged.append(statement)
+            continue
+
+        target, seen = accounts[account_number]
+        target_latest = latest_date(target)
+        kept = Counter()
+        dropped = 0
+        for transaction in statement.transactions:
+            fingerprint = transaction_fingerprint(account_number, transaction)
+            kept[fingerprint] += 1
+            if kept[fingerprint] <= seen[fingerprint]:
+                dropped += 1
+                continue
+            target.transactions.append(transaction)
+        seen |= counts
+
+        target.accountName = target.accountName or statement.accountName
+        target.accountCurrency = target.accountCurrency or statement.accountCurrency
+        target.bank = target.bank or statement.bank
+        if statement.accountBalance is not None and (
+                target.accountBalance is None or latest_date(statement) > target_latest):
+            target.accountBalance = statement.accountBalance
+        target.transactions.sort(key=lambda t: t.transactionDate.timestamp() if t.transactionDate else 0)
+        print("Merged statement of account {} into an earlier upload, dropped {} overlapping transactions".format(
+            account_number, dropped))
+
+    return merged
+
+
+def latest_date(statement: Statement):
+    dates = [t.transactionDate for t in statement.transactions if t.transactionDate is not None]
+    return max(dates).timestamp() if dates else 0
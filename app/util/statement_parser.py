@@ -0,0 +1,319 @@
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Optional
+
+from app.data.session import Statement, Transaction
+
+DATE_HEADERS = {"date", "trans date", "transaction date", "txn date", "tran date", "posting date", "post date",
+                "posted date", "value date", "entry date", "booking date"}
+NARRATION_HEADERS = {"narration", "narrative", "description", "details", "transaction details", "remarks",
+                     "particulars", "transaction description", "memo"}
+DEBIT_HEADERS = {"debit", "debits", "withdrawal", "withdrawals", "money out", "dr", "debit amount", "paid out"}
+CREDIT_HEADERS = {"credit", "credits", "deposit", "deposits", "lodgement", "lodgements", "money in", "cr",
+                  "credit amount", "paid in"}
+AMOUNT_HEADERS = {"amount", "transaction amount", "txn amount"}
+TYPE_HEADERS = {"dr/cr", "cr/dr", "dr / cr", "cr / dr", "d/c", "c/d", "type", "transaction type", "txn type",
+                "trans type", "debit/credit", "credit/debit"}
+# What a Dr/Cr or Type column says for each direction
+DEBIT_INDICATORS = {"dr", "d", "debit", "db", "withdrawal", "-"}
+CREDIT_INDICATORS = {"cr", "c", "credit", "deposit", "+"}
+BALANCE_HEADERS = {"balance", "running balance", "closing balance", "balance after", "available balance"}
+REFERENCE_HEADERS = {"reference", "ref", "ref no", "reference no", "reference number", "transaction id",
+                     "transaction ref", "cheque no", "chq no", "doc no"}
+
+DATE_FORMATS = ["%d-%b-%Y", "%d-%b-%y", "%d %b %Y", "%d %b %y", "%d/%m/%Y", "%d/%m/%y", "%d-%m-%Y", "%d-%m-%y",
+                "%Y-%m-%d", "%Y/%m/%d", "%d.%m.%Y", "%b %d, %Y", "%d-%B-%Y", "%d %B %Y"]
+
+SKIP_ROW_PATTERN = re.compile(r'^(opening balance|closing balance|balance (b/f|c/f)|brought forward|carried forward|'
+                              r'totals?:?$|total (debits?|credits?|withdrawals?|deposits?))', re.IGNORECASE)
+ACCOUNT_NUMBER_PATTERN = re.compile(r'Account\s*(?:No|Number|#)\.?\s*[:\-]?\s*(\d{10,12})', re.IGNORECASE)
+ACCOUNT_NAME_PATTERN = re.compile(r'Account\s*Name\s*[:\-]?\s*([^\n\r]+)', re.IGNORECASE)
+AMOUNT_CELL_PATTERN = re.compile(r'^\(?-?\s*(?:[A-Z]{3}|₦|N|\$)?\s*-?[\d,]+(?:\.\d+)?\)?\s*(?:CR|DR)?$', re.IGNORECASE)
+CURRENCY_PATTERN = re.compile(r'Currency\s*[:\-]?\s*([A-Z]{3})\b')
+CLOSING_BALANCE_PATTERN = re.compile(
+    r'(?:Closing|Available|Ledger)\s*Balance\s*[:\-]?\s*(?:[A-Z]{3}|₦|N|\$)?\s*(-?[\d,]+\.\d{2})', re.IGNORECASE)
+
+
+class StatementTableParser:
+    """
+    Rule based extractor for machine generated bank statements.
+    Detects the transaction table on a page and turns its rows into a Statement,
+    returning None whenever the page cannot be parsed confidently so the caller can fall back to the LLM.
+    The column layout found on a header row is kept for the following pages since most banks only
+    print the header once.
+    """
+
+    def __init__(self, min_confidence: float = 0.9):
+        self.min_confidence = min_confidence
+        self.columns: Optional[dict[str, int]] = None
+
+    def parse_page(self, rows: list[list[Optional[str]]], page_text: str, is_first_page: bool) -> Optional[Statement]:
+        transactions: list[Transaction] = []
+        amount_rows: list[list[str]] = []
+        candidate_rows = 0
+        for row in rows:
+            cells = [StatementTableParser.clean_cell(cell) for cell in row]
+            header = StatementTableParser.detect_columns(cells)
+            if header is not None:
+                self.columns = header
+                continue
+            if self.columns is None or not any(cells):
+                continue
+
+            date_cell = self.get_cell(cells, "date")
+            if not date_cell:
+                # Wrapped narrations come through as rows without a date, glue them onto the previous row
+                narration = self.get_cell(cells, "narration")
+                if narration and transactions and not self.has_amount(cells):
+                    transactions[-1].description = f"{transactions[-1].description} {narration}".strip()
+                continue
+            if StatementTableParser.parse_date(date_cell) is None and not self.has_amount(cells):
+                # Repeated headers we have no aliases for, page footers and the like
+                continue
+            if SKIP_ROW_PATTERN.search(self.get_cell(cells, "narration") or ""):
+                continue
+
+            candidate_rows += 1
+            transaction = self.parse_row(cells)
+            if transaction is not None:
+                transactions.append(transaction)
+                if self.from_amount_column(cells):
+                    amount_rows.append(cells)
+
+        if candidate_rows == 0 or len(transactions) / candidate_rows < self.min_confidence:
+            return None
+        # Without a type column an amount column only tells debits from credits by sign or DR/CR suffix,
+        # a page where none of the amounts carries one cannot be told apart from an unsigned column
+        if amount_rows and not any(self.row_direction(cells) for cells in amount_rows):
+            return None
+
+        statement = Statement(transactions=transactions)
+        account_number = ACCOUNT_NUMBER_PATTERN.search(page_text)
+        account_name = ACCOUNT_NAME_PATTERN.search(page_text)
+        currency = CURRENCY_PATTERN.search(page_text)
+        closing_balance = CLOSING_BALANCE_PATTERN.search(page_text)
+        if account_number:
+            statement.accountNumber = account_number.group(1)
+        if account_name:
+            statement.accountName = account_name.group(1).strip()
+        if currency:
+            statement.accountCurrency = currency.group(1)
+        if closing_balance:
+            statement.accountBalance = StatementTableParser.parse_amount(closing_balance.group(1))
+
+        # The first page carries the account details, let the LLM handle it when we cannot find them
+        if is_first_page and statement.accountNumber is None:
+            return None
+        return statement
+
+    def parse_row(self, cells: list[str]) -> Optional[Transaction]:
+        transaction_date = StatementTableParser.parse_date(self.get_cell(cells, "date"))
+        narration = self.get_cell(cells, "narration")
+        if transaction_date is None or not narration:
+            return None
+
+        debit = StatementTableParser.parse_amount(self.get_cell(cells, "debit"))
+        credit = StatementTableParser.parse_amount(self.get_cell(cells, "credit"))
+        amount = StatementTableParser.parse_amount(self.get_cell(cells, "amount"))
+        if debit:
+            transaction_type, value = "Debit", debit
+        elif credit:
+            transaction_type, value = "Credit", credit
+        elif amount:
+            transaction_type = self.row_direction(cells)
+            if transaction_type is None:
+                if "type" in self.columns:
+                    return None
+                transaction_type = "Credit"
+            value = amount
+        else:
+            return None
+
+        return Transaction(transactionDate=transaction_date,
+                           transactionId=self.get_cell(cells, "reference") or None,
+                           description=narration,
+                           transactionType=transaction_type,
+                           amount=abs(value),
+                           balance=StatementTableParser.parse_amount(self.get_cell(cells, "balance")))
+
+    def learn_columns(self, rows: list[list[Optional[str]]], transactions: list[Transaction]) -> Optional[dict[str, int]]:
+        """
+        Work out the column layout of a table from transactions extracted out of the same rows by the LLM,
+        so the layout can be parsed without the LLM next time. Returns None when the rows do not agree on
+        a layout, or when parsing them with it does not give back the LLM's transactions with the same
+        dates, amounts and types.
+        """
+        by_date: dict = defaultdict(list)
+        for transaction in transactions:
+            if transaction.transactionDate is not None and transaction.amount is not None:
+                by_date[transaction.transactionDate.date()].append(transaction)
+
+        votes: dict[str, Counter] = defaultdict(Counter)
+        matched_rows = 0
+        for row in rows:
+            cells = [StatementTableParser.clean_cell(cell) for cell in row]
+            date_index, transaction_date = next(((index, StatementTableParser.parse_date(cell))
+                                                 for index, cell in enumerate(cells)
+                                                 if StatementTableParser.parse_date(cell) is not None), (None, None))
+            if date_index is None:
+                continue
+            amounts = {index: abs(StatementTableParser.parse_amount(cell)) for index, cell in enumerate(cells)
+                       if index != date_index and AMOUNT_CELL_PATTERN.match(cell)}
+            for transaction in by_date.get(transaction_date.date(), []):
+                amount_index = next((index for index, value in amounts.items()
+                                     if round(value, 2) == round(abs(transaction.amount), 2)), None)
+                if amount_index is None:
+                    continue
+                matched_rows += 1
+                votes["date"][date_index] += 1
+                transaction_type = "Debit" if (transaction.transactionType or "").lower() == "debit" else "Credit"
+                votes[transaction_type.lower()][amount_index] += 1
+                # A Dr/Cr or Type column next to a single amount column, dashes and blanks are not indicators
+                type_index = next((index for index, cell in enumerate(cells)
+                                   if index not in (date_index, amount_index) and re.search(r'[A-Za-z]', cell)
+                                   and StatementTableParser.parse_direction(cell) == transaction_type), None)
+                if type_index is not None:
+                    votes["type"][type_index] += 1
+                if transaction.balance is not None:
+                    balance_index = next((index for index, value in amounts.items() if index != amount_index
+                                          and round(value, 2) == round(abs(transaction.balance), 2)), None)
+                    if balance_index is not None:
+                        votes["balance"][balance_index] += 1
+                if transaction.transactionId:
+                    reference_index = next((index for index, cell in enumerate(cells)
+                                            if cell == transaction.transactionId), None)
+                    if reference_index is not None:
+                        votes["reference"][reference_index] += 1
+                words = set(re.findall(r'[a-z0-9]+', (transaction.description or "").lower()))
+                overlaps = [(len(words & set(re.findall(r'[a-z0-9]+', cell.lower()))), index)
+                            for index, cell in enumerate(cells) if index != date_index and index not in amounts]
+                if overlaps and max(overlaps)[0] > 0:
+                    votes["narration"][max(overlaps)[1]] += 1
+                break
+
+        if matched_rows < 3:
+            return None
+        columns = {column: counter.most_common(1)[0][0] for column, counter in votes.items()}
+        # Debits and credits landing in the same column means a single amount column, signed or typed by the
+        # indicator column when every matched row has one
+        if "debit" in columns and columns.get("debit") == columns.get("credit"):
+            columns["amount"] = columns.pop("debit")
+            columns.pop("credit")
+            if votes["type"].get(columns.get("type"), 0) < matched_rows:
+                columns.pop("type", None)
+        else:
+            columns.pop("type", None)
+        has_amounts = ("debit" in columns and "credit" in columns) or "amount" in columns
+        if "date" not in columns or "narration" not in columns or not has_amounts:
+            return None
+
+        parser = StatementTableParser(self.min_confidence)
+        parser.columns = columns
+        statement = parser.parse_page(rows, "", False)
+        if statement is None:
+            return None
+        if StatementTableParser.transaction_keys(statement.transactions) != \
+                StatementTableParser.transaction_keys(transactions):
+            print("Learned columns {} do not reproduce the extracted transactions".format(columns))
+            return None
+        return columns
+
+    @staticmethod
+    def transaction_keys(transactions: list[Transaction]) -> list[tuple]:
+        return sorted((transaction.transactionDate.date().isoformat() if transaction.transactionDate else "",
+                       round(abs(transaction.amount), 2) if transaction.amount is not None else -1.0,
+                       (transaction.transactionType or "").lower())
+                      for transaction in transactions)
+
+    def get_cell(self, cells: list[str], column: str) -> str:
+        index = self.columns.get(column) if self.columns else None
+        if index is None or index >= len(cells):
+            return ""
+        return cells[index]
+
+    def from_amount_column(self, cells: list[str]) -> bool:
+        return not StatementTableParser.parse_amount(self.get_cell(cells, "debit")) and \
+            not StatementTableParser.parse_amount(self.get_cell(cells, "credit"))
+
+    def row_direction(self, cells: list[str]) -> Optional[str]:
+        """
+        Debit or Credit as stated by the type column of the row, or else by the sign or DR/CR suffix of its
+        amount. None when the row does not say.
+        """
+        if "type" in self.columns:
+            return StatementTableParser.parse_direction(self.get_cell(cells, "type"))
+        cell = self.get_cell(cells, "amount").upper()
+        amount = StatementTableParser.parse_amount(cell)
+        if amount is not None and amount < 0 or cell.endswith("DR"):
+            return "Debit"
+        if cell.endswith("CR") or cell.startswith("+"):
+            return "Credit"
+        return None
+
+    def has_amount(self, cells: list[str]) -> bool:
+        return any(StatementTableParser.parse_amount(self.get_cell(cells, column)) is not None
+                   for column in ("debit", "credit", "amount"))
+
+    @staticmethod
+    def detect_columns(cells: list[str]) -> Optional[dict[str, int]]:
+        aliases = {"date": DATE_HEADERS, "narration": NARRATION_HEADERS, "debit": DEBIT_HEADERS,
+                   "credit": CREDIT_HEADERS, "amount": AMOUNT_HEADERS, "balance": BALANCE_HEADERS,
+                   "reference": REFERENCE_HEADERS, "type": TYPE_HEADERS}
+        columns: dict[str, int] = {}
+        for index, cell in enumerate(cells):
+            name = re.sub(r'\(.*?\)|[^a-z/ ]', ' ', cell.lower())
+            name = re.sub(r'\s+', ' ', name).strip()
+            for column, headers in aliases.items():
+                if column not in columns and name in headers:
+                    columns[column] = index
+                    break
+
+        has_amounts = ("debit" in columns and "credit" in columns) or "amount" in columns
+        if "date" in columns and "narration" in columns and has_amounts:
+            return columns
+        return None
+
+    @staticmethod
+    def clean_cell(cell: Optional[str]) -> str:
+        if cell is None:
+            return ""
+        return re.sub(r'\s+', ' ', str(cell)).strip()
+
+    @staticmethod
+    def parse_date(value: str) -> Optional[datetime]:
+        if not value:
+            return None
+        # Some banks print the time next to the date, the date part is enough for us
+        tokens = value.split(" ")
+        for candidate in (value, tokens[0], " ".join(tokens[:3])):
+            for date_format in DATE_FORMATS:
+                try:
+                    return datetime.strptime(candidate, date_format)
+                except ValueError:
+                    continue
+        return None
+
+    @staticmethod
+    def parse_direction(value: Optional[str]) -> Optional[str]:
+        indicator = re.sub(r'[^a-z+-]', '', (value or "").lower())
+        if indicator in DEBIT_INDICATORS:
+            return "Debit"
+        if indicator in CREDIT_INDICATORS:
+            return "Credit"
+        return None
+
+    @staticmethod
+    def parse_amount(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        negative = value.startswith("(") and value.endswith(")")
+        cleaned = re.sub(r'(?i)(cr|dr)$', '', value.strip())
+        cleaned = re.sub(r'[^\d.\-]', '', cleaned)
+        if cleaned in ("", "-", ".", "-."):
+            return None
+        try:
+            amount = float(cleaned)
+        except ValueError:
+            return None
+        return -abs(amount) if negative else amount
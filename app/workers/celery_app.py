@@ -22,6 +22,14 @@ celery_app.conf.beat_schedule = {
         'task': 'get_latest_currency',
         'schedule': crontab(hour='*/48'),  # every 48 hours
     },
+    'train-category-classifier': {
+        'task': 'train_category_classifier',
+        'schedule': crontab(hour=2, minute=0),  # every night
+    },
+    'index-category-embeddings': {
+        'task': 'index_category_embeddings',
+        'schedule': crontab(hour=3, minute=0),  # every night
+    },
     # 'auto_classify_session_transactions-every-10-mins': {
     #     'task': 'auto_classify_session_transactions',
     #     'schedule': crontab(minute='*/20'),  # every 10 mins
@@ -1,18 +1,21 @@
 import asyncio
 import time
-from typing import List
+from typing import List, Optional
 
 from celery import shared_task
 import traceback
 
 from app.data.mail import EmailTemplateData
-from app.data.session import SessionAccountOut
+from app.data.session import SessionAccountOut, Statement
 from app.database.index import get_db
 from app.models.session import SessionAccount, Session, SessionFile, SessionTransaction
 from app.services.email_services import EmailService
 from app.services.session_advice_service import SessionAdviceService
 from app.services.session_ai_service import SessionAIService
 from app.services.session_transaction_service import SessionTransactionService
+from app.util.extraction_scheduler import PageExtractionScheduler
+from app.util.response_cache import bump_session_version
+from app.util.statement_merger import merge_statements
 from dotenv import load_dotenv
 import os
 
@@ -36,26 +39,27 @@ async def run_process_statements(session_id: str, files_id: List[int]):
         print("Initializing session accounts...")
         session_record.processing_status = "initializing_statements"
         db.commit()
-        for index, file_id in enumerate(files_id):
-            print("Processing file {}".format(file_id))
-            session_file = db.query(SessionFile).filter(SessionFile.id == file_id).first()
-            statement = await session_ai_service.read_pdf_directly(session_file)
-            currency_data = None
-            
-            if statement.accountCurrency is not None:
-                currency_data = session_ai_service.get_currency_data(statement.accountCurrency)
-            
-            if statement is None:
-                continue
-            
+        bump_session_version(session_id)
+        # Each file gets its own db session, the page scheduler is shared so its concurrency cap covers the whole upload
+        page_scheduler = session_ai_service.page_scheduler
+        semaphore = asyncio.Semaphore(int(os.getenv("STATEMENT_FILE_CONCURRENCY", "4")))
+        results = await asyncio.gather(*(read_statement_file(file_id, page_scheduler, semaphore)
+                                         for file_id in files_id), return_exceptions=True)
+        statements = []
+        for file_id, result in zip(files_id, results):
+            if isinstance(result, Exception):
+                print("Failed to process file {}: {}".format(file_id, result))
+            elif result is not None:
+                statements.append(result)
+
+        # Consecutive statements of the same account become one account without the overlapping rows
+        for statement in merge_statements(statements):
             if statement.accountName is None:
                 statement.accountName = "Unnamed Account"
             if statement.accountCurrency is None:
                 statement.accountCurrency = "NGN"
             if statement.accountNumber is None:
                 statement.accountNumber = "0000000000"
-            if currency_data is not None:
-                statement.accountCurrency = currency_data.code
 
             account = SessionAccount(account_name=statement.accountName,
                                      account_number=statement.accountNumber,
@@ -76,8 +80,11 @@ async def run_process_statements(session_id: str, files_id: List[int]):
         session_record.processing_status = "categorizing"
         session_record.currency_code = conversion_currency
         db.commit()
+        # The accounts and transactions are in, responses cached while they were being written are stale
+        bump_session_version(session_id)
 
         category_response = await session_transaction_service.categorize_session_transactions(session_record.id)
+        bump_session_version(session_id)
 
         if not category_response:
             raise ValueError("Invalid Categorization for session transactions {}".format(session_id))
@@ -87,8 +94,13 @@ async def run_process_statements(session_id: str, files_id: List[int]):
         session_record.processing_status = "analyzing_transactions"
         db.commit()
         analyze_transactions(session_record.identifier)
+        session_record.processing_status = "building_rollups"
+        db.commit()
+        if not session_transaction_service.build_session_rollups(session_record.identifier):
+            raise ValueError("Unable to build the rollups of session {}".format(session_id))
         session_record.processing_status = "done"
         db.commit()
+        bump_session_version(session_id)
         email_service = EmailService()
         data = EmailTemplateData(
             to_email=session_record.email,
@@ -104,6 +116,32 @@ async def run_process_statements(session_id: str, files_id: List[int]):
     except Exception as e:
         print(e)
         traceback.print_exc()
+        # Whatever was written before the failure must not hide behind responses cached earlier
+        bump_session_version(session_id)
+
+
+async def read_statement_file(file_id: int, page_scheduler: PageExtractionScheduler,
+                              semaphore: asyncio.Semaphore) -> Optional[Statement]:
+    async with semaphore:
+        db = next(get_db())
+        try:
+            print("Processing file {}".format(file_id))
+            session_ai_service = SessionAIService(db)
+            session_ai_service.page_scheduler = page_scheduler
+            session_file = db.query(SessionFile).filter(SessionFile.id == file_id).first()
+            statement = await session_ai_service.read_pdf_directly(session_file)
+            if statement is None:
+                return None
+
+            currency_data = None
+            if statement.accountCurrency is not None:
+                currency_data = await asyncio.to_thread(session_ai_service.get_currency_data,
+                                                        statement.accountCurrency)
+            if currency_data is not None:
+                statement.accountCurrency = currency_data.code
+            return statement
+        finally:
+            db.close()
 
 
 @shared_task(bind=True, max_retries=10, default_retry_delay=60)
@@ -141,10 +179,12 @@ def analyze_transactions(self, session_id: str):
         session_record.processing_status = "processed_analysis"
 
         db.commit()
+        bump_session_version(session_id)
         return True
     except Exception as e:
         print(e)
         traceback.print_exc()
+        bump_session_version(session_id)
 
 
 @shared_task(bind=True, max_retries=10, default_retry_delay=60)
@@ -161,6 +201,7 @@ async def analyze_run_payments(session_id: str):
 
         beneficiary_result = await session_advice_service.process_top_beneficiaries(session_record.identifier)
         recurring_data = session_advice_service.get_recurring_expenses(session_record.identifier)
+        bump_session_version(session_id)
 
     except Exception as e:
         print(e)
@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from app.services.category_embedding_service import CategoryEmbeddingService
 from app.services.session_transaction_service import SessionTransactionService
 from app.services.transaction_service import TransactionService
 from app.database.index import get_db
@@ -71,6 +72,40 @@ def auto_classify_session_transactions(self):
     finally:
         db.close()
 
+@celery_app.task(name='train_category_classifier', bind=True, max_retries=3, default_retry_delay=600)
+def train_category_classifier(self):
+    print("Running category classifier training...")
+    try:
+        db = next(get_db())
+        print(f"Database session: {db}")
+        service = SessionTransactionService(db=db)
+        version = service.train_category_classifier()
+        if version is None:
+            print("Not enough categorized transactions, keeping the current classifier.")
+            return None
+        print(f"Category classifier {version} trained successfully.")
+        return version
+    except Exception as e:
+        print(f"Error during category classifier training: {e}")
+        raise self.retry(exc=e)
+    finally:
+        db.close()
+
+@celery_app.task(name='index_category_embeddings', bind=True, max_retries=3, default_retry_delay=600)
+def index_category_embeddings(self):
+    print("Running category embedding indexing...")
+    try:
+        db = next(get_db())
+        print(f"Database session: {db}")
+        indexed = CategoryEmbeddingService(db=db).index_labelled_transactions()
+        print(f"Indexed {indexed} category embeddings.")
+        return indexed
+    except Exception as e:
+        print(f"Error during category embedding indexing: {e}")
+        raise self.retry(exc=e)
+    finally:
+        db.close()
+
 @celery_app.task(name='auto_classify_transactions', bind=True, max_retries=10, default_retry_delay=60)
 def auto_classify_transactions(self):
     # Fetch uncategorized transactions from DB
@@ -4,7 +4,8 @@ from .session_tasks import process_statements, analyze_transactions, analyze_pay
 from .transaction_insight_tasks import auto_generate_insights
 
 from .transaction_tasks import fetch_initial_transactions, auto_classify_transactions, sync_account_transactions, \
-    generate_transaction_embeddings, auto_classify_session_transactions, fetch_session_transactions
+    generate_transaction_embeddings, auto_classify_session_transactions, fetch_session_transactions, \
+    train_category_classifier, index_category_embeddings
 from .account_tasks import auto_fetch_transactions, get_latest_currency
 
 __all__ = [
@@ -13,6 +14,8 @@ __all__ = [
     'fetch_session_transactions',
     # 'auto_classify_transactions',
     'auto_classify_session_transactions',
+    'train_category_classifier',
+    'index_category_embeddings',
     'get_latest_currency',
     # 'generate_transaction_embeddings',
     'auto_generate_insights',
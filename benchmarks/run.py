@@ -0,0 +1,349 @@
+"""
+Offline benchmarks for statement ingestion. Nothing is sent to OpenAI, Mailtrap or Redis: the LLM is replaced
+by benchmarks.stub_llm.StubChatModel and the page, category and self-transfer caches are skipped unless
+--page-cache is given. The database is the one in DATABASE_URL, a local Postgres with the migrations applied. Rows
+created for a case are removed afterwards unless --keep is given.
+
+    python -m benchmarks.run --target read --layouts split,unlabeled,text --pages 1,10,100,300 --encrypted
+    python -m benchmarks.run --target insert --transactions 1000,10000
+    python -m benchmarks.run --target full --layouts split --pages 10 --files 3 --llm-latency 0.5
+    python -m benchmarks.run --target risk --transactions 1000,20000
+
+Every case runs in a fresh process so peak RSS is per case.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+
+os.environ.setdefault("CHAT_GPT_KEY", "offline-benchmark")
+
+
+def install_stubs(page_cache: bool, llm_latency: float) -> dict:
+    from sqlalchemy import event
+
+    from app.database.index import engine
+    from app.services import ai_service, category_embedding_service, session_advice_service, session_ai_service
+    from app.services.email_services import EmailService
+    from app.workers import session_tasks
+    from benchmarks.stub_llm import StubChatModel, StubEmbeddings
+
+    counters = {"db_round_trips": 0, "emails": 0}
+    StubChatModel.latency = llm_latency
+    def chat_model(model: str = "gpt-4o-mini", temperature: float = 0, max_tokens=None, **kwargs):
+        return StubChatModel(model=model, temperature=temperature, max_tokens=max_tokens)
+
+    for module in (session_ai_service, ai_service, session_advice_service):
+        module.chat_model = chat_model
+    category_embedding_service.embeddings = StubEmbeddings
+
+    if not page_cache:
+        async def get_cache(key):
+            return None
+
+        async def set_cache(key, value, expire_seconds=600):
+            return True
+
+        session_ai_service.get_cache = get_cache
+        session_ai_service.set_cache = set_cache
+        ai_service.CategoryCache.get_many = lambda self, keys: {}
+        ai_service.CategoryCache.set_many = lambda self, categories: None
+        ai_service.CategoryCache.stats = lambda self: {}
+
+        def self_transfers(self, narrations):
+            narrations = [pair for pair in narrations if pair[0]]
+            return {narration for (narration, _), is_self in zip(narrations, self.detector.detect(narrations))
+                    if is_self}
+
+        session_advice_service.SelfTransferCache.self_transfers = self_transfers
+        session_tasks.bump_session_version = lambda session_id: None
+
+    def send_templated_email(self, data):
+        counters["emails"] += 1
+
+    EmailService.send_templated_email = send_templated_email
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_round_trip(conn, cursor, statement, parameters, context, executemany):
+        counters["db_round_trips"] += 1
+
+    return counters
+
+
+def create_session(db, files: list[str]):
+    from app.models.session import Session, SessionFile
+
+    identifier = uuid.uuid4().hex
+    session_record = Session(name="Ada Lovelace", identifier=identifier, email="bench-{}@example.com".format(identifier),
+                             processing_status="pending")
+    db.add(session_record)
+    db.commit()
+    db.refresh(session_record)
+    session_files = []
+    for path in files:
+        session_file = SessionFile(file_path=path, session_id=session_record.id, bank_id=None, password=None)
+        db.add(session_file)
+        session_files.append(session_file)
+    db.commit()
+    return session_record, session_files
+
+
+def cleanup(db, session_record, layout_ids: set[int]):
+    from app.models.session import SessionAccount, SessionTransaction, SessionBeneficiary, SessionInsight, \
+        SessionSwot, SessionSavingsPotential, SessionFile, SessionRollup, SessionSummary, Session, StatementLayout
+
+    db.rollback()
+    account_ids = [a.id for a in db.query(SessionAccount).filter(SessionAccount.session_id == session_record.id)]
+    db.query(SessionTransaction).filter(SessionTransaction.account_id.in_(account_ids)).delete()
+    for model in (SessionAccount, SessionBeneficiary, SessionInsight, SessionSwot, SessionSavingsPotential,
+                  SessionFile, SessionRollup, SessionSummary):
+        db.query(model).filter(model.session_id == session_record.id).delete()
+    db.query(Session).filter(Session.id == session_record.id).delete()
+    # Layouts learned during the case would make the next run faster than the first one
+    db.query(StatementLayout).filter(StatementLayout.id.notin_(layout_ids)).delete(synchronize_session=False)
+    db.commit()
+
+
+def count_transactions(db, session_record) -> int:
+    from app.models.session import SessionAccount, SessionTransaction
+
+    return db.query(SessionTransaction).join(SessionAccount).filter(
+        SessionAccount.session_id == session_record.id).count()
+
+
+async def run_read(db, case: dict) -> dict:
+    from app.services.session_ai_service import SessionAIService
+
+    session_record, session_files = create_session(db, case["files"])
+    case["session"] = session_record
+    statements = 0
+    transactions = 0
+    for session_file in session_files:
+        statement = await SessionAIService(db).read_pdf_directly(session_file)
+        if statement is not None:
+            statements += 1
+            transactions += len(statement.transactions)
+    return {"statements": statements, "transactions": transactions}
+
+
+async def run_insert(db, case: dict) -> dict:
+    from app.data.session import Statement, Transaction
+    from app.models.session import SessionAccount
+    from app.services.session_transaction_service import SessionTransactionService
+    from benchmarks.synthetic_statements import generate_rows
+
+    session_record, _ = create_session(db, [])
+    case["session"] = session_record
+    account = SessionAccount(account_name="Ada Lovelace", account_number="0123456789", current_balance=0,
+                             session_id=session_record.id, fetch_method='statement', currency="NGN")
+    db.add(account)
+    db.commit()
+    db.refresh(account)
+    statement = Statement(accountNumber="0123456789", accountCurrency="NGN", transactions=[
+        Transaction(transactionDate=day, transactionId=None, description=narration, transactionType=transaction_type,
+                    amount=amount, balance=balance)
+        for day, narration, amount, transaction_type, balance in generate_rows(case["transactions"], seed=7)])
+    SessionTransactionService(db).process_transaction_statements(account.id, statement)
+    return {"statements": 1, "transactions": count_transactions(db, session_record)}
+
+
+async def run_full(db, case: dict) -> dict:
+    from app.workers.session_tasks import run_process_statements
+
+    session_record, session_files = create_session(db, case["files"])
+    case["session"] = session_record
+    result = await run_process_statements(session_record.identifier, [f.id for f in session_files])
+    db.expire_all()
+    return {"statements": len(session_files), "transactions": count_transactions(db, session_record),
+            "completed": bool(result)}
+
+
+def reference_expense_risk(transactions: list) -> float:
+    """
+    The week by week loop calculate_expense_risk used before the weekly series was bucketed with NumPy,
+    kept to check the vectorized one against it and to time both.
+    """
+    from datetime import timedelta
+
+    start_date = transactions[0].date
+    weeks = (transactions[-1].date - start_date).days // 7
+    if weeks <= 0:
+        return 0
+    week_expenses = []
+    for i in range(1, weeks + 1):
+        begin_at = start_date if i == 1 else week_expenses[-1][1] + timedelta(days=1)
+        end_date = begin_at + timedelta(days=7)
+        total = sum(t.amount for t in transactions if begin_at.date() <= t.date.date() <= end_date.date() and
+                    t.transaction_type.strip().lower() == 'debit')
+        week_expenses.append((begin_at, end_date, total, 10 * (i - 1)))
+    total_weight = sum(expense[3] for expense in week_expenses) or 1
+    risk_score_sum = 0
+    for index in range(1, len(week_expenses)):
+        previous, current = week_expenses[index - 1][2], week_expenses[index][2]
+        if previous == 0:
+            growth = 0 if current == 0 else 100
+        elif current == 0:
+            growth = 0
+        else:
+            growth = (current - previous) / previous * 100
+        risk_score_sum += round(growth, 2) * week_expenses[index][3] / total_weight
+    return risk_score_sum / weeks
+
+
+async def run_risk(db, case: dict) -> dict:
+    from types import SimpleNamespace
+
+    from app.util.session_snapshot import SessionSnapshot
+    from benchmarks.synthetic_statements import generate_rows
+
+    transactions = [SimpleNamespace(date=day, amount=amount, transaction_type=transaction_type, category_id=None,
+                                    category=None)
+                    for day, _, amount, transaction_type, _ in generate_rows(case["transactions"], seed=7)]
+    start = time.perf_counter()
+    reference = reference_expense_risk(transactions)
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized = SessionSnapshot([], transactions).expense_risk()
+    vectorized_seconds = time.perf_counter() - start
+    if abs(reference - vectorized) > 1e-6 * max(1.0, abs(reference)):
+        raise AssertionError("expense risk {} differs from the reference {}".format(vectorized, reference))
+    return {"statements": 0, "transactions": len(transactions), "expense_risk": round(vectorized, 4),
+            "reference_seconds": round(reference_seconds, 4), "vectorized_seconds": round(vectorized_seconds, 4)}
+
+
+RUNNERS = {"read": run_read, "insert": run_insert, "full": run_full, "risk": run_risk}
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return max(usage, children) / scale
+
+
+def run_case(case: dict, queue):
+    try:
+        from app.database.index import get_db
+        from app.models.session import StatementLayout
+        from benchmarks.stub_llm import StubChatModel, StubEmbeddings
+
+        counters = install_stubs(case["page_cache"], case["llm_latency"])
+        db = next(get_db())
+        layout_ids = {layout.id for layout in db.query(StatementLayout.id)}
+        counters["db_round_trips"] = 0
+        StubChatModel.calls.clear()
+        StubEmbeddings.calls.clear()
+
+        start = time.perf_counter()
+        metrics = asyncio.run(RUNNERS[case["target"]](db, case))
+        elapsed = time.perf_counter() - start
+
+        metrics.update({
+            "seconds": round(elapsed, 3),
+            "pages_per_second": round(case["pages"] / elapsed, 2) if case["pages"] else None,
+            "llm_calls": sum(StubChatModel.calls.values()),
+            "llm_calls_by_kind": dict(StubChatModel.calls),
+            "llm_calls_per_statement": round(sum(StubChatModel.calls.values()) / max(1, metrics["statements"]), 2),
+            "embedding_calls": StubEmbeddings.calls["embeddings"],
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "db_round_trips": counters["db_round_trips"],
+        })
+        if not case["keep"] and case.get("session") is not None:
+            cleanup(db, case["session"], layout_ids)
+        db.close()
+        queue.put(metrics)
+    except Exception as e:
+        traceback.print_exc()
+        queue.put({"error": str(e)})
+
+
+def build_cases(args) -> list[dict]:
+    from benchmarks.synthetic_statements import generate_statement
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="statement-bench-")
+    os.makedirs(output_dir, exist_ok=True)
+    common = {"target": args.target, "page_cache": args.page_cache, "llm_latency": args.llm_latency,
+              "keep": args.keep}
+    if args.target in ("insert", "risk"):
+        return [dict(common, name="{} {} transactions".format(args.target, n), transactions=n, files=[], pages=0)
+                for n in args.transactions]
+
+    cases = []
+    for layout in args.layouts:
+        for pages in args.pages:
+            for encrypted in ([False, True] if args.encrypted else [False]):
+                files = []
+                for index in range(args.files):
+                    path = os.path.join(output_dir, "{}-{}p-{}-{}.pdf".format(
+                        layout, pages, args.encryption if encrypted else "open", index))
+                    if not os.path.exists(path):
+                        generate_statement(path, layout, pages, password=args.password if encrypted else None,
+                                           encryption=args.encryption, account_number=str(1023456789 + index),
+                                           seed=index)
+                    files.append(path)
+                name = "{} {} {}p x{}".format(args.target, layout, pages, args.files)
+                cases.append(dict(common, name=name + (" locked" if encrypted else ""), files=files,
+                                  pages=pages * args.files))
+    return cases
+
+
+def print_report(results: list[tuple[str, dict]]):
+    columns = ["seconds", "pages_per_second", "statements", "transactions", "llm_calls", "llm_calls_per_statement",
+               "peak_rss_mb", "db_round_trips"]
+    if any("reference_seconds" in metrics for _, metrics in results):
+        columns = ["transactions", "expense_risk", "reference_seconds", "vectorized_seconds", "peak_rss_mb"]
+    print("\n{:<36}".format("case") + "".join("{:>16}".format(c.replace("_per_", "/")[:15]) for c in columns))
+    for name, metrics in results:
+        if "error" in metrics:
+            print("{:<36}  failed: {}".format(name, metrics["error"]))
+            continue
+        print("{:<36}".format(name) + "".join("{:>16}".format(str(metrics.get(c, ""))) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline statement ingestion benchmarks")
+    parser.add_argument("--target", choices=sorted(RUNNERS), default="read")
+    parser.add_argument("--layouts", type=lambda v: v.split(","), default=["split", "signed", "unlabeled", "text"])
+    parser.add_argument("--pages", type=lambda v: [int(p) for p in v.split(",")], default=[1, 10, 100])
+    parser.add_argument("--files", type=int, default=1, help="statements per session")
+    parser.add_argument("--transactions", type=lambda v: [int(p) for p in v.split(",")], default=[1000, 10000])
+    parser.add_argument("--encrypted", action="store_true", help="also run every case on password protected files")
+    # Dates of birth are tried backwards from 16 years ago in four formats each, so this one is about 21 thousand
+    # candidates in (a year later it is 1,460 further). Pins come after every date
+    parser.add_argument("--password", default="14021995")
+    parser.add_argument("--encryption", choices=["rc4", "aes128", "aes256"], default="aes128",
+                        help="aes256 (R6) costs roughly ten times more per password tried")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stub LLM waits per call")
+    parser.add_argument("--page-cache", action="store_true", help="use the Redis page and category caches")
+    parser.add_argument("--keep", action="store_true", help="keep the rows created by each case")
+    parser.add_argument("--output-dir", help="where the synthetic statements are written")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in build_cases(args):
+        print("Running {}".format(case["name"]))
+        queue = context.Queue()
+        process = context.Process(target=run_case, args=(case, queue))
+        process.start()
+        metrics = queue.get()
+        process.join()
+        results.append((case["name"], metrics))
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump([dict(metrics, case=name) for name, metrics in results], fp, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+from typing import Any, ClassVar, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+STATEMENT_ROW_PATTERN = re.compile(r'(\d{2}-[A-Za-z]{3}-\d{4}) (.+?) (-?[\d,]+\.\d{2}) (-?[\d,]+\.\d{2})')
+CREDIT_PATTERN = re.compile(r'\b(FROM|SALARY|REVERSAL|INTEREST)\b')
+SCHEMA_PATTERN = re.compile(r'```\s*(\{.*?\})\s*```', re.DOTALL)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Drop-in replacement for the gateway chat models that answers from the prompt itself, so the pipeline can run
+    offline. Statement pages are parsed back out of the synthetic statement text, structured outputs are filled
+    from the JSON schema in the format instructions and category prompts get a stable category id.
+    Every call is counted in StubChatModel.calls by the kind of answer it produced.
+    """
+
+    model_name: str = "stub"
+    model: Optional[str] = None
+    temperature: float = 0
+    max_tokens: Optional[int] = None
+
+    latency: ClassVar[float] = 0.0
+    calls: ClassVar[Counter] = Counter()
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if StubChatModel.latency:
+            time.sleep(StubChatModel.latency)
+        return self.respond(messages)
+
+    async def _agenerate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if StubChatModel.latency:
+            await asyncio.sleep(StubChatModel.latency)
+        return self.respond(messages)
+
+    def respond(self, messages: list[BaseMessage]) -> ChatResult:
+        text = "\n".join(str(message.content) for message in messages)
+        kind, content = StubChatModel.answer(text)
+        StubChatModel.calls[kind] += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    @staticmethod
+    def answer(text: str) -> tuple[str, str]:
+        if "category ID" in text:
+            ids = re.findall(r'^\s*\[(\d+)\]', text, re.MULTILINE)
+            rows = re.findall(r'^\s*(\d+)\. (.*) \| \w+\s*$', text, re.MULTILINE)
+            if rows:
+                return "category_batch", json.dumps([
+                    {"row": int(row), "category_id": int(StubChatModel.category(ids, narration) or 0)}
+                    for row, narration in rows])
+            narration = re.search(r'narration: "(.*?)"', text)
+            return "category", StubChatModel.category(ids, narration.group(1) if narration else "") or "0"
+
+        schema_match = SCHEMA_PATTERN.search(text)
+        if schema_match is None:
+            # Prompts that describe the JSON array they expect in prose instead of format instructions
+            keys = re.search(r'object with keys: ([\w, ]+)', text)
+            if "JSON array" in text and keys:
+                return "structured", json.dumps([{key.strip(): "Stub {}".format(key.strip())
+                                                  for key in keys.group(1).split(",")}])
+            fields = re.findall(r'"(\w+)":\s*(\[)?\s*"string"', text)
+            if fields:
+                return "structured", json.dumps({name: ["Stub {}".format(name)] if is_list else "Stub {}".format(name)
+                                                 for name, is_list in fields})
+            return "text", "{}"
+        # The format instructions drop the schema title, recognise the models we need real answers for by fields
+        schema = json.loads(schema_match.group(1))
+        fields = set(schema.get("properties", {}))
+        if {"accountNumber", "transactions"} <= fields:
+            return "statement", json.dumps(StubChatModel.statement(text))
+        if fields == {"id", "code"}:
+            currency = re.search(r'Currency name: (\w+)', text)
+            return "currency", json.dumps({"id": 0, "code": currency.group(1) if currency else "NGN"})
+        if any(set(definition.get("properties", {})) == {"row", "name", "is_self"}
+               for definition in schema.get("$defs", {}).values()):
+            rows = re.findall(r'^\s*(\d+)\. (.*)$', text.split("numbered transaction narration", 1)[-1], re.MULTILINE)
+            return "beneficiary_batch", json.dumps([
+                {"row": int(row), "name": StubChatModel.beneficiary(narration), "is_self": False}
+                for row, narration in rows])
+        if fields == {"name", "is_self"}:
+            description = re.search(r'narration/description:\s*(.+)', text)
+            return "beneficiary", json.dumps({"name": StubChatModel.beneficiary(description.group(1) if description
+                                                                                 else ""), "is_self": False})
+        # Root models come through without a type, a list one only has "items"
+        schema.setdefault("type", "array" if "items" in schema else "object")
+        return "structured", json.dumps(StubChatModel.fake(schema, schema.get("$defs", {})))
+
+    @staticmethod
+    def beneficiary(narration: str) -> str:
+        return re.sub(r'^.*\b(TO|FROM)\b\s*', '', narration.strip()) or "UNKNOWN"
+
+    @staticmethod
+    def category(ids: list[str], narration: str) -> Optional[str]:
+        if not ids:
+            return None
+        return ids[hashlib.md5(narration.encode("utf-8")).digest()[0] % len(ids)]
+
+    @staticmethod
+    def statement(text: str) -> dict:
+        statement_text = text.split("Here is some text from a bank statement:")[-1]
+        transactions = []
+        for date, narration, amount, balance in STATEMENT_ROW_PATTERN.findall(statement_text):
+            value = float(amount.replace(",", ""))
+            is_credit = value > 0 and CREDIT_PATTERN.search(narration) is not None
+            transactions.append({
+                "transactionDate": "{} 00:00:00".format(time.strftime("%Y-%m-%d", time.strptime(date, "%d-%b-%Y"))),
+                "transactionId": None,
+                "description": narration,
+                "transactionType": "Credit" if is_credit else "Debit",
+                "amount": abs(value),
+                "balance": float(balance.replace(",", "")),
+            })
+        account_number = re.search(r'Account Number: (\d+)', statement_text)
+        account_name = re.search(r'Account Name: (.+?) Account Number', statement_text)
+        currency = re.search(r'Currency: ([A-Z]{3})', statement_text)
+        balance = re.search(r'Closing Balance: ([\d,]+\.\d{2})', statement_text)
+        return {
+            "accountName": account_name.group(1) if account_name else None,
+            "accountNumber": account_number.group(1) if account_number else None,
+            "accountBalance": float(balance.group(1).replace(",", "")) if balance else None,
+            "accountCurrency": currency.group(1) if currency else None,
+            "bank": "Synthetic Bank" if account_number else None,
+            "transactions": transactions,
+        }
+
+    @staticmethod
+    def fake(schema: dict, definitions: dict) -> Any:
+        if "$ref" in schema:
+            return StubChatModel.fake(definitions[schema["$ref"].split("/")[-1]], definitions)
+        if "anyOf" in schema:
+            options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+            return StubChatModel.fake(options[0], definitions) if options else None
+        if "enum" in schema:
+            return schema["enum"][0]
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {name: StubChatModel.fake(value, definitions)
+                    for name, value in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [StubChatModel.fake(schema.get("items", {}), definitions) for _ in range(3)]
+        if schema_type == "integer":
+            return 1
+        if schema_type == "number":
+            return 1.0
+        if schema_type == "boolean":
+            return False
+        return "Stub {}".format(schema.get("title", "value"))
+
+
+class StubEmbeddings:
+    """
+    Offline stand-in for the gateway embeddings: hashed character trigrams, normalised, so similar narrations get
+    close vectors. Every call is counted in StubEmbeddings.calls.
+    """
+
+    dimensions = 1536
+    calls: ClassVar[Counter] = Counter()
+
+    def __init__(self, model: Optional[str] = None, **kwargs):
+        self.model = model
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        padded = f"  {text.upper()} "
+        for i in range(len(padded) - 2):
+            index = int.from_bytes(hashlib.md5(padded[i:i + 3].encode()).digest()[:4], "little") % self.dimensions
+            vector[index] += 1
+        norm = sum(v * v for v in vector) ** 0.5 or 1
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        StubEmbeddings.calls["embeddings"] += 1
+        return [self.embed_query(text) for text in texts]
@@ -0,0 +1,116 @@
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import fitz
+
+# Column headers and x offsets (in points) of every layout. "split" and "signed" use headers the table
+# parser knows, "unlabeled" needs the LLM or a learned layout and "text" has no ruled table at all.
+LAYOUTS = {
+    "split": [("Date", 36), ("Narration", 110), ("Debit", 330), ("Credit", 405), ("Balance", 480)],
+    "signed": [("Trans Date", 36), ("Description", 110), ("Amount", 380), ("Balance", 480)],
+    "unlabeled": [("Txn Dt", 36), ("Remarks", 110), ("Out", 330), ("In", 405), ("Bal", 480)],
+    "text": [("Date", 36), ("Narration", 110), ("Debit", 330), ("Credit", 405), ("Balance", 480)],
+}
+
+DEBIT_NARRATIONS = ["POS PURCHASE SHOPRITE IKEJA", "NIP TRF TO CHINEDU OKAFOR", "AIRTIME MTN 08031234567",
+                    "IKEDC PREPAID TOKEN", "DSTV SUBSCRIPTION", "UBER TRIP LAGOS", "ATM WDL GTB LEKKI",
+                    "TRF TO ADAEZE NWOSU FOR RENT", "SMS ALERT CHARGES", "BET9JA WALLET FUNDING"]
+CREDIT_NARRATIONS = ["SALARY FROM ACME LIMITED", "NIP TRF FROM TUNDE BAKARE", "REVERSAL POS PURCHASE",
+                     "INTEREST CREDIT", "TRF FROM ZENITH MOBILE"]
+
+ENCRYPTIONS = {"rc4": fitz.PDF_ENCRYPT_RC4_128, "aes128": fitz.PDF_ENCRYPT_AES_128, "aes256": fitz.PDF_ENCRYPT_AES_256}
+
+ROWS_PER_PAGE = 32
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+ROW_HEIGHT = 20
+TABLE_TOP = 150
+
+
+@dataclass
+class SyntheticStatement:
+    path: str
+    layout: str
+    pages: int
+    transactions: int
+    account_number: str
+    password: Optional[str]
+
+
+def generate_rows(count: int, seed: int) -> list[tuple[datetime, str, float, str, float]]:
+    rng = random.Random(seed)
+    day = datetime(2024, 1, 1)
+    balance = 250000.0
+    rows = []
+    for _ in range(count):
+        day += timedelta(hours=rng.randint(2, 30))
+        if rng.random() < 0.2:
+            narration, transaction_type = rng.choice(CREDIT_NARRATIONS), "Credit"
+            amount = round(rng.uniform(5000, 400000), 2)
+            balance += amount
+        else:
+            narration, transaction_type = rng.choice(DEBIT_NARRATIONS), "Debit"
+            amount = round(rng.uniform(100, 60000), 2)
+            balance -= amount
+        rows.append((day, narration, amount, transaction_type, round(balance, 2)))
+    return rows
+
+
+def draw_row(page: fitz.Page, y: float, cells: list[str], layout: str):
+    columns = LAYOUTS[layout]
+    for (_, x), cell in zip(columns, cells):
+        if cell:
+            page.insert_text((x + 2, y + 14), cell, fontsize=8)
+    if layout == "text":
+        return
+    page.draw_line((columns[0][1], y), (PAGE_WIDTH - 36, y))
+    page.draw_line((columns[0][1], y + ROW_HEIGHT), (PAGE_WIDTH - 36, y + ROW_HEIGHT))
+    for _, x in columns + [("", PAGE_WIDTH - 36)]:
+        page.draw_line((x, y), (x, y + ROW_HEIGHT))
+
+
+def row_cells(row: tuple[datetime, str, float, str, float], layout: str) -> list[str]:
+    day, narration, amount, transaction_type, balance = row
+    date = day.strftime("%d-%b-%Y")
+    if layout == "signed":
+        signed = -amount if transaction_type == "Debit" else amount
+        return [date, narration, "{:,.2f}".format(signed), "{:,.2f}".format(balance)]
+    debit = "{:,.2f}".format(amount) if transaction_type == "Debit" else ""
+    credit = "{:,.2f}".format(amount) if transaction_type == "Credit" else ""
+    return [date, narration, debit, credit, "{:,.2f}".format(balance)]
+
+
+def generate_statement(path: str, layout: str = "split", pages: int = 1, password: Optional[str] = None,
+                       encryption: str = "aes128", account_number: str = "0123456789",
+                       account_name: str = "ADA LOVELACE", seed: int = 7) -> SyntheticStatement:
+    """
+    Write a machine generated looking bank statement with the given layout and page count.
+    The same seed always produces the same transactions, so runs can be compared.
+    """
+    rows = generate_rows(pages * ROWS_PER_PAGE, seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        y = 50
+        if page_number == 0:
+            page.insert_text((36, y), "SYNTHETIC BANK PLC - STATEMENT OF ACCOUNT", fontsize=12)
+            page.insert_text((36, y + 20), "Account Name: {}".format(account_name), fontsize=9)
+            page.insert_text((36, y + 34), "Account Number: {}".format(account_number), fontsize=9)
+            page.insert_text((36, y + 48), "Currency: NGN", fontsize=9)
+            page.insert_text((36, y + 62), "Closing Balance: {:,.2f}".format(rows[-1][4]), fontsize=9)
+        y = TABLE_TOP
+        draw_row(page, y, [name for name, _ in LAYOUTS[layout]], layout)
+        page_rows = rows[page_number * ROWS_PER_PAGE:(page_number + 1) * ROWS_PER_PAGE]
+        for row in page_rows:
+            y += ROW_HEIGHT
+            draw_row(page, y, row_cells(row, layout), layout)
+        page.insert_text((36, PAGE_HEIGHT - 30), "Page {} of {}".format(page_number + 1, pages), fontsize=7)
+
+    if password:
+        doc.save(path, encryption=ENCRYPTIONS[encryption], user_pw=password, owner_pw=password + "-owner")
+    else:
+        doc.save(path)
+    doc.close()
+    return SyntheticStatement(path=path, layout=layout, pages=pages, transactions=len(rows),
+                              account_number=account_number, password=password)
@@ -0,0 +1,6 @@
+import os
+
+# The database engine and the services read these at import and construction
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SAVINGS_CATEGORY_ID", "3")
+os.environ.setdefault("CHAT_GPT_KEY", "test")
@@ -0,0 +1,56 @@
+import pytest
+
+from app.util.counterparty import GRAMMARS, parse_counterparty
+
+# (narration, transaction type, expected name, grammar that should match)
+MATCHES = [
+    ("TRF FROM JOHN DOE TO JANE SMITH", "debit", "JANE SMITH", "from_to"),
+    ("FRM JOHN DOE TO JANE SMITH", "credit", "JOHN DOE", "from_to"),
+    ("NIP/ZENITH/JANE SMITH/000123", "debit", "JANE SMITH", "nip_slashed"),
+    ("FIP:JOHN DOE/ TRF TO JANE SMITH", "debit", "JANE SMITH", "first_bank"),
+    ("FBN MOBILE: JOHN DOE/ TO JANE SMITH", "credit", "JOHN DOE", "first_bank"),
+    ("MOB TRF 0123 TO JANE SMITH", "debit", "JANE SMITH", "channel_to"),
+    ("NIP TRF TO 0123456789 JANE SMITH", "debit", "JANE SMITH", "channel_to"),
+    ("NIP TRF FROM TUNDE BAKARE", "credit", "TUNDE BAKARE", "channel_from"),
+    ("TRF TO ADAEZE NWOSU FOR RENT", "debit", "ADAEZE NWOSU", "transfer_to"),
+    ("TRANSFER TO ACCESS BANK JANE DOE", "debit", "JANE DOE", "transfer_to"),
+    ("TRANSFER TO GTB 0123456789 JANE DOE", "debit", "JANE DOE", "transfer_to"),
+    ("RECEIVED FROM JANE SMITH", "credit", "JANE SMITH", "transfer_from"),
+    ("OPAY/JANE SMITH/123", "debit", "JANE SMITH", "wallet"),
+    ("PALMPAY-JANE SMITH-REF", "debit", "JANE SMITH", "wallet"),
+]
+
+# (narration, grammar it must not match), each one close to what the grammar accepts
+NON_MATCHES = [
+    ("TRF FROM JOHN DOE", "from_to"),
+    ("NIP/ZENITH/000123/REF", "nip_slashed"),
+    ("FIP:JOHN DOE", "first_bank"),
+    ("USSD TRF TO 0123456789", "channel_to"),
+    ("MOB TRF FROM ZENITH BANK", "channel_from"),
+    ("TRANSFER TO OPAY", "transfer_to"),
+    ("TRANSFER FROM ZENITH BANK", "transfer_from"),
+    ("OPAY/0123/REF", "wallet"),
+]
+
+
+def test_every_grammar_is_covered():
+    names = {grammar.name for grammar in GRAMMARS}
+    assert {grammar for *_, grammar in MATCHES} == names
+    assert {grammar for _, grammar in NON_MATCHES} == names
+
+
+@pytest.mark.parametrize("narration, transaction_type, name, grammar", MATCHES)
+def test_parses_counterparty(narration, transaction_type, name, grammar):
+    assert parse_counterparty(narration, transaction_type) == (name, grammar)
+
+
+@pytest.mark.parametrize("narration, grammar", NON_MATCHES)
+def test_does_not_match(narration, grammar):
+    for transaction_type in ("debit", "credit"):
+        parsed = parse_counterparty(narration, transaction_type)
+        assert parsed is None or parsed[1] != grammar
+
+
+@pytest.mark.parametrize("narration", ["POS PURCHASE SHOPRITE IKEJA", "ATM WDL GTB LEKI", "SMS ALERT CHARGES", "", None])
+def test_non_transfers_have_no_counterparty(narration):
+    assert parse_counterparty(narration, "debit") is None
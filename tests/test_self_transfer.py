@@ -0,0 +1,26 @@
+import pytest
+
+from app.util.self_transfer import SelfTransferDetector
+
+# The session name and an account name
+OWNER_NAMES = ["Jane Smith", "JANE ADAEZE SMITH"]
+
+
+@pytest.mark.parametrize("narration, transaction_type", [
+    ("TRF TO SMITH JANE ADAEZE", "debit"),
+    ("NIP TRF FROM JANE A. SMITH", "credit"),
+    ("MOB TRF TO 0123456789 J A SMITH", "debit"),
+    ("INWARD TRANSFER JANE SMITH", "credit"),
+])
+def test_detects_transfers_to_the_owner(narration, transaction_type):
+    assert SelfTransferDetector(OWNER_NAMES).detect([(narration, transaction_type)]) == [True]
+
+
+@pytest.mark.parametrize("narration, transaction_type", [
+    ("POS PURCHASE JANE SMITH STORES", "debit"),
+    ("WEB PAYMENT JANE SMITH BOUTIQUE", "debit"),
+    ("TRF TO ADAEZE NWOSU FOR RENT", "debit"),
+    ("NIP TRF FROM TUNDE BAKARE", "credit"),
+])
+def test_leaves_other_counterparties(narration, transaction_type):
+    assert SelfTransferDetector(OWNER_NAMES).detect([(narration, transaction_type)]) == [False]
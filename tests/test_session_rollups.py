@@ -0,0 +1,96 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database.index import Base
+from app.models.account import Category
+from app.models.session import Session, SessionAccount, SessionRollup, SessionSummary, SessionTransaction
+from app.services.session_transaction_service import SessionTransactionService
+
+SUMMARY_CREATED_AT = datetime(2025, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Category.__table__, Session.__table__, SessionAccount.__table__,
+                                             SessionTransaction.__table__, SessionRollup.__table__,
+                                             SessionSummary.__table__])
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+
+
+def add_session(db, processing_status: str) -> Session:
+    session = Session(name="Jane Smith", identifier="session-1", email="jane@example.com",
+                      processing_status=processing_status)
+    db.add_all([session, Category(id=1, name="Salary"), Category(id=2, name="Food"), Category(id=3, name="Rent")])
+    db.flush()
+    account = SessionAccount(account_name="Jane Smith", account_number="0123456789", session_id=session.id,
+                             created_at=SUMMARY_CREATED_AT - timedelta(minutes=5))
+    db.add(account)
+    db.flush()
+    db.add_all([
+        SessionTransaction(account_id=account.id, category_id=1, amount=5000.0, transaction_type="credit",
+                           description="SALARY", date=datetime(2025, 2, 1)),
+        SessionTransaction(account_id=account.id, category_id=2, amount=300.0, transaction_type="debit",
+                           description="POS CHICKEN REPUBLIC", date=datetime(2025, 2, 3)),
+        SessionTransaction(account_id=account.id, category_id=3, amount=1500.0, transaction_type="debit",
+                           description="TRF TO LANDLORD", date=datetime(2025, 2, 5)),
+        SessionRollup(session_id=session.id, period="month", period_start=date(2025, 2, 1), category_id=1,
+                      direction="credit", total_amount=5000.0, transaction_count=1),
+        SessionRollup(session_id=session.id, period="month", period_start=date(2025, 2, 1), category_id=2,
+                      direction="debit", total_amount=300.0, transaction_count=1),
+        SessionRollup(session_id=session.id, period="month", period_start=date(2025, 2, 1), category_id=3,
+                      direction="debit", total_amount=1500.0, transaction_count=1),
+        SessionSummary(session_id=session.id, transaction_count=3, inflow=5000.0, outflow=1800.0, savings=0.0,
+                       closing_balance=3200.0, spending_ratio=36.0, savings_ratio=0.0, budget_conscious=1.0,
+                       liquidity_risk=0.1, concentration_risk=0.8, expense_risk=0.2, volatility_risk=0.3,
+                       created_at=SUMMARY_CREATED_AT),
+    ])
+    db.commit()
+    return session
+
+
+@pytest.mark.parametrize("processing_status", ["done", "analyzing_insights", "processed_analysis"])
+def test_serves_the_financial_position_from_rollups_after_ingest(db, processing_status):
+    add_session(db, processing_status)
+    service = SessionTransactionService(db)
+    service.load_session_snapshot = lambda session_id: pytest.fail("read every transaction of the session")
+
+    position = service.calculate_financial_position("session-1")
+
+    assert position.income_flow.closing_balance == 3200.0
+    assert position.risk.concentration_risk == 0.8
+    assert [c.category_name for c in position.expense_categories] == ["Rent", "Food"]
+    assert [t.amount for t in position.transactions.transactions] == [5000.0, 300.0, 1500.0]
+
+
+def test_lists_only_the_latest_transactions(db):
+    add_session(db, "processed_analysis")
+    service = SessionTransactionService(db)
+    service.financial_position_transactions = 2
+
+    position = service.calculate_financial_position("session-1")
+
+    assert [t.amount for t in position.transactions.transactions] == [300.0, 1500.0]
+
+
+def test_ignores_rollups_older_than_an_account(db):
+    session = add_session(db, "processed_analysis")
+    db.add(SessionAccount(account_name="Jane Smith", account_number="9876543210", session_id=session.id,
+                          created_at=SUMMARY_CREATED_AT + timedelta(minutes=5)))
+    db.commit()
+
+    assert SessionTransactionService(db).get_session_summary("session-1") is None
+
+
+def test_orders_live_category_totals_like_the_rollups(db):
+    session = add_session(db, "processed_analysis")
+    service = SessionTransactionService(db)
+    account_ids = [account.id for account in session.session_accounts]
+
+    assert ([c.category_name for c in service.get_expenses_by_category(account_ids)] ==
+            [c.category_name for c in service.get_category_totals_from_rollups("session-1", "debit")])